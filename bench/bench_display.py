@@ -0,0 +1,188 @@
+# Benchmarks the clock's screen updates on the simulated I2C bus.
+#
+# Run: python3 bench/bench_display.py
+#
+# Simulates a day of minute updates and reports, per update, the I2C bytes
+# and transactions sent, the wall time spent rendering and the heap the
+# render needed on top of what was already allocated. The paths measured
+# are the in-place ClockFace clock_task uses, a full redraw of the
+# framebuffer as the clock did before ClockFace, a plain clear() + putstr(),
+# and the big-digit clock, which uploads its custom characters once. The
+# fan-out runs draw the clock face once per update for several panels
+# through displays.DisplayManager, one of them with a panel that doesn't
+# answer.
+#
+# The heap figure is tracemalloc's peak on CPython, which boxes every int
+# above 256, so even the in-place path shows a few dozen bytes here. On the
+# board small ints are not allocated; there the clock_tick_alloc_bytes
+# histogram on /metrics measures each pass of the clock loop.
+
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sim  # noqa: E402
+
+sim.install()
+
+from globals import STATE  # noqa: E402
+from machine import I2C, Pin  # noqa: E402
+from machine_i2c_lcd import I2cLcd  # noqa: E402
+from lcd_framebuffer import LcdFramebuffer  # noqa: E402
+from lcd_glyphs import GlyphCache  # noqa: E402
+from lcd_bigdigits import BigDigits, UPPER  # noqa: E402
+from displays import Display, DisplayManager  # noqa: E402
+from clock import (  # noqa: E402
+    ClockFace,
+    draw_big_clock,
+    local_time,
+)
+
+START = 1767225600  # 2026-01-01 00:00 UTC
+UPDATES = 24 * 60
+ALLOC_UPDATES = 60
+ALARM_LINE = "Alarm: Mon 07:00"
+
+
+def _time_text(t):
+    # The first line of the clock: "HH:MM     DD-MM-YYYY".
+    t = time.gmtime(t)
+    return "{:02}:{:02}     {:02}-{:02}-{:04}".format(t[3], t[4], t[2], t[1], t[0])
+
+
+def _draw_face(fb, t):
+    fb.face.set_line(1, ALARM_LINE)
+    fb.face.draw(t)
+    fb.show()
+
+
+def _draw_framebuffer(fb, t):
+    # The whole screen, written again into the framebuffer each update.
+    fb.clear()
+    fb.putstr(_time_text(t))
+    fb.move_to(0, 1)
+    fb.putstr(ALARM_LINE)
+    fb.show()
+
+
+def _draw_plain(lcd, t):
+    lcd.clear()
+    lcd.putstr(_time_text(t))
+    lcd.move_to(0, 1)
+    lcd.putstr(ALARM_LINE)
+
+
+def _draw_big(fb, t):
+    minute_of_day = t // 60 % 1440
+    draw_big_clock(
+        fb, fb.big, minute_of_day // 60, minute_of_day % 60, True, False, False
+    )
+
+
+def _alloc_per_update(i2c, panel, target, draw, start):
+    # The simulated bus logs every transaction; bypass it so only the
+    # render's own allocations are counted.
+    i2c.writeto = lambda addr, buf, stop=True: panel.write(buf)
+    tracemalloc.start()
+    total = 0
+    for minute in range(ALLOC_UPDATES):
+        sim.CLOCK.set(start + minute * 60)
+        t = local_time()
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        draw(target, t)
+        total += tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    del i2c.writeto
+    return total / ALLOC_UPDATES
+
+
+def run(label, draw):
+    i2c = I2C(0, sda=Pin(21), scl=Pin(22), freq=400000)
+    lcd = I2cLcd(i2c, 0x27, 4, 20)
+    target = lcd
+    if draw is not _draw_plain:
+        target = LcdFramebuffer(lcd)
+        target.face = ClockFace(target)
+        target.big = BigDigits(target, GlyphCache(lcd))
+    panel = sim.panel(0x27)
+    i2c.reset_log()
+
+    render_us = 0
+    for minute in range(UPDATES):
+        sim.CLOCK.set(START + minute * 60)
+        t = local_time()
+        start = time.perf_counter()
+        draw(target, t)
+        render_us += (time.perf_counter() - start) * 1000000
+        if draw is _draw_big:
+            code = target.big.glyphs.code(UPPER)
+            if panel.cgram[code * 8 : code * 8 + 8] != UPPER:
+                raise AssertionError("glyph %d not in CGRAM" % code)
+        elif panel.line(0).decode() != _time_text(t):
+            raise AssertionError("panel shows %r" % panel.line(0))
+
+    if draw is _draw_big and target.big.glyphs.uploads != 4:
+        raise AssertionError("%d glyph uploads" % target.big.glyphs.uploads)
+    bytes_sent = i2c.bytes_sent
+    writes = len(i2c.transactions)
+    alloc = _alloc_per_update(i2c, panel, target, draw, START + UPDATES * 60)
+    print(
+        "%-12s %6.1f B/update %5.1f writeto/update %8.1f us/render"
+        " %6.1f B heap/render"
+        % (label, bytes_sent / UPDATES, writes / UPDATES, render_us / UPDATES, alloc)
+    )
+
+
+def run_fanout(label, count, dead=0):
+    i2c = I2C(0, sda=Pin(21), scl=Pin(22), freq=400000)
+    addrs = [0x20 + i for i in range(count + dead)]
+    for addr in addrs[:count]:
+        sim.attach_lcd(addr)
+    for addr in addrs[count:]:
+        sim.detach(addr)
+    manager = DisplayManager([Display(i2c, addr, 4, 20) for addr in addrs])
+    manager.face = ClockFace(manager)
+    i2c.reset_log()
+
+    render_us = 0
+    for minute in range(UPDATES):
+        sim.CLOCK.set(START + minute * 60)
+        t = local_time()
+        start = time.perf_counter()
+        _draw_face(manager, t)
+        render_us += (time.perf_counter() - start) * 1000000
+        for addr in addrs[:count]:
+            if sim.panel(addr).line(0).decode() != _time_text(t):
+                raise AssertionError("panel %#x shows %r" % (addr, sim.panel(addr)))
+
+    print(
+        "%-12s %6.1f B/update %5.1f writeto/update %8.1f us/render"
+        % (
+            label,
+            i2c.bytes_sent / UPDATES,
+            len(i2c.transactions) / UPDATES,
+            render_us / UPDATES,
+        )
+    )
+    for addr in addrs:
+        sim.detach(addr)
+
+
+def main():
+    STATE.set(settings={"summer": 2, "winter": 1})
+    print("%d minute updates on a 20x4 panel" % UPDATES)
+    run("clock face", _draw_face)
+    run("framebuffer", _draw_framebuffer)
+    run("clear+putstr", _draw_plain)
+    run("big digits", _draw_big)
+    run_fanout("fan-out x1", 1)
+    run_fanout("fan-out x3", 3)
+    run_fanout("x3 + 1 dead", 3, dead=1)
+
+
+if __name__ == "__main__":
+    main()
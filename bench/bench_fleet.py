@@ -0,0 +1,111 @@
+# Benchmarks tools/fleet.py against stand-in clocks.
+#
+# Run: python3 bench/bench_fleet.py [clocks]
+#
+# Starts the stand-in clocks of sim/standin.py (20 by default), provisions
+# them all with new offsets, alarms and alarm signal, and checks on each
+# clock's settings.json that the settings arrived. Then reads the status
+# of the fleet twice; the second round is answered with 304s. Prints the
+# totals line of the fleet report of each run.
+
+import asyncio
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "tools"))
+
+from sim import standin  # noqa: E402
+import fleet  # noqa: E402
+
+CLOCKS = 20
+PORT = 8100
+SETTINGS = {"summer": "3", "winter": "0", "dst_rule": "us"}
+ALARMS = [
+    fleet.parse_alarm("06:45/mo,tu,we,th,fr"),
+    fleet.parse_alarm("09:30/sa,su/off"),
+]
+SIGNAL = "gentle"
+SETTLE_S = 3  # the clocks write settings.json 2 s after the last change
+
+
+def _report(label, results, elapsed):
+    out = io.StringIO()
+    failed = fleet.report(results, elapsed, out)
+    lines = out.getvalue().splitlines()
+    for line in lines[:-1]:
+        if " ok " not in line:
+            print(line)
+    print("%-10s %s" % (label, lines[-1]))
+    return failed
+
+
+async def _provision(hosts):
+    async def job(conn):
+        problems = await fleet.provision(conn, SETTINGS, ALARMS, SIGNAL)
+        if problems:
+            raise fleet.FleetError("; ".join(problems))
+        return "verified"
+
+    clocks = fleet.Fleet(hosts)
+    start = time.perf_counter()
+    results = await clocks.run(job)
+    clocks.close()
+    return _report("provision", results, time.perf_counter() - start)
+
+
+async def _status(hosts):
+    async def job(conn):
+        values = await fleet.status(conn)
+        return "unchanged" if values is None else values["time"]
+
+    clocks = fleet.Fleet(hosts)
+    failed = 0
+    for label in ("status", "status"):
+        start = time.perf_counter()
+        results = await clocks.run(job)
+        failed += _report(label, results, time.perf_counter() - start)
+    clocks.close()
+    return failed
+
+
+def _check_files(directory, hosts):
+    # What each clock wrote to flash.
+    for host in hosts:
+        port = host.rsplit(":", 1)[1]
+        with open(os.path.join(directory, port, "settings.json")) as f:
+            settings = json.load(f)
+        if (
+            settings["summer"] != 3
+            or settings["winter"] != 0
+            or settings["alarm_signal"] != SIGNAL
+            or settings["password"] != "secret"
+            or len(settings["alarms"]) != len(ALARMS)
+        ):
+            raise AssertionError("%s saved %r" % (host, settings))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else CLOCKS
+    directory = tempfile.mkdtemp(prefix="bench-fleet-")
+    processes, hosts = standin.start(count, PORT, directory)
+    try:
+        failed = asyncio.run(_provision(hosts))
+        failed += asyncio.run(_status(hosts))
+        time.sleep(SETTLE_S)
+        _check_files(directory, hosts)
+    finally:
+        standin.stop(processes)
+        shutil.rmtree(directory)
+    if failed:
+        raise SystemExit("%d failures" % failed)
+
+
+if __name__ == "__main__":
+    main()
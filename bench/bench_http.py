@@ -0,0 +1,189 @@
+# Benchmarks the web server on the host, using the simulator.
+#
+# Run: python3 bench/bench_http.py [requests] [concurrency]
+#
+# Builds the files as upload.sh would, starts the real start_web_server on
+# a free local port, and reports requests/second, latency percentiles and
+# response size for the settings page, form saves, the JSON status (plain,
+# conditional, and conditional over a kept-alive connection) and the
+# stylesheet (plain and gzipped), with the given number of concurrent
+# clients.
+
+import asyncio
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sim  # noqa: E402
+
+sim.install()
+
+from globals import STATE  # noqa: E402
+import eventlog  # noqa: E402
+import webserver  # noqa: E402
+from tools.build_assets import build  # noqa: E402
+
+# Keep the per-request console logging out of the measurements.
+eventlog.ECHO = False
+
+FORM = b"ssid=Bench+Net&password=secret&summer=2&winter=1&dst_rule=eu"
+
+
+def _free_port():
+    s = socket.socket()
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+async def _request(port, data):
+    start = time.perf_counter()
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(data)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    if not response.startswith(b"HTTP/1.1 "):
+        raise AssertionError("bad response %r" % response[:40])
+    return time.perf_counter() - start, int(response[9:12]), len(response)
+
+
+async def _read_response(reader):
+    # One response from a kept-alive connection. Returns the response and
+    # whether the server closes the connection after it: it keeps its last
+    # free connection slot for new clients, so with MAX_CONNECTIONS
+    # clients one of them is answered with "Connection: close".
+    head = await reader.readuntil(b"\r\n\r\n")
+    length = 0
+    close = False
+    for line in head.split(b"\r\n"):
+        line = line.lower()
+        if line.startswith(b"content-length:"):
+            length = int(line[15:])
+        elif line.startswith(b"connection:"):
+            close = line[11:].strip() == b"close"
+    body = await reader.readexactly(length)
+    return head + body, close
+
+
+async def _load(label, port, data, requests, concurrency, keep_alive=False):
+    latencies = []
+    statuses = {}
+    sizes = [0]
+    remaining = [requests]
+
+    async def client():
+        connection = None
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            if keep_alive:
+                # Polls over one connection, like a home-automation client.
+                if connection is None:
+                    connection = await asyncio.open_connection("127.0.0.1", port)
+                start = time.perf_counter()
+                connection[1].write(data)
+                response, close = await _read_response(connection[0])
+                latency = time.perf_counter() - start
+                if close:
+                    connection[1].close()
+                    connection = None
+                status, size = int(response[9:12]), len(response)
+            else:
+                latency, status, size = await _request(port, data)
+            latencies.append(latency)
+            sizes[0] += size
+            statuses[status] = statuses.get(status, 0) + 1
+        if connection is not None:
+            connection[1].close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print(
+        "%-22s %7.0f req/s  p50 %5.2f ms  p95 %5.2f ms  %5d B/resp  %s"
+        % (
+            label,
+            requests / elapsed,
+            latencies[len(latencies) // 2] * 1000,
+            latencies[int(len(latencies) * 0.95)] * 1000,
+            sizes[0] // requests,
+            " ".join("%d:%d" % item for item in sorted(statuses.items())),
+        )
+    )
+
+
+async def main(requests, concurrency):
+    port = _free_port()
+    server = asyncio.create_task(webserver.start_web_server(port))
+    await asyncio.sleep(0.1)
+
+    close = b"Host: clock\r\nConnection: close\r\n"
+    get = b"GET / HTTP/1.1\r\n%s\r\n" % close
+    post = b"POST /save HTTP/1.1\r\n%sContent-Length: %d\r\n\r\n%s" % (
+        close,
+        len(FORM),
+        FORM,
+    )
+    status = b"GET /api/status HTTP/1.1\r\n%s\r\n" % close
+    print("%d requests per route, %d concurrent clients" % (requests, concurrency))
+    await _load("GET /", port, get, requests, concurrency)
+    await _load("POST /save", port, post, requests, concurrency)
+    await _load("GET /api/status", port, status, requests, concurrency)
+    css = b"GET /style.css HTTP/1.1\r\n%s" % close
+    await _load("GET /style.css", port, css + b"\r\n", requests, concurrency)
+    await _load(
+        "  gzip",
+        port,
+        css + b"Accept-Encoding: gzip, deflate\r\n\r\n",
+        requests,
+        concurrency,
+    )
+
+    # Conditional polls, as a client that keeps the last ETag sends them.
+    poll = b"GET /api/status HTTP/1.1\r\nIf-None-Match: %s\r\n" % (
+        webserver.status_values()[0].encode()
+    )
+    await _load(
+        "GET /api/status 304", port, poll + close + b"\r\n", requests, concurrency
+    )
+    await _load(
+        "  kept alive", port, poll + b"\r\n", requests, concurrency, keep_alive=True
+    )
+    server.cancel()
+
+
+def run():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+
+    # The server reads its files and writes settings.json in its working
+    # directory, which holds what upload.sh would put on the device.
+    workdir = tempfile.mkdtemp()
+    build(sim.SRC, workdir)
+    os.chdir(workdir)
+    STATE.set(
+        ip="127.0.0.1",
+        settings={
+            "ssid": "Bench Net",
+            "password": "secret",
+            "summer": 2,
+            "winter": 1,
+            "alarms": [{"time": [7, 0], "days": 0b1111111, "enabled": True}],
+        },
+    )
+    try:
+        asyncio.run(main(requests, concurrency))
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,95 @@
+# Benchmarks form.url_decode against the previous str-concatenating decoder.
+#
+# Run with CPython (python3 bench/bench_url_decode.py) or the MicroPython
+# unix port (micropython bench/bench_url_decode.py). Under MicroPython the
+# heap bytes allocated per call are measured with the GC disabled; under
+# CPython tracemalloc reports the peak memory per call.
+
+import sys
+import time
+
+# src/ next to this file's directory; MicroPython has no os.path.
+_BENCH_DIR = __file__.rsplit("/", 1)[0] if "/" in __file__ else "."
+sys.path.insert(0, _BENCH_DIR + "/../src")
+
+from form import url_decode  # noqa: E402
+
+try:
+    import gc
+
+    _mem_alloc = gc.mem_alloc  # MicroPython only
+except AttributeError:
+    _mem_alloc = None
+
+
+def legacy_url_decode(s):
+    # The decoder webserver.py used before, kept here for comparison.
+    s = s.replace("+", " ")
+    res = ""
+    i = 0
+    while i < len(s):
+        ch = s[i]
+        if ch == "%" and i + 2 < len(s):
+            try:
+                hexv = s[i + 1 : i + 3]
+                res += chr(int(hexv, 16))
+                i += 3
+                continue
+            except Exception:
+                pass
+        res += ch
+        i += 1
+    return res
+
+
+def _ticks_us():
+    if hasattr(time, "ticks_us"):
+        return time.ticks_us()
+    return int(time.perf_counter() * 1000000)
+
+
+def _measure(fn, arg, rounds):
+    start = _ticks_us()
+    for _ in range(rounds):
+        fn(arg)
+    elapsed = (_ticks_us() - start) / rounds
+
+    if _mem_alloc is not None:
+        gc.collect()
+        gc.disable()
+        before = _mem_alloc()
+        fn(arg)
+        allocated = _mem_alloc() - before
+        gc.enable()
+        return elapsed, "%d B allocated" % allocated
+
+    import tracemalloc
+
+    tracemalloc.start()
+    fn(arg)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, "%d B peak" % peak
+
+
+def main():
+    payloads = [
+        ("ascii 32", "My+Home+Network+%231+%40+floor+2", "My Home Network #1 @ floor 2"),
+        ("ascii 400", "p%40ss+word%21" * 28 + "x" * 8, "p@ss word!" * 28 + "x" * 8),
+        ("utf-8 120", "Caf%C3%A9+%E2%98%95+" * 6, "Caf\u00e9 \u2615 " * 6),
+    ]
+    print("%-10s %-8s %10s  %-8s %s" % ("payload", "decoder", "us/call", "correct", "memory"))
+    for name, text, expected in payloads:
+        data = text.encode()
+        rounds = 200
+        for label, fn, arg in (
+            ("legacy", legacy_url_decode, text),
+            ("bytes", url_decode, data),
+        ):
+            elapsed, memory = _measure(fn, arg, rounds)
+            correct = fn(arg) == expected
+            print("%-10s %-8s %10.1f  %-8s %s" % (name, label, elapsed, correct, memory))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+# Host-side simulator for the ESP32 clock firmware.
+#
+# install() puts fake `machine`, `network` and `ntptime` modules in
+# sys.modules, along with a `time` module of the firmware's own that keeps
+# wall-clock time from CLOCK, adds the MicroPython-only functions the
+# firmware uses to `gc` and `asyncio`, and puts src/ and src/lib/ on
+# sys.path, so the firmware modules can be imported and run unchanged on
+# CPython:
+#
+#     import sim
+#     sim.install()
+#     import clock, webserver
+#
+# The fakes record what the firmware does (every I2C byte with a timestamp,
+# Wi-Fi connects, NTP queries) and let the caller control the environment
+# (wall clock, link state, NTP answers, which I2C devices exist).
+
+import asyncio
+import gc
+import os
+import sys
+import time
+import tracemalloc
+import types
+
+from sim import machine, network, ntptime
+from sim.hd44780 import Hd44780
+from sim.simclock import SimClock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "src")
+
+CLOCK = SimClock()
+
+# Heap size reported by gc.mem_free() + gc.mem_alloc(), about that of an
+# ESP32 without PSRAM.
+HEAP_SIZE = 111 * 1024
+
+_installed = False
+
+
+def _ticks_add(ticks, delta):
+    return ticks + delta
+
+
+def _ticks_diff(a, b):
+    return a - b
+
+
+def _mem_alloc():
+    # What the host allocated since tracemalloc.start(), if it was started.
+    if tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[0]
+    return 0
+
+
+class _ThreadSafeFlag:
+    # MicroPython's asyncio.ThreadSafeFlag, which IRQ handlers use to wake
+    # a task. Simulated IRQs run on the event loop's thread, so an Event
+    # that clears itself when waited on does the job.
+
+    def __init__(self):
+        self._event = asyncio.Event()
+
+    def set(self):
+        self._event.set()
+
+    def clear(self):
+        self._event.clear()
+
+    async def wait(self):
+        await self._event.wait()
+        self._event.clear()
+
+
+async def _readinto(self, buf):
+    # MicroPython streams have readinto; CPython's StreamReader doesn't.
+    data = await self.read(len(buf))
+    buf[: len(data)] = data
+    return len(data)
+
+
+def _firmware_time():
+    # The `time` the firmware imports: the host's, with the wall clock from
+    # CLOCK and MicroPython's ticks and sleeps on the host's monotonic
+    # clock. It's a copy, so the real module, which asyncio, the sim and
+    # the benchmarks time themselves with, keeps the host's clock.
+    fw_time = types.ModuleType("time")
+    fw_time.__dict__.update(
+        (name, value) for name, value in vars(time).items() if not name.startswith("__")
+    )
+    fw_time.time = CLOCK.time
+    fw_time.time_ns = CLOCK.time_ns
+    fw_time.sleep_ms = lambda ms: time.sleep(ms / 1000)
+    fw_time.sleep_us = lambda us: time.sleep(us / 1000000)
+    fw_time.ticks_ms = lambda: int(time.monotonic() * 1000)
+    fw_time.ticks_us = lambda: int(time.monotonic() * 1000000)
+    fw_time.ticks_cpu = fw_time.ticks_us
+    fw_time.ticks_add = _ticks_add
+    fw_time.ticks_diff = _ticks_diff
+    return fw_time
+
+
+def install():
+    """Installs the fakes. Safe to call more than once."""
+    global _installed
+    if _installed:
+        return
+    _installed = True
+
+    for path in (os.path.join(SRC, "lib"), SRC):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+    sys.modules["machine"] = machine
+    sys.modules["network"] = network
+    sys.modules["ntptime"] = ntptime
+
+    sys.modules["time"] = _firmware_time()
+
+    gc.mem_alloc = _mem_alloc
+    gc.mem_free = lambda: max(HEAP_SIZE - _mem_alloc(), 0)
+
+    asyncio.sleep_ms = lambda ms: asyncio.sleep(ms / 1000)
+    asyncio.wait_for_ms = lambda aw, ms: asyncio.wait_for(aw, ms / 1000)
+    asyncio.StreamReader.readinto = _readinto
+    asyncio.ThreadSafeFlag = _ThreadSafeFlag
+
+    # The default display of the firmware.
+    attach_lcd(0x27)
+
+
+def attach_lcd(addr, bus=0, num_lines=4, num_columns=20):
+    """Connects a simulated HD44780 panel at addr and returns it."""
+    panel = Hd44780(num_lines, num_columns)
+    machine.DEVICES[(bus, addr)] = panel
+    return panel
+
+
+def detach(addr, bus=0):
+    """Removes the device at addr, so writes to it fail with ENODEV."""
+    machine.DEVICES.pop((bus, addr), None)
+
+
+def panel(addr=0x27, bus=0):
+    """Returns the simulated panel at addr."""
+    return machine.DEVICES[(bus, addr)]
+
+
+def i2c_bytes():
+    """Total bytes written on all simulated I2C buses."""
+    return sum(bus.bytes_sent for bus in machine.BUSES)
+
+
+def reset_i2c_log():
+    for bus in machine.BUSES:
+        bus.reset_log()
+
+
+async def start_ntp_servers(count=3, delay=0.005):
+    """Starts count fake NTP servers answering from sim.ntptime.SOURCE and
+    points the firmware's time sync at them. Returns the servers."""
+    from sim.ntpserver import FakeNtpServer
+    import timesync
+
+    servers = [FakeNtpServer(delay=delay * (i + 1)) for i in range(count)]
+    addresses = [await server.start() for server in servers]
+    timesync.SYNC.servers = tuple(addresses)
+    return servers
@@ -0,0 +1,101 @@
+# Model of an HD44780 character LCD behind a PCF8574 I2C expander.
+
+MASK_RS = 0x01
+MASK_E = 0x04
+MASK_BACKLIGHT = 0x08
+
+
+class Hd44780:
+    """Decodes the PCF8574 bytes the firmware writes into DDRAM and CGRAM
+    contents, so the simulated panel can be inspected.
+
+    Data is latched on the falling edge of E, high nibble first, once the
+    controller has been put into 4-bit mode.
+    """
+
+    def __init__(self, num_lines=4, num_columns=20):
+        self.num_lines = num_lines
+        self.num_columns = num_columns
+        self.ddram = bytearray(b" " * 0x80)
+        self.cgram = bytearray(64)
+        self.address = 0
+        self.cgram_mode = False
+        self.backlight = False
+        self.four_bit = False
+        self._last = 0
+        self._nibble = None
+        self.commands = 0
+        self.data_writes = 0
+
+    def write(self, data):
+        """Feeds bytes received by the PCF8574."""
+        for byte in data:
+            self.backlight = bool(byte & MASK_BACKLIGHT)
+            if self._last & MASK_E and not byte & MASK_E:
+                self._latch(self._last)
+            self._last = byte
+
+    def _latch(self, byte):
+        nibble = byte >> 4
+        if not self.four_bit:
+            # 8-bit mode during init: only the upper data lines are wired.
+            if nibble == 0x2:
+                self.four_bit = True
+            return
+        if self._nibble is None:
+            self._nibble = nibble
+            return
+        value = (self._nibble << 4) | nibble
+        self._nibble = None
+        if byte & MASK_RS:
+            self._data(value)
+        else:
+            self._command(value)
+
+    def _command(self, cmd):
+        self.commands += 1
+        if cmd & 0x80:
+            self.address = cmd & 0x7F
+            self.cgram_mode = False
+        elif cmd & 0x40:
+            self.address = cmd & 0x3F
+            self.cgram_mode = True
+        elif cmd == 0x01:
+            for i in range(len(self.ddram)):
+                self.ddram[i] = 0x20
+            self.address = 0
+            self.cgram_mode = False
+        elif cmd & 0xFE == 0x02:
+            self.address = 0
+            self.cgram_mode = False
+
+    def _data(self, value):
+        self.data_writes += 1
+        if self.cgram_mode:
+            self.cgram[self.address & 0x3F] = value
+            self.address = (self.address + 1) & 0x3F
+        else:
+            self.ddram[self.address & 0x7F] = value
+            self.address = (self.address + 1) & 0x7F
+
+    def _line_address(self, y):
+        addr = 0x40 if y & 1 else 0
+        if y & 2:
+            addr += self.num_columns
+        return addr
+
+    def line(self, y):
+        """Returns the raw bytes shown on line y."""
+        start = self._line_address(y)
+        return bytes(self.ddram[start : start + self.num_columns])
+
+    def text(self):
+        """Returns the screen contents as text lines. CGRAM and other
+        non-printable characters are shown as '?'."""
+        lines = []
+        for y in range(self.num_lines):
+            chars = []
+            for b in self.line(y):
+                chars.append(chr(b) if 0x20 <= b < 0x7F else "?")
+            lines.append("".join(chars))
+        return lines
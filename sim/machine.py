@@ -0,0 +1,177 @@
+# Fake `machine` module for running the firmware on a host.
+
+import errno
+import time
+
+# I2C devices by (bus id, address). A write to an address without a device
+# fails with ENODEV, as on real hardware.
+DEVICES = {}
+
+# Every SoftI2C/I2C instance created, so benchmarks can inspect traffic.
+BUSES = []
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    OPEN_DRAIN = 2
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_FALLING = 2
+    IRQ_RISING = 1
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self.id = id
+        self.mode = mode
+        self._value = value or 0
+        self._irq = None
+
+    def value(self, v=None):
+        if v is None:
+            return self._value
+        self._value = 1 if v else 0
+
+    def on(self):
+        self._value = 1
+
+    def off(self):
+        self._value = 0
+
+    def irq(self, handler=None, trigger=IRQ_FALLING):
+        self._irq = handler
+
+    def trigger(self):
+        """Simulates the pin's interrupt firing (e.g. a button press)."""
+        if self._irq:
+            self._irq(self)
+
+
+class PWM:
+    def __init__(self, pin, freq=0, duty=0, duty_u16=0):
+        self.pin = pin
+        self._freq = freq
+        self._duty = duty_u16
+
+    def freq(self, f=None):
+        if f is None:
+            return self._freq
+        self._freq = f
+
+    def duty_u16(self, d=None):
+        if d is None:
+            return self._duty
+        self._duty = d
+
+    def deinit(self):
+        self._duty = 0
+
+
+class SoftI2C:
+    """Records every transaction as (timestamp_us, addr, bytes) and forwards
+    the bytes to the device registered at that address."""
+
+    bus_id = "soft"
+
+    def __init__(self, scl=None, sda=None, freq=400000, timeout=50000):
+        self.freq = freq
+        self.transactions = []
+        self.bytes_sent = 0
+        BUSES.append(self)
+
+    def writeto(self, addr, buf, stop=True):
+        device = DEVICES.get((self.bus_id, addr))
+        if device is None:
+            raise OSError(errno.ENODEV, "ENODEV")
+        data = bytes(buf)
+        self.transactions.append((int(time.perf_counter() * 1000000), addr, data))
+        self.bytes_sent += len(data)
+        device.write(data)
+        return len(data)
+
+    def scan(self):
+        return sorted(addr for (bus, addr) in DEVICES if bus == self.bus_id)
+
+    def reset_log(self):
+        self.transactions = []
+        self.bytes_sent = 0
+
+
+class I2C(SoftI2C):
+    """Hardware I2C bus; devices are registered per bus id."""
+
+    def __init__(self, id=0, scl=None, sda=None, freq=400000, timeout=50000):
+        if id not in (0, 1):
+            raise ValueError("I2C(%s) doesn't exist" % id)
+        self.bus_id = id
+        SoftI2C.__init__(self, scl, sda, freq, timeout)
+
+
+class RTC:
+    def datetime(self, dt=None):
+        # The RTC is the simulated clock.
+        import sim
+
+        if dt is None:
+            t = time.gmtime(sim.CLOCK.time())
+            return (t[0], t[1], t[2], t[6], t[3], t[4], t[5], 0)
+        year, month, day, _, hour, minute, second, usec = dt
+        sim.CLOCK.set(_timegm((year, month, day, hour, minute, second)) + usec / 1000000)
+
+
+def _timegm(t):
+    import calendar
+
+    return calendar.timegm(tuple(t) + (0, 0, 0))
+
+
+class Timer:
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self, id=-1):
+        self.id = id
+        self._handle = None
+
+    def init(self, mode=PERIODIC, period=-1, callback=None, freq=None):
+        import asyncio
+
+        self.deinit()
+        if freq:
+            period = 1000 // freq
+        self._mode = mode
+        self._period = period
+        self._callback = callback
+        self._loop = asyncio.get_event_loop()
+        self._handle = self._loop.call_later(period / 1000, self._fire)
+
+    def _fire(self):
+        if self._mode == self.PERIODIC:
+            self._handle = self._loop.call_later(self._period / 1000, self._fire)
+        else:
+            self._handle = None
+        self._callback(self)
+
+    def deinit(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+
+class WDT:
+    def __init__(self, id=0, timeout=5000):
+        self.timeout = timeout
+        self.feeds = 0
+
+    def feed(self):
+        self.feeds += 1
+
+
+PWRON_RESET = 1
+HARD_RESET = 2
+WDT_RESET = 3
+DEEPSLEEP_RESET = 4
+SOFT_RESET = 5
+
+
+def reset_cause():
+    return PWRON_RESET
@@ -0,0 +1,95 @@
+# Fake `network` module with a controllable station interface.
+
+STA_IF = 0
+AP_IF = 1
+
+STAT_IDLE = 1000
+STAT_CONNECTING = 1001
+STAT_GOT_IP = 1010
+STAT_WRONG_PASSWORD = 202
+STAT_NO_AP_FOUND = 201
+
+
+class _Link:
+    """Shared state of the simulated access point, controlled by the test.
+
+    connect_delay is how many connect()/isconnected() polls it takes to get
+    an address; set up=False to make connecting fail or drop the link.
+    """
+
+    def __init__(self):
+        self.up = True
+        self.ssid = None
+        self.password = None
+        self.connect_delay = 2
+        self.rssi = -55
+        self.ip = "127.0.0.1"
+        self.reset()
+
+    def reset(self):
+        self.active = False
+        self.connected = False
+        self.connecting = False
+        self._polls = 0
+        self.connects = 0
+
+    def drop(self):
+        """Drops the connection, as if the access point went away."""
+        self.connected = False
+        self.connecting = False
+
+
+LINK = _Link()
+
+
+class WLAN:
+    def __init__(self, interface=STA_IF):
+        self.interface = interface
+
+    def active(self, is_active=None):
+        if is_active is None:
+            return LINK.active
+        LINK.active = bool(is_active)
+        if not is_active:
+            LINK.drop()
+
+    def connect(self, ssid=None, password=None):
+        LINK.connects += 1
+        LINK.connecting = True
+        LINK._polls = 0
+
+    def disconnect(self):
+        LINK.drop()
+
+    def _poll(self):
+        if LINK.connecting and LINK.up:
+            LINK._polls += 1
+            if LINK._polls >= LINK.connect_delay:
+                LINK.connecting = False
+                LINK.connected = True
+
+    def isconnected(self):
+        self._poll()
+        return LINK.connected and LINK.up
+
+    def status(self, param=None):
+        if param == "rssi":
+            return LINK.rssi
+        self._poll()
+        if LINK.connected and LINK.up:
+            return STAT_GOT_IP
+        if LINK.connecting and LINK.up:
+            return STAT_CONNECTING
+        if LINK.connecting:
+            return STAT_NO_AP_FOUND
+        return STAT_IDLE
+
+    def ifconfig(self):
+        if not (LINK.connected and LINK.up):
+            return ("0.0.0.0", "0.0.0.0", "0.0.0.0", "0.0.0.0")
+        return (LINK.ip, "255.255.255.0", "127.0.0.1", "127.0.0.1")
+
+    def config(self, *args, **kwargs):
+        if args == ("mac",):
+            return b"\x24\x0a\xc4\x00\x00\x01"
+        return None
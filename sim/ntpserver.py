@@ -0,0 +1,56 @@
+# Fake NTP servers on localhost, answering from sim.ntptime.SOURCE.
+
+import asyncio
+import struct
+
+from sim.ntptime import SOURCE
+
+NTP_DELTA = 2208988800  # 1900-01-01 to 1970-01-01
+
+
+class FakeNtpServer(asyncio.DatagramProtocol):
+    """Answers SNTP client requests with SOURCE's time.
+
+    delay is added before answering (half of it is reflected in the
+    timestamp, like a symmetric network path); drop=True ignores requests.
+    """
+
+    def __init__(self, delay=0.0, drop=False):
+        self.delay = delay
+        self.drop = drop
+        self.requests = 0
+        self.transport = None
+        self.address = None
+
+    async def start(self):
+        """Starts listening on a free local port; returns (host, port)."""
+        loop = asyncio.get_running_loop()
+        self.transport, _ = await loop.create_datagram_endpoint(
+            lambda: self, local_addr=("127.0.0.1", 0)
+        )
+        self.address = self.transport.get_extra_info("sockname")[:2]
+        return self.address
+
+    def close(self):
+        if self.transport:
+            self.transport.close()
+
+    def datagram_received(self, data, addr):
+        self.requests += 1
+        SOURCE.queries += 1
+        if self.drop or SOURCE.fail or len(data) < 48:
+            return
+        loop = asyncio.get_running_loop()
+        loop.call_later(self.delay / 2, self._reply, addr)
+
+    def _reply(self, addr):
+        t = SOURCE.time() + NTP_DELTA
+        seconds = int(t)
+        fraction = int((t - seconds) * (1 << 32))
+        msg = bytearray(48)
+        msg[0] = 0x24  # LI 0, version 4, mode 4 (server)
+        msg[1] = 2  # stratum
+        struct.pack_into("!II", msg, 40, seconds, fraction)
+        asyncio.get_running_loop().call_later(
+            self.delay / 2, self.transport.sendto, bytes(msg), addr
+        )
@@ -0,0 +1,42 @@
+# Fake `ntptime` module backed by a controllable time source.
+
+import time as _time
+
+# The host's real clock; the firmware's time.time() is the simulated one.
+_host_time = _time.time
+
+host = "pool.ntp.org"
+timeout = 1
+
+
+class NtpSource:
+    """The "true" time the fake NTP servers answer with.
+
+    offset is added to the host's real time; set fail=True to make every
+    query time out.
+    """
+
+    def __init__(self):
+        self.offset = 0.0
+        self.fail = False
+        self.queries = 0
+
+    def time(self):
+        return _host_time() + self.offset
+
+
+SOURCE = NtpSource()
+
+
+def time():
+    SOURCE.queries += 1
+    if SOURCE.fail:
+        raise OSError(110, "ETIMEDOUT")
+    return int(SOURCE.time())
+
+
+def settime():
+    # Sets the simulated RTC, like the real module sets machine.RTC.
+    import sim
+
+    sim.CLOCK.set(time())
@@ -0,0 +1,40 @@
+# A controllable wall clock for the simulator.
+
+import time
+
+_monotonic = time.monotonic
+
+
+class SimClock:
+    """Wall-clock time that runs at real speed (times rate) from a start
+    instant, and can be set or advanced by the test or benchmark.
+
+    Instants are CPython epoch seconds; the firmware only ever works with
+    differences and time.gmtime(), so the 1970 vs 2000 epoch doesn't matter.
+    """
+
+    def __init__(self, start=None, rate=1.0):
+        self.rate = rate
+        self._t0 = _monotonic()
+        self._start = time.time() if start is None else start
+
+    def now(self):
+        """Current simulated time in (fractional) seconds since the epoch."""
+        return self._start + (_monotonic() - self._t0) * self.rate
+
+    def set(self, t):
+        """Jumps to instant t."""
+        self._t0 = _monotonic()
+        self._start = t
+
+    def advance(self, seconds):
+        """Moves the clock forward (or back, if negative)."""
+        self._start += seconds
+
+    # time module replacements, with MicroPython semantics.
+
+    def time(self):
+        return int(self.now())
+
+    def time_ns(self):
+        return int(self.now() * 1000000000)
@@ -0,0 +1,129 @@
+# Stand-in clocks: the firmware's web server on local ports.
+#
+#     python3 -m sim.standin --count 50 --port 8100
+#
+# starts 50 clocks on 127.0.0.1:8100 to 8149 and prints their addresses,
+# one per line, for tools/fleet.py -f. Each clock is a process of its own,
+# since the firmware keeps its state in module globals, and runs the real
+# src/webserver.py and settings store on the simulator, in a directory of
+# its own for settings.json. Ctrl-C stops them all.
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import sim
+
+HOST = "127.0.0.1"
+PORT = 8100
+START_TIMEOUT = 30  # seconds for all clocks to start listening
+
+# Files the web server reads from its working directory.
+_FILES = ("website.html", "style.css")
+
+
+def serve(port, directory):
+    """Runs one clock's web server on port, forever."""
+    sim.install()
+    import eventlog
+
+    eventlog.ECHO = False
+    os.chdir(directory)
+    for name in _FILES:
+        shutil.copy(os.path.join(sim.SRC, name), name)
+
+    from globals import STATE
+    from settings import STORE
+    import webserver
+
+    STATE.set(settings=STORE.load(), ip=HOST)
+
+    async def main():
+        asyncio.create_task(STORE.run())
+        await webserver.start_web_server(port)
+
+    asyncio.run(main())
+
+
+def _listening(port):
+    try:
+        socket.create_connection((HOST, port), timeout=1).close()
+        return True
+    except OSError:
+        return False
+
+
+def start(count, port=PORT, directory=None):
+    """Starts count clocks on ports from port on, each in a subdirectory
+    of directory (a new temporary one by default). Returns the processes
+    and the clocks' "host:port" addresses once all are listening."""
+    if directory is None:
+        directory = tempfile.mkdtemp(prefix="standin-")
+    env = dict(os.environ, PYTHONPATH=sim.ROOT)
+    processes = []
+    hosts = []
+    for i in range(count):
+        clock_dir = os.path.join(directory, str(port + i))
+        os.makedirs(clock_dir, exist_ok=True)
+        settings_file = os.path.join(clock_dir, "settings.json")
+        if not os.path.exists(settings_file):
+            with open(settings_file, "w") as f:
+                json.dump({"ssid": "clock-%d" % i, "password": "secret"}, f)
+        processes.append(
+            subprocess.Popen(
+                [sys.executable, "-m", "sim.standin", "--serve", str(port + i)],
+                cwd=clock_dir,
+                env=env,
+            )
+        )
+        hosts.append("%s:%d" % (HOST, port + i))
+    deadline = time.monotonic() + START_TIMEOUT
+    for i in range(count):
+        while not _listening(port + i):
+            if processes[i].poll() is not None or time.monotonic() > deadline:
+                stop(processes)
+                raise RuntimeError("clock on port %d didn't start" % (port + i))
+            time.sleep(0.05)
+    return processes, hosts
+
+
+def stop(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs stand-in clocks.")
+    parser.add_argument("--count", type=int, default=1)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--dir", help="keep the clocks' files here")
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve is not None:
+        try:
+            serve(args.serve, os.getcwd())
+        except KeyboardInterrupt:
+            pass
+        return
+    processes, hosts = start(args.count, args.port, args.dir)
+    print("\n".join(hosts), flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop(processes)
+
+
+if __name__ == "__main__":
+    main()
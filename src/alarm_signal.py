@@ -0,0 +1,175 @@
+# Plays the ringing alarm on the outputs: the LCD backlight blinks and, if
+# one is fitted, a buzzer beeps.
+#
+# The patterns run from a hardware timer, so their timing doesn't depend on
+# the clock loop, which may be busy with a redraw or asleep until the next
+# minute. The signal follows STATE "alarm": it starts when an alarm rings
+# and stops when it is stopped, snoozed or rings out, wherever that came
+# from. The BOOT button stops a ringing or snoozed alarm.
+
+import asyncio
+import time
+from machine import PWM, Pin, Timer  # type: ignore
+from alarms import RINGING
+from globals import STATE
+
+TIMER_ID = 0
+TICK_MS = 50  # pattern steps are rounded to this
+
+BUTTON_PIN = 0  # the BOOT button, pulled up, low while pressed
+DEBOUNCE_MS = 200
+BUZZER_PIN = None  # GPIO of a piezo buzzer driven with PWM; None if not fitted
+BUZZER_FREQ = 2000
+
+# Patterns by name, as (backlight, buzzer) steps: durations in ms,
+# alternately on and off, starting with on.
+PATTERNS = {
+    "blink": ((500, 500), (100, 100, 100, 700)),
+    "fast": ((150, 150), (150, 150)),
+    "gentle": ((1000, 1000), (50, 1950)),
+}
+DEFAULT_PATTERN = "blink"
+
+
+class _Output:
+    # One output and where it is in its pattern.
+
+    def __init__(self, set_fn, pattern_index, rest):
+        self.set = set_fn  # set(on)
+        self.pattern_index = pattern_index  # into the PATTERNS values
+        self.rest = rest  # state while no alarm rings
+        self.steps = None
+        self.step = 0
+        self.left_ms = 0
+
+
+class AlarmSignal:
+    """Runs the alarm patterns on the outputs from a periodic Timer.
+
+    The timer callback only counts down integers and switches outputs, so
+    it doesn't allocate and needs nothing from the event loop.
+    """
+
+    def __init__(self):
+        self._outputs = []
+        self._timer = None
+        self._pattern = DEFAULT_PATTERN
+        self._button = None
+        self._pressed_ms = None
+        self._pressed = None
+        self._on_button = []
+        self.active = False
+        self.presses = 0
+
+    def attach_backlight(self, lcd):
+        """Blinks lcd's backlight. It rests on, as the clock loop turns it
+        off itself after a timeout."""
+
+        def set_backlight(on):
+            if on:
+                lcd.backlight_on()
+            else:
+                lcd.backlight_off()
+
+        self._outputs.append(_Output(set_backlight, 0, True))
+
+    def attach_buzzer(self, pin=BUZZER_PIN, freq=BUZZER_FREQ):
+        if pin is None:
+            return
+        pwm = PWM(Pin(pin), freq=freq, duty_u16=0)
+
+        def set_buzzer(on):
+            pwm.duty_u16(32768 if on else 0)
+
+        self._outputs.append(_Output(set_buzzer, 1, False))
+
+    def attach_button(self, pin=BUTTON_PIN):
+        if pin is None:
+            return
+        self._pressed = asyncio.ThreadSafeFlag()
+        self._button = Pin(pin, Pin.IN, Pin.PULL_UP)
+        self._button.irq(handler=self._on_press, trigger=Pin.IRQ_FALLING)
+
+    def on_button(self, callback):
+        """Calls callback() from the event loop after a button press."""
+        self._on_button.append(callback)
+
+    def watch(self):
+        """Follows STATE from now on: the pattern setting, and the alarm
+        to start and stop with."""
+        STATE.subscribe(self._on_change, ("alarm", "settings"))
+        self._on_change(("settings", "alarm"))
+
+    def _on_change(self, changed):
+        if "settings" in changed:
+            settings = STATE.get("settings") or {}
+            pattern = settings.get("alarm_signal", DEFAULT_PATTERN)
+            if pattern not in PATTERNS:
+                pattern = DEFAULT_PATTERN
+            if pattern != self._pattern:
+                self._pattern = pattern
+                if self.active:
+                    self.stop()
+                    self.start()
+        if "alarm" in changed:
+            if STATE.get("alarm") == RINGING:
+                self.start()
+            else:
+                self.stop()
+
+    def start(self):
+        """Starts the pattern from its first step; all outputs turn on."""
+        if self.active:
+            return
+        patterns = PATTERNS[self._pattern]
+        for output in self._outputs:
+            output.steps = patterns[output.pattern_index]
+            output.step = 0
+            output.left_ms = output.steps[0]
+            output.set(True)
+        self.active = True
+        self._timer = Timer(TIMER_ID)
+        self._timer.init(mode=Timer.PERIODIC, period=TICK_MS, callback=self._tick)
+
+    def stop(self):
+        """Stops the pattern and puts the outputs back at rest."""
+        if not self.active:
+            return
+        self.active = False
+        self._timer.deinit()
+        self._timer = None
+        for output in self._outputs:
+            output.set(output.rest)
+
+    def _tick(self, timer):
+        for output in self._outputs:
+            output.left_ms -= TICK_MS
+            if output.left_ms <= 0:
+                steps = output.steps
+                output.step = (output.step + 1) % len(steps)
+                output.left_ms += steps[output.step]
+                output.set(output.step % 2 == 0)
+
+    def _on_press(self, pin):
+        # IRQ handler: debounces and leaves the rest to run().
+        now = time.ticks_ms()
+        if (
+            self._pressed_ms is not None
+            and time.ticks_diff(now, self._pressed_ms) < DEBOUNCE_MS
+        ):
+            return
+        self._pressed_ms = now
+        self._pressed.set()
+
+    async def run(self):
+        """Calls the on_button callbacks after each press, forever."""
+        if self._pressed is None:
+            return
+        while True:
+            await self._pressed.wait()
+            self.presses += 1
+            for callback in self._on_button:
+                callback()
+
+
+SIGNAL = AlarmSignal()
@@ -0,0 +1,216 @@
+# Alarm scheduling.
+#
+# The alarms live in the settings as a list of dicts:
+#
+#     {"time": [7, 0], "days": 0b0011111, "enabled": True}
+#
+# Bit n of days is set for weekday n (0 = Monday). An alarm without days
+# is a one-shot: it fires once, at the next occurrence of its time, and then
+# disables itself. All times here are local seconds since the epoch, as
+# shown on the clock.
+#
+# The enabled alarms are kept in a heap ordered by their next fire time, so
+# checking for due alarms is a peek at the top of the heap.
+
+import heapq
+import time
+from globals import STATE
+from settings import STORE
+
+MAX_ALARMS = 6  # the alarms form must fit in one request body
+ALL_DAYS = 0b1111111
+RING_S = 300  # a ringing alarm stops by itself after this long
+SNOOZE_S = 540
+
+_SNOOZE = -1  # heap index of the snoozed alarm
+
+# Values of STATE "alarm".
+RINGING = "ringing"
+SNOOZED = "snoozed"
+
+
+def parse_time(text):
+    # "HH:MM" to [hour, minute], or None if it isn't a valid time.
+    if ":" not in text:
+        return None
+    hour, minute = text.split(":", 1)
+    try:
+        hour = int(hour)
+        minute = int(minute)
+    except ValueError:
+        return None
+    if 0 <= hour < 24 and 0 <= minute < 60:
+        return [hour, minute]
+    return None
+
+
+def _is_int(value):
+    # JSON true and false are ints to isinstance(), but not alarm fields.
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def normalize_alarm(alarm):
+    """Checks an alarm from outside (the JSON API) and returns it in the
+    settings format. The time may be "HH:MM" or [hour, minute]. Raises
+    ValueError if the alarm is invalid."""
+    alarm_time = alarm["time"]
+    if isinstance(alarm_time, str):
+        alarm_time = parse_time(alarm_time)
+    elif (
+        isinstance(alarm_time, list)
+        and len(alarm_time) == 2
+        and _is_int(alarm_time[0])
+        and _is_int(alarm_time[1])
+    ):
+        alarm_time = parse_time("%d:%d" % (alarm_time[0], alarm_time[1]))
+    else:
+        alarm_time = None
+    days = alarm.get("days", ALL_DAYS)
+    enabled = alarm.get("enabled", True)
+    if (
+        alarm_time is None
+        or not _is_int(days)
+        or not 0 <= days <= ALL_DAYS
+        or not isinstance(enabled, bool)
+    ):
+        raise ValueError("invalid alarm")
+    return {"time": alarm_time, "days": days, "enabled": enabled}
+
+
+def next_fire(alarm, after):
+    """Returns the first time after `after` at which alarm fires, or None if
+    it has no day to fire on."""
+    hour, minute = alarm["time"]
+    days = alarm.get("days", ALL_DAYS)
+    day = after - after % 86400
+    weekday = time.gmtime(day)[6]
+    t = day + hour * 3600 + minute * 60
+    for _ in range(8):
+        if t > after and (days == 0 or days >> weekday & 1):
+            return t
+        t += 86400
+        weekday = (weekday + 1) % 7
+    return None
+
+
+class Alarms:
+    """Fires the alarms from the settings at their times.
+
+    The clock loop calls load() whenever the settings change and check()
+    on every wakeup; snooze() and stop() end a ringing alarm. The ringing
+    state is published as STATE "alarm".
+    """
+
+    def __init__(self):
+        self._alarms = []
+        self._heap = []  # (next fire time, index in _alarms or _SNOOZE)
+        self._last_fire = -1
+        self._snoozed = None  # (until, alarm)
+        self.ringing = None  # the alarm that is ringing
+        self._ring_end = 0
+
+    def load(self, alarms, now):
+        """Schedules alarms, the list from the settings. Alarms due in the
+        current minute still fire, unless they already did."""
+        self._alarms = alarms
+        after = max(now - now % 60 - 1, self._last_fire)
+        heap = []
+        for i, alarm in enumerate(alarms):
+            if alarm.get("enabled", True):
+                t = next_fire(alarm, after)
+                if t is not None:
+                    heap.append((t, i))
+        if self._snoozed is not None:
+            heap.append((self._snoozed[0], _SNOOZE))
+        heapq.heapify(heap)
+        self._heap = heap
+
+    def check(self, now):
+        """Starts the alarms that are due and stops one that has rung for
+        RING_S. Returns True while an alarm is ringing."""
+        if self.ringing is not None and now >= self._ring_end:
+            self._set_ringing(None, now)
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            t, i = heapq.heappop(heap)
+            if i == _SNOOZE:
+                alarm = self._snoozed[1]
+                self._snoozed = None
+            else:
+                alarm = self._alarms[i]
+                self._last_fire = t
+                if alarm.get("days", ALL_DAYS):
+                    heapq.heappush(heap, (next_fire(alarm, t), i))
+                else:
+                    self._disable(i)
+            # Alarms missed by more than RING_S (the clock was set forward)
+            # are skipped.
+            if now - t < RING_S:
+                self._set_ringing(alarm, now)
+        return self.ringing is not None
+
+    def snooze(self, now):
+        """Silences the ringing alarm and rings it again in SNOOZE_S."""
+        if self.ringing is None:
+            return
+        self._snoozed = (now + SNOOZE_S, self.ringing)
+        heapq.heappush(self._heap, (now + SNOOZE_S, _SNOOZE))
+        self._set_ringing(None, now)
+
+    def stop(self, now):
+        """Silences the ringing alarm and cancels a snooze."""
+        if self._snoozed is not None:
+            self._snoozed = None
+            self._heap = [entry for entry in self._heap if entry[1] != _SNOOZE]
+            heapq.heapify(self._heap)
+        self._set_ringing(None, now)
+
+    def next(self):
+        """Returns (time, alarm) of the next alarm to fire, or None."""
+        if not self._heap:
+            return None
+        t, i = self._heap[0]
+        return t, self._snoozed[1] if i == _SNOOZE else self._alarms[i]
+
+    def next_time(self):
+        """Returns the time of the next alarm to fire, or None. Unlike
+        next(), this allocates nothing, so it can be polled every tick."""
+        return self._heap[0][0] if self._heap else None
+
+    def snoozed_until(self):
+        return None if self._snoozed is None else self._snoozed[0]
+
+    def timeout_ms(self, now):
+        """Milliseconds until the next alarm fires or the ringing one stops,
+        or None if neither is pending."""
+        deadline = self._heap[0][0] if self._heap else None
+        ring_end = self._ring_end if self.ringing is not None else None
+        if deadline is None or (ring_end is not None and ring_end < deadline):
+            deadline = ring_end
+        if deadline is None:
+            return None
+        return max(deadline - now, 0) * 1000
+
+    def _set_ringing(self, alarm, now):
+        self.ringing = alarm
+        self._ring_end = now + RING_S
+        if alarm is not None:
+            state = RINGING
+        elif self._snoozed is not None:
+            state = SNOOZED
+        else:
+            state = None
+        STATE.set(alarm=state)
+
+    def _disable(self, i):
+        # A one-shot alarm has fired: save it as disabled. The settings
+        # are replaced, not changed in place.
+        alarms = list(self._alarms)
+        alarms[i] = dict(alarms[i], enabled=False)
+        self._alarms = alarms
+        settings = dict(STATE.get("settings"), alarms=alarms)
+        STATE.set(settings=settings)
+        STORE.set(settings)
+
+
+ALARMS = Alarms()
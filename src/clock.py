@@ -1,156 +1,329 @@
+import gc
 import os
 import time
-import ntptime  # type: ignore
-from machine import Pin, SoftI2C  # type: ignore
-from machine_i2c_lcd import I2cLcd  # type: ignore
-import _thread
-import globals
-
-
-def is_dst_active(t):
-    # Determine if Daylight Saving Time (DST) is active based on the given time tuple.
-    year, month, day, hour, _, _, weekday, _ = t
-
-    # 1. DST Starts: Last Sunday in March
-    if month == 3:
-        # Find the day of the last Sunday in March
-        # March has 31 days. Start looking from day 31 back.
-        last_sunday = 31
-        while (
-            time.localtime(time.mktime((year, 3, last_sunday, 2, 0, 0, 0, 0)))[6] != 6
-        ):  # weekday 6 is Sunday
-            last_sunday -= 1
-
-        if day > last_sunday:
-            return True
-        elif day == last_sunday and hour >= 2:
-            return True
-
-    # 2. DST Active: April through September
-    if 4 <= month <= 9:
-        return True
+from lcd_framebuffer import SPACE  # type: ignore
+from lcd_glyphs import GlyphCache  # type: ignore
+from lcd_bigdigits import BigDigits  # type: ignore
+from globals import STATE
+import metrics
+from alarms import ALARMS
+from alarm_signal import SIGNAL
+from displays import DisplayManager
+from dst import RULES, TimeZone, date
+from scheduler import ClockScheduler
+from timesync import SYNC
 
-    # 3. DST Ends: Last Sunday in October
-    if month == 10:
-        # Find the day of the last Sunday in October
-        # October has 31 days. Start looking from day 31 back.
-        last_sunday = 31
-        while (
-            time.localtime(time.mktime((year, 10, last_sunday, 3, 0, 0, 0, 0)))[6] != 6
-        ):  # weekday 6 is Sunday
-            last_sunday -= 1
 
-        if day < last_sunday:
-            return True
-        elif day == last_sunday and hour < 3:
-            return True
+WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
 
-    # 4. Winter Time (Nov, Dec, Jan, Feb) or before March/after October DST change
-    return False
+# Icons for the big clock, shown in the last column.
+BELL = b"\x04\x0e\x0e\x0e\x1f\x00\x04\x00"
+NO_WIFI = b"\x0e\x11\x04\x0a\x00\x04\x00\x00"
 
+DRAW_MS = metrics.Histogram(
+    "lcd_draw_ms",
+    "Time to redraw the clock screen, I2C writes included.",
+    (2, 5, 10, 20, 50, 100),
+)
+TICK_ALLOC = metrics.Histogram(
+    "clock_tick_alloc_bytes",
+    "Heap allocated by one pass of the clock loop, its sleep excluded.",
+    (0, 16, 64, 256, 1024, 4096),
+)
 
-def get_current_offset_seconds(t_utc):
-    if is_dst_active(t_utc):
-        return globals.SETTINGS["summer"] * 3600
-    else:
-        return globals.SETTINGS["winter"] * 3600
+_tz = None
+_tz_version = None
 
 
-def get_formatted_time(first_run):
-    """
-    Retrieves the time, calculates the local time (CET/CEST)
-    and returns a formatted string.
+def get_current_offset_seconds(utc_time_s):
+    # The time zone is rebuilt whenever the settings change.
+    global _tz, _tz_version
+    version = STATE.version_of("settings")
+    if _tz is None or _tz_version != version:
+        settings = STATE.get("settings")
+        _tz_version = version
+        _tz = TimeZone(
+            RULES.get(settings.get("dst_rule", "eu"), RULES["eu"]),
+            settings["winter"] * 3600,
+            settings["summer"] * 3600,
+        )
+    return _tz.utc_offset(utc_time_s)
+
+
+def local_time():
+    # Local time in seconds since the epoch (2000-01-01), DST applied.
+    utc_time_s = SYNC.time()
+    return utc_time_s + get_current_offset_seconds(utc_time_s)
+
+
+def alarm_text():
+    # The alarm line: what is ringing or snoozed, or the next alarm.
+    if ALARMS.ringing is not None:
+        hour, minute = ALARMS.ringing["time"]
+        return "ALARM! {:02}:{:02}".format(hour, minute)
+    until = ALARMS.snoozed_until()
+    if until is not None:
+        t = time.gmtime(until)
+        return "Snooze until {:02}:{:02}".format(t[3], t[4])
+    upcoming = ALARMS.next()
+    if upcoming is None:
+        return "Alarm: --:--"
+    t = time.gmtime(upcoming[0])
+    return "Alarm: {} {:02}:{:02}".format(WEEKDAYS[t[6]], t[3], t[4])
+
+
+def _put_number(row, x, value, digits):
+    # Writes value, zero padded to digits characters, into row at x.
+    # Characters past the end of the row are dropped.
+    x += digits
+    while digits:
+        x -= 1
+        digits -= 1
+        if x < len(row):
+            row[x] = 0x30 + value % 10
+        value //= 10
+
+
+def _put_char(row, x, char):
+    if x < len(row):
+        row[x] = char
+
+
+class ClockFace:
+    """The text clock screen, kept in an LcdFramebuffer's back buffer and
+    updated in place.
+
+    The first line shows "HH:MM     DD-MM-YYYY". Its digits are patched
+    from integer fields: the time every minute and the date, which needs
+    the civil-from-days conversion, once a day. The other lines are only
+    rewritten when their text changes. Drawing a new minute allocates
+    nothing; fb.show() then sends just the cells that changed.
     """
 
-    if first_run:
-        try:
-            print("Syncing time with NTP...")
-            ntptime.settime()  # Sync time with NTP server
-            print("Time synchronized.")
-        except Exception as e:
-            print("Failed to sync time:", e)
-            globals.LCD_MESSAGE = "Time sync error"
-            return "Time sync error"
+    def __init__(self, fb):
+        self.fb = fb
+        self._minute = None  # local minute on the first line
+        self._day = None  # local day on the first line
+        self._lines = [None] * fb.num_lines  # text on the other lines
 
-    # 1. Get current time tuple in UTC
-    t_utc = time.localtime()
+    def invalidate(self):
+        """Blanks the back buffer and forgets what was drawn, e.g. after a
+        message was shown instead of the clock."""
+        self.fb.clear()
+        self._minute = None
+        self._day = None
+        for y in range(len(self._lines)):
+            self._lines[y] = None
 
-    # 2. Determine the correct offset (handles DST)
-    offset_seconds = get_current_offset_seconds(t_utc)
+    def set_line(self, y, text):
+        """Shows text (None for nothing) on line y, if the panel has one.
+        Text longer than the line is cut off."""
+        if y >= len(self._lines) or text == self._lines[y]:
+            return
+        self._lines[y] = text
+        row = self.fb.back[y]
+        length = 0 if text is None else min(len(text), len(row))
+        for x in range(len(row)):
+            row[x] = ord(text[x]) if x < length else SPACE
 
-    # 3. Convert UTC tuple to seconds since epoch (2000-01-01)
-    utc_time_s = time.mktime(t_utc)
+    def draw(self, t):
+        """Patches the time and date for local time t (in seconds) into
+        the first line. Returns False if they were already showing."""
+        minute = t // 60
+        if minute == self._minute:
+            return False
+        self._minute = minute
+        row = self.fb.back[0]
+        day = minute // 1440
+        minute -= day * 1440
+        if day != self._day:
+            self._day = day
+            year, month, mday, _ = date(t)
+            _put_char(row, 2, 0x3A)  # ':'
+            _put_number(row, 10, mday, 2)
+            _put_char(row, 12, 0x2D)  # '-'
+            _put_number(row, 13, month, 2)
+            _put_char(row, 15, 0x2D)
+            _put_number(row, 16, year, 4)
+        _put_number(row, 0, minute // 60, 2)
+        _put_number(row, 3, minute % 60, 2)
+        return True
 
-    # 4. Apply the offset
-    local_time_s = utc_time_s + offset_seconds
 
-    # 5. Convert the adjusted seconds back to a local time tuple
-    t_local = time.localtime(local_time_s)
+def draw_message(fb, message):
+    # Shows a status message instead of the clock.
+    fb.clear()
+    fb.putstr(message)
+    fb.show()
 
-    formatted_time = "{:02}:{:02}     {:02}-{:02}-{:04}".format(
-        t_local[3], t_local[4], t_local[2], t_local[1], t_local[0]
-    )
-    return [formatted_time, t_local]
 
+def draw_big_clock(fb, big, hours, minutes, alarm_set, snoozed, wifi_down):
+    # Shows HH:MM in four-line digits. The last column shows a bell while
+    # an alarm is set, "z" while one is snoozed, and a Wi-Fi icon while the
+    # link is down.
+    fb.clear()
+    glyphs = big.glyphs
+    glyphs.begin_frame()
+    big.begin()
+    big.time(0, hours, minutes)
+    x = fb.num_columns - 1
+    if alarm_set:
+        fb.back[0][x] = glyphs.code(BELL, ord("A"))
+    if snoozed:
+        fb.back[1][x] = ord("z")
+    if wifi_down:
+        fb.back[3][x] = glyphs.code(NO_WIFI, ord("W"))
+    fb.show()
 
-def clock_task():
-    I2C_ADDR = 0x27
-    I2C_NUM_ROWS = 4
-    I2C_NUM_COLS = 20
 
-    i2c = SoftI2C(sda=Pin(21), scl=Pin(22), freq=400000)
-    lcd = I2cLcd(i2c, I2C_ADDR, I2C_NUM_ROWS, I2C_NUM_COLS)
+async def clock_task():
+    # The screen is drawn once into the manager's frame and sent to every
+    # display in displays.DISPLAYS; the manager also stands in for the LCD.
+    fb = lcd = DisplayManager.from_config()
+    glyphs = GlyphCache(lcd)
+    big = BigDigits(fb, glyphs)
+    # The big clock needs all four lines and a column for the icons.
+    big_fits = fb.num_lines >= 4 and fb.num_columns >= 18
+    metrics.Counter(
+        "lcd_i2c_writes_total", "I2C transactions to the LCD.", fn=lambda: lcd.writes
+    )
+    metrics.Counter(
+        "lcd_i2c_bytes_total", "Bytes sent to the LCD.", fn=lambda: lcd.bytes_sent
+    )
+    metrics.Counter(
+        "lcd_i2c_write_us_total", "Time spent in LCD writes.", fn=lambda: lcd.write_us
+    )
+    metrics.Gauge(
+        "lcd_displays_up", "Displays answering on the bus.", fn=lambda: lcd.displays_up
+    )
+    metrics.Counter(
+        "lcd_display_failures_total",
+        "Times a display stopped answering.",
+        fn=lambda: lcd.failures,
+    )
+    metrics.Counter(
+        "lcd_glyph_uploads_total",
+        "Custom characters uploaded to CGRAM.",
+        fn=lambda: glyphs.uploads,
+    )
+
+    face = ClockFace(fb)
+    SIGNAL.attach_backlight(lcd)
+    scheduler = ClockScheduler()
 
     first_run = True
 
     backlight_on_time = 0
     backlight_timeout = 999  # seconds
-    alarm_triggered = False
-    previous_time = None
-    previous_alarm = globals.SETTINGS["alarm_hour"]
+    was_ringing = False
+    seen_version = None  # STATE.version of the last snapshot
+    version = state = None
+    drawn_version = None  # state version the screen was drawn from
+    drawn_minute = None
+    drawn_alarm = None  # next alarm time the alarm line was drawn for
+    alarms_version = None  # settings version the alarms were loaded from
+    published_minute = None
+    published_backlight = None
 
     while True:
-        time.sleep(1)
-        current_time = get_formatted_time(first_run)
+        alloc_start = gc.mem_alloc()
+        now = local_time()
+        if STATE.version != seen_version:
+            settings_version = STATE.version_of("settings")
+            if settings_version != alarms_version:
+                alarms_version = settings_version
+                ALARMS.load(STATE.get("settings").get("alarms", []), now)
 
-        if (
-            current_time[1][3] == globals.SETTINGS["alarm_hour"][0]
-            and current_time[1][4] == globals.SETTINGS["alarm_hour"][1]
-        ):
-            if not alarm_triggered:
-                backlight_on_time = time.time()
-                lcd.backlight_on()
-                alarm_triggered = True
+        # A peek at the next alarm; fires it if it is due. SIGNAL blinks the
+        # backlight while it rings and leaves it on afterwards.
+        ringing = SYNC.synced and ALARMS.check(now)
+        if was_ringing and not ringing:
+            # Stopped, snoozed or rung out: the backlight timeout restarts.
+            backlight_on_time = time.time()
+        was_ringing = ringing
 
-        if alarm_triggered:
-            if lcd.backlight:
-                lcd.backlight_off()
-            else:
-                lcd.backlight_on()
+        # One consistent read of everything the screen depends on. The
+        # snapshot allocates, so it is only taken after something changed.
+        if STATE.version != seen_version:
+            seen_version = STATE.version
+            version, state = STATE.snapshot(
+                "settings", "lcd_message", "wifi_state", "alarm"
+            )
 
-        if globals.LCD_MESSAGE is not None:
-            lcd.clear()
-            lcd.putstr(globals.LCD_MESSAGE)
+        minute = now // 60
+        next_alarm = ALARMS.next_time()
+        message = state["lcd_message"]
+        if message is not None or not SYNC.synced:
+            draw_message(fb, message or "Syncing time...")
+            face.invalidate()
+            drawn_version = None  # redraw the clock once the message is gone
         elif (
-            current_time[0] != previous_time
-            or globals.SETTINGS["alarm_hour"] != previous_alarm
+            minute != drawn_minute
+            or version != drawn_version
+            or next_alarm != drawn_alarm
         ):
-            previous_time = current_time[0]
-            previous_alarm = globals.SETTINGS["alarm_hour"]
-            lcd.clear()
-            lcd.putstr(current_time[0])
-            lcd.move_to(0, 1)
-            lcd.putstr(
-                "Alarm: {:02}:{:02}".format(
-                    globals.SETTINGS["alarm_hour"][0], globals.SETTINGS["alarm_hour"][1]
+            # The clock keeps running on the RTC while Wi-Fi is down.
+            wifi_down = state["wifi_state"] != "connected"
+            start = time.ticks_ms()
+            if big_fits and state["settings"].get("display_mode") == "big":
+                minute_of_day = minute % 1440
+                draw_big_clock(
+                    fb,
+                    big,
+                    minute_of_day // 60,
+                    minute_of_day % 60,
+                    next_alarm is not None,
+                    state["alarm"] == "snoozed",
+                    wifi_down,
                 )
-            )
+                face.invalidate()
+            else:
+                # The alarm and status lines only change with the state,
+                # so their text is only built then.
+                if version != drawn_version or next_alarm != drawn_alarm:
+                    face.set_line(1, alarm_text())
+                    face.set_line(
+                        2, "WiFi " + state["wifi_state"] if wifi_down else None
+                    )
+                face.draw(now)
+                fb.show()
+            DRAW_MS.observe(metrics.elapsed_ms(start))
+            drawn_minute = minute
+            drawn_version = version
+            drawn_alarm = next_alarm
             if first_run:
                 backlight_on_time = time.time()
                 lcd.backlight_on()
                 first_run = False
 
-        if (
-            time.time() - backlight_on_time
-        ) > backlight_timeout and not alarm_triggered:
-            lcd.backlight_off()
+        backlight_left = None
+        if lcd.backlight and not ringing:
+            backlight_left = backlight_on_time + backlight_timeout - time.time()
+            if backlight_left < 0:
+                lcd.backlight_off()
+                backlight_left = None
+
+        # For the event stream; a blinking backlight counts as on.
+        lit = ringing or lcd.backlight
+        if minute != published_minute or lit != published_backlight:
+            published_minute = minute
+            published_backlight = lit
+            up_to_date = seen_version == STATE.version
+            STATE.set(minute=minute, backlight=lit)
+            if up_to_date:
+                # Our own change doesn't need a new snapshot.
+                seen_version = STATE.version
+
+        timeout = scheduler.timeout_ms(
+            None if backlight_left is None else (backlight_left + 1) * 1000,
+            ALARMS.timeout_ms(now),
+        )
+        # A garbage collection during the pass makes the difference
+        # negative; such passes aren't counted.
+        alloc = gc.mem_alloc() - alloc_start
+        if alloc >= 0:
+            TICK_ALLOC.observe(alloc)
+
+        # Sleep until the displayed minute changes, the backlight times out
+        # or an alarm is due or rings out, whichever comes first.
+        await scheduler.sleep(timeout)
@@ -0,0 +1,252 @@
+# Shows the clock on several PCF8574 character LCDs at once.
+#
+# The clock draws every frame once, into a FRAME_LINES x FRAME_COLUMNS
+# buffer. show() copies each display's part of the frame into that
+# display's own framebuffer, which sends only the cells that changed on
+# that panel. A display that stops answering is left out and retried with
+# a growing backoff, so the others keep updating.
+
+import time
+from machine import I2C, Pin, SoftI2C  # type: ignore
+from machine_i2c_lcd import I2cLcd  # type: ignore
+from lcd_framebuffer import LcdFramebuffer  # type: ignore
+from eventlog import DISPLAY_BACK, DISPLAY_LOST, EVENTLOG
+
+FRAME_LINES = 4
+FRAME_COLUMNS = 20
+
+I2C_FREQ = 400000
+I2C_TIMEOUT_US = 10000  # a hung bus fails a write after this long
+
+# I2C buses by id: (scl, sda). 0 and 1 are the ESP32's hardware I2C
+# peripherals; a bus that can't be set up in hardware falls back to
+# SoftI2C on the same pins.
+BUSES = {
+    0: (22, 21),
+}
+
+# The displays: (bus id, address, lines, columns, layout). A layout lists,
+# for each line of the display, the parts of the frame it shows as
+# (frame line, frame column, width) tuples; None shows the top left corner
+# of the frame. For example, a 16x2 panel can show the time and the date on
+# its first line with [[(0, 0, 5), (0, 9, 11)], [(1, 0, 16)]].
+DISPLAYS = [
+    (0, 0x27, 4, 20, None),
+]
+
+MIN_BACKOFF_MS = 1000
+MAX_BACKOFF_MS = 60000
+
+
+def open_bus(bus_id, scl, sda):
+    """Returns the I2C bus bus_id, in hardware if possible."""
+    try:
+        return I2C(
+            bus_id, scl=Pin(scl), sda=Pin(sda), freq=I2C_FREQ, timeout=I2C_TIMEOUT_US
+        )
+    except (ValueError, OSError):
+        return SoftI2C(
+            scl=Pin(scl), sda=Pin(sda), freq=I2C_FREQ, timeout=I2C_TIMEOUT_US
+        )
+
+
+def _copies(layout, num_lines, num_columns):
+    # The layout as (line, column, frame line, frame column, width) copies,
+    # clipped to the display and the frame.
+    if layout is None:
+        layout = [[(y, 0, num_columns)] for y in range(num_lines)]
+    copies = []
+    for y in range(min(len(layout), num_lines)):
+        x = 0
+        for frame_y, frame_x, width in layout[y]:
+            width = min(width, num_columns - x, FRAME_COLUMNS - frame_x)
+            if width > 0 and 0 <= frame_y < FRAME_LINES:
+                copies.append((y, x, frame_y, frame_x, width))
+                x += width
+    return copies
+
+
+class Display:
+    """One panel: its LCD, the framebuffer with what it shows, and its
+    part of the frame."""
+
+    def __init__(self, i2c, addr, num_lines, num_columns, layout=None):
+        self.i2c = i2c
+        self.addr = addr
+        self.num_lines = num_lines
+        self.num_columns = num_columns
+        self.copies = _copies(layout, num_lines, num_columns)
+        self.lcd = None
+        self.fb = None
+        self.failures = 0
+        self._backoff_ms = MIN_BACKOFF_MS
+        self._retry_at = None  # ticks_ms of the next attempt while down
+        # Bus statistics of LCD objects replaced after a failure.
+        self.old_writes = 0
+        self.old_bytes_sent = 0
+        self.old_write_us = 0
+
+    @property
+    def up(self):
+        return self.lcd is not None
+
+    def connect(self, backlight, glyphs):
+        """Initialises the panel and restores the backlight and the custom
+        characters. Raises OSError if the panel doesn't answer; a missing
+        panel fails on the first byte, so a retry costs one transaction."""
+        self.lcd = I2cLcd(self.i2c, self.addr, self.num_lines, self.num_columns)
+        self.fb = LcdFramebuffer(self.lcd)
+        if not backlight:
+            self.lcd.backlight_off()
+        for location in range(len(glyphs)):
+            if glyphs[location] is not None:
+                self.lcd.custom_char(location, glyphs[location])
+        self._backoff_ms = MIN_BACKOFF_MS
+        self._retry_at = None
+
+    def fail(self):
+        """Takes the display out until its next retry."""
+        self.failures += 1
+        lcd = self.lcd
+        if lcd is not None:
+            self.old_writes += lcd.writes
+            self.old_bytes_sent += lcd.bytes_sent
+            self.old_write_us += lcd.write_us
+        self.lcd = None
+        self.fb = None
+        self._retry_at = time.ticks_add(time.ticks_ms(), self._backoff_ms)
+        self._backoff_ms = min(self._backoff_ms * 2, MAX_BACKOFF_MS)
+
+    def retry_due(self):
+        return (
+            self._retry_at is None
+            or time.ticks_diff(time.ticks_ms(), self._retry_at) >= 0
+        )
+
+
+class DisplayManager(LcdFramebuffer):
+    """The frame the clock draws into, and the LCD it controls.
+
+    Drawing works as on an LcdFramebuffer of the frame's size; show() fans
+    the frame out to the displays. The backlight and custom characters
+    are set on all displays, so the GlyphCache and the alarm signal can
+    use the manager as their LCD.
+    """
+
+    def __init__(self, displays):
+        self.displays = displays
+        self.num_lines = FRAME_LINES
+        self.num_columns = FRAME_COLUMNS
+        self.cursor_x = 0
+        self.cursor_y = 0
+        self.back = [bytearray(b" " * FRAME_COLUMNS) for _ in range(FRAME_LINES)]
+        self.backlight = True
+        self._glyphs = [None] * 8
+        for display in displays:
+            self._connect(display)
+
+    @classmethod
+    def from_config(cls, buses=BUSES, displays=DISPLAYS):
+        """Sets up the buses and displays configured in this module."""
+        opened = {}
+        for bus_id, (scl, sda) in buses.items():
+            opened[bus_id] = open_bus(bus_id, scl, sda)
+        return cls(
+            [
+                Display(opened[bus_id], addr, num_lines, num_columns, layout)
+                for bus_id, addr, num_lines, num_columns, layout in displays
+            ]
+        )
+
+    def _connect(self, display):
+        try:
+            display.connect(self.backlight, self._glyphs)
+        except OSError:
+            if not display.failures:
+                EVENTLOG.log(DISPLAY_LOST, hex(display.addr))
+            display.fail()
+            return False
+        if display.failures:
+            EVENTLOG.log(DISPLAY_BACK, hex(display.addr))
+        return True
+
+    def _fail(self, display):
+        EVENTLOG.log(DISPLAY_LOST, hex(display.addr))
+        display.fail()
+
+    def show(self):
+        """Sends the frame to every display that is up, and retries the
+        ones that are down once their backoff is over. Returns the number
+        of data bytes sent."""
+        sent = 0
+        back = self.back
+        for display in self.displays:
+            if not display.up:
+                if not display.retry_due() or not self._connect(display):
+                    continue
+            fb = display.fb
+            for y, x, frame_y, frame_x, width in display.copies:
+                row = fb.back[y]
+                frame_row = back[frame_y]
+                for i in range(width):
+                    row[x + i] = frame_row[frame_x + i]
+            try:
+                sent += fb.show()
+            except OSError:
+                self._fail(display)
+        return sent
+
+    def invalidate(self):
+        for display in self.displays:
+            if display.up:
+                display.fb.invalidate()
+
+    # The LCD side, for the backlight, GlyphCache and the metrics.
+
+    def _each_lcd(self, method, *args):
+        for display in self.displays:
+            if display.up:
+                try:
+                    getattr(display.lcd, method)(*args)
+                except OSError:
+                    self._fail(display)
+
+    def backlight_on(self):
+        self.backlight = True
+        self._each_lcd("backlight_on")
+
+    def backlight_off(self):
+        self.backlight = False
+        self._each_lcd("backlight_off")
+
+    def custom_char(self, location, charmap):
+        self._glyphs[location] = charmap
+        self._each_lcd("custom_char", location, charmap)
+
+    @property
+    def displays_up(self):
+        return sum(1 for display in self.displays if display.up)
+
+    @property
+    def failures(self):
+        return sum(display.failures for display in self.displays)
+
+    def _total(self, name):
+        total = 0
+        for display in self.displays:
+            total += getattr(display, "old_" + name)
+            if display.up:
+                total += getattr(display.lcd, name)
+        return total
+
+    @property
+    def writes(self):
+        return self._total("writes")
+
+    @property
+    def bytes_sent(self):
+        return self._total("bytes_sent")
+
+    @property
+    def write_us(self):
+        return self._total("write_us")
@@ -0,0 +1,182 @@
+# Daylight Saving Time rules.
+#
+# Transition instants are computed with integer calendar arithmetic once per
+# year and cached, so looking up the UTC offset for the current time is a
+# single range check in the common case.
+
+import time
+
+MONDAY = 0
+SUNDAY = 6
+
+LAST = -1  # "week" value selecting the last occurrence in the month
+
+
+def _days_from_civil(year, month, day):
+    # Days since 1970-01-01 for a proleptic Gregorian date.
+    if month <= 2:
+        year -= 1
+    era = year // 400
+    yoe = year - era * 400
+    doy = (153 * (month + (-3 if month > 2 else 9)) + 2) // 5 + day - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    return era * 146097 + doe - 719468
+
+
+# Days between 1970-01-01 and the epoch of this port (2000-01-01 on ESP32).
+_EPOCH_DAYS = _days_from_civil(*time.gmtime(0)[:3])
+
+
+def _weekday(days):
+    # 1970-01-01 was a Thursday.
+    return (days + 3) % 7
+
+
+def civil_from_days(days):
+    """Returns (year, month, day) for days since 1970-01-01; the inverse
+    of _days_from_civil."""
+    days += 719468
+    era = days // 146097
+    doe = days - era * 146097
+    yoe = (doe - doe // 1460 + doe // 36524 - doe // 146096) // 365
+    doy = doe - (365 * yoe + yoe // 4 - yoe // 100)
+    mp = (5 * doy + 2) // 153
+    day = doy - (153 * mp + 2) // 5 + 1
+    month = mp + 3 if mp < 10 else mp - 9
+    year = yoe + era * 400
+    if month <= 2:
+        year += 1
+    return year, month, day
+
+
+def date(t):
+    """Returns (year, month, day, weekday) for t in seconds since the
+    epoch, weekday 0 being Monday, as time.gmtime(t) would."""
+    days = t // 86400 + _EPOCH_DAYS
+    year, month, day = civil_from_days(days)
+    return year, month, day, _weekday(days)
+
+
+def iso_minute(t):
+    """Returns seconds since the epoch (local time, as shown on the
+    clock) as "YYYY-MM-DDTHH:MM"."""
+    t = time.gmtime(t)
+    return "%04d-%02d-%02dT%02d:%02d" % (t[0], t[1], t[2], t[3], t[4])
+
+
+def nth_weekday(year, month, week, weekday):
+    """Returns the day of the month of the given weekday occurrence.
+
+    week counts from 1 (first) to 4, or is LAST for the last occurrence.
+    """
+    first = _days_from_civil(year, month, 1)
+    if week == LAST:
+        if month == 12:
+            last = _days_from_civil(year + 1, 1, 1) - 1
+        else:
+            last = _days_from_civil(year, month + 1, 1) - 1
+        return last - first + 1 - (_weekday(last) - weekday) % 7
+    return 1 + (weekday - _weekday(first)) % 7 + (week - 1) * 7
+
+
+class DstRule:
+    """A yearly DST rule. start and end are (month, week, weekday, hour)
+    tuples in local wall-clock time: start in standard time and end in
+    daylight time, as the rules are usually written. With utc=True they
+    are in UTC instead, for rules that switch at the same instant in every
+    time zone.
+    """
+
+    def __init__(self, start, end, utc=False):
+        self.start = start
+        self.end = end
+        self.utc = utc
+        self._year = None
+        self._transitions = None
+
+    def _local_seconds(self, year, spec):
+        month, week, weekday, hour = spec
+        day = nth_weekday(year, month, week, weekday)
+        return (_days_from_civil(year, month, day) - _EPOCH_DAYS) * 86400 + hour * 3600
+
+    def transitions(self, year):
+        """Returns the (start, end) instants for the given year in seconds
+        since the epoch, wall-clock or UTC as the rule is written. The last
+        year asked for is cached.
+        """
+        if year != self._year:
+            self._transitions = (
+                self._local_seconds(year, self.start),
+                self._local_seconds(year, self.end),
+            )
+            self._year = year
+        return self._transitions
+
+
+RULES = {
+    # Last Sunday of March until last Sunday of October, switching at 01:00
+    # UTC in every EU time zone (02:00 -> 03:00 CET, 01:00 -> 02:00 WET).
+    "eu": DstRule((3, LAST, SUNDAY, 1), (10, LAST, SUNDAY, 1), utc=True),
+    # Second Sunday of March 02:00 until first Sunday of November 02:00.
+    "us": DstRule((3, 2, SUNDAY, 2), (11, 1, SUNDAY, 2)),
+    # No daylight saving time, the winter offset is used all year.
+    "none": None,
+}
+
+
+class TimeZone:
+    """Answers the UTC offset for an instant, given a DST rule and the
+    standard and daylight offsets in seconds.
+
+    The interval around the last lookup during which the offset stays
+    constant is remembered, so repeated lookups only do a range check.
+    """
+
+    def __init__(self, rule, std_offset, dst_offset):
+        self.rule = rule
+        self.std_offset = std_offset
+        self.dst_offset = dst_offset
+        self._valid_from = 0
+        self._valid_until = 0
+        self._offset = std_offset
+
+    def utc_offset(self, t):
+        """Returns the offset in seconds to add to UTC instant t."""
+        if self._valid_from <= t < self._valid_until:
+            return self._offset
+        if self.rule is None:
+            self._valid_from = t
+            self._valid_until = t + 365 * 86400
+            self._offset = self.std_offset
+            return self._offset
+
+        year = time.gmtime(t)[0]
+        start, end = self.rule.transitions(year)
+        if not self.rule.utc:
+            start -= self.std_offset
+            end -= self.dst_offset
+        year_start = (_days_from_civil(year, 1, 1) - _EPOCH_DAYS) * 86400
+        year_end = (_days_from_civil(year + 1, 1, 1) - _EPOCH_DAYS) * 86400
+
+        if start < end:
+            # Northern hemisphere: DST in the middle of the year.
+            if t < start:
+                self._set(year_start, start, self.std_offset)
+            elif t < end:
+                self._set(start, end, self.dst_offset)
+            else:
+                self._set(end, year_end, self.std_offset)
+        else:
+            # Southern hemisphere: DST around new year.
+            if t < end:
+                self._set(year_start, end, self.dst_offset)
+            elif t < start:
+                self._set(end, start, self.std_offset)
+            else:
+                self._set(start, year_end, self.dst_offset)
+        return self._offset
+
+    def _set(self, valid_from, valid_until, offset):
+        self._valid_from = valid_from
+        self._valid_until = valid_until
+        self._offset = offset
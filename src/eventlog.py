@@ -0,0 +1,363 @@
+# Persistent event log, kept in a ring of fixed-size page files on flash.
+#
+# log() packs an event into a RAM buffer and returns; it never touches
+# flash, so it is cheap enough for any task. run() appends the buffer to
+# the current page every FLUSH_MS. When a page is full the next page in the
+# ring is truncated and written from its start, so the log keeps the last
+# PAGES * PAGE_SIZE bytes of events, and each page is only ever appended
+# to between two erases. The file system (LittleFS) spreads those writes
+# over the flash.
+#
+# An event is stored as a code and its arguments as text; the message
+# itself is only formatted when the log is read. A record is:
+#
+#     time (u32, RTC seconds), boot (u16), code (u8), length (u8), arguments
+#
+# with the arguments separated by NUL bytes. Every page starts with a
+# header holding its sequence number, which orders the pages on reading.
+
+import asyncio
+import os
+import struct
+import time
+
+LOG_DIR = "eventlog"
+PAGES = 8
+PAGE_SIZE = 4096
+BUFFER_SIZE = 1024  # events that don't fit before the next flush are dropped
+FLUSH_MS = 10000
+ECHO = True  # also print events, for when a serial cable is attached
+
+_MAGIC = b"EVL1"
+_PAGE_HEADER = "<4sI"  # magic, sequence number
+_PAGE_HEADER_SIZE = 8
+_RECORD = "<IHBB"  # time, boot, code, length of the arguments
+_RECORD_SIZE = 8
+_MAX_ARGS = 255
+
+# Event codes. Messages take the arguments with %s.
+BOOT = 1
+SETTINGS_LOADED = 2
+SETTINGS_LOAD_FAILED = 3
+SETTINGS_SAVED = 4
+SETTINGS_SAVE_FAILED = 5
+NO_WIFI_SETTINGS = 6
+WIFI_STATE = 10
+WIFI_CONNECT_FAILED = 11
+WIFI_LINK_LOST = 12
+WIFI_RETRY = 13
+NTP_RESOLVE_FAILED = 20
+NTP_QUERY_FAILED = 21
+NTP_SYNCED = 22
+NTP_RETRY = 23
+LOOP_STALL = 30
+DISPLAY_LOST = 31
+DISPLAY_BACK = 32
+WEB_STARTED = 40
+WEB_SETTINGS_SAVED = 41
+WEB_ALARMS_SAVED = 42
+WEB_BAD_REQUEST = 43
+WEB_TIMEOUT = 44
+WEB_SOCKET_ERROR = 45
+TEMPLATE_LOAD_FAILED = 46
+# Debug events are printed (with ECHO) but not stored.
+WEB_CONNECTION = 200
+WEB_REQUEST = 201
+
+MESSAGES = {
+    BOOT: "Boot: %s",
+    SETTINGS_LOADED: "Settings loaded",
+    SETTINGS_LOAD_FAILED: "Error loading settings from %s: %s",
+    SETTINGS_SAVED: "Settings saved",
+    SETTINGS_SAVE_FAILED: "Error saving settings: %s",
+    NO_WIFI_SETTINGS: "No WiFi settings found. Please flash manually.",
+    WIFI_STATE: "WiFi: %s %s",
+    WIFI_CONNECT_FAILED: "WiFi: connect failed: %s",
+    WIFI_LINK_LOST: "WiFi: link lost",
+    WIFI_RETRY: "WiFi: connection failed, retrying in %s s",
+    NTP_RESOLVE_FAILED: "NTP: can't resolve %s: %s",
+    NTP_QUERY_FAILED: "NTP: query to %s failed: %s",
+    NTP_SYNCED: "NTP: synced with %s, offset %s ms, rtt %s ms",
+    NTP_RETRY: "NTP: no server answered, retrying in %s s",
+    LOOP_STALL: "Watchdog: event loop stalled for %s ms",
+    DISPLAY_LOST: "Display %s stopped answering",
+    DISPLAY_BACK: "Display %s is back",
+    WEB_STARTED: "Web Server started. Listening on port %s",
+    WEB_SETTINGS_SAVED: "Saved settings: SSID=%s, SUMMER=%s, WINTER=%s, DST=%s",
+    WEB_ALARMS_SAVED: "Saved %s alarms",
+    WEB_BAD_REQUEST: "Bad request: %s %s",
+    WEB_TIMEOUT: "Client timed out",
+    WEB_SOCKET_ERROR: "Socket error: %s",
+    TEMPLATE_LOAD_FAILED: "Error loading template %s: %s",
+    WEB_CONNECTION: "Got a connection from %s",
+    WEB_REQUEST: "Request: %s %s",
+}
+DEBUG = 200  # codes from here on are debug events
+
+_RESET_CAUSES = {
+    1: "power on",
+    2: "hard reset",
+    3: "watchdog reset",
+    4: "deep sleep wake",
+    5: "soft reset",
+}
+
+
+def format_event(code, args):
+    """Returns the message for an event, args being a list of strings."""
+    message = MESSAGES.get(code)
+    if message is None:
+        return "Event %d: %s" % (code, " ".join(args))
+    try:
+        return message % tuple(args)
+    except TypeError:
+        return message + " " + " ".join(args)
+
+
+def format_record(t, boot, code, args):
+    # One log line: UTC time, boot number and message.
+    t = time.gmtime(t)
+    return "%04d-%02d-%02dT%02d:%02d:%02dZ #%d %s\n" % (
+        t[0],
+        t[1],
+        t[2],
+        t[3],
+        t[4],
+        t[5],
+        boot,
+        format_event(code, args),
+    )
+
+
+def _split_args(data):
+    if not data:
+        return []
+    try:
+        text = data.decode()
+    except UnicodeError:
+        # Cut off in the middle of a character by the length limit.
+        text = "".join(chr(b) if b < 0x80 else "?" for b in data)
+    return text.split("\0")
+
+
+def _page_path(index):
+    return "%s/%d.bin" % (LOG_DIR, index)
+
+
+def _page_seq(f):
+    # The sequence number from the header of the open page f, or None if
+    # it isn't a log page.
+    header = f.read(_PAGE_HEADER_SIZE)
+    if len(header) < _PAGE_HEADER_SIZE:
+        return None
+    magic, seq = struct.unpack(_PAGE_HEADER, header)
+    return seq if magic == _MAGIC else None
+
+
+def _records(f):
+    # Yields the records after the header of page f, as (time, boot,
+    # code, args bytes), one at a time so a page never has to fit in RAM.
+    # A torn record (from a power loss during a write) yields None and
+    # ends the page.
+    while True:
+        head = f.read(_RECORD_SIZE)
+        if not head:
+            return
+        if len(head) < _RECORD_SIZE:
+            yield None
+            return
+        t, boot, code, length = struct.unpack(_RECORD, head)
+        args = f.read(length) if length else b""
+        if code == 0 or len(args) < length:
+            yield None
+            return
+        yield t, boot, code, args
+
+
+class EventLog:
+    """The event log: a RAM buffer in front of the ring of pages."""
+
+    def __init__(self):
+        self._buf = bytearray(BUFFER_SIZE)
+        self._buf_len = 0
+        self._opened = False
+        self._page = 0  # index of the page being appended to
+        self._page_len = 0
+        self._seq = 0
+        self.boot = 0
+        self.records = 0
+        self.dropped = 0
+        self.bytes_written = 0
+        self.write_errors = 0
+        self._flush_now = None
+
+    def log(self, code, *args):
+        """Records an event. Never blocks: the event goes to the RAM buffer,
+        or is dropped (and counted) if the buffer is full."""
+        if ECHO:
+            print(format_event(code, [str(arg) for arg in args]))
+        if code >= DEBUG:
+            return
+        data = "\0".join(str(arg) for arg in args).encode()[:_MAX_ARGS]
+        end = self._buf_len + _RECORD_SIZE + len(data)
+        if end > BUFFER_SIZE:
+            self.dropped += 1
+            return
+        struct.pack_into(
+            _RECORD, self._buf, self._buf_len, time.time(), self.boot, code, len(data)
+        )
+        self._buf[self._buf_len + _RECORD_SIZE : end] = data
+        self._buf_len = end
+        self.records += 1
+        if end > BUFFER_SIZE // 2 and self._flush_now is not None:
+            self._flush_now.set()
+
+    def open(self):
+        """Finds the newest page and the boot number, and logs the boot.
+        Reads flash, so it is called once at startup."""
+        if self._opened:
+            return
+        self._opened = True
+        try:
+            os.mkdir(LOG_DIR)
+        except OSError:
+            pass
+        newest = None  # (index, sequence number)
+        for index in range(PAGES):
+            try:
+                with open(_page_path(index), "rb") as f:
+                    seq = _page_seq(f)
+            except OSError:
+                continue
+            if seq is not None and (newest is None or seq > newest[1]):
+                newest = (index, seq)
+        last_boot = 0
+        torn = False
+        if newest is not None:
+            self._page, self._seq = newest
+            self._page_len = _PAGE_HEADER_SIZE
+            with open(_page_path(self._page), "rb") as f:
+                _page_seq(f)
+                for record in _records(f):
+                    if record is None:
+                        torn = True
+                        break
+                    last_boot = max(last_boot, record[1])
+                    self._page_len += _RECORD_SIZE + len(record[3])
+        self.boot = (last_boot + 1) & 0xFFFF
+        if newest is None or torn:
+            # Nothing to append to, or the page ends in a torn record.
+            self._next_page()
+        # Events logged before the boot number was known get it now.
+        i = 0
+        while i < self._buf_len:
+            struct.pack_into("<H", self._buf, i + 4, self.boot)
+            i += _RECORD_SIZE + self._buf[i + 7]
+        try:
+            from machine import reset_cause  # type: ignore
+
+            cause = reset_cause()
+        except ImportError:
+            cause = 0
+        self.log(BOOT, _RESET_CAUSES.get(cause, cause))
+
+    def _next_page(self):
+        # Starts the next page of the ring, overwriting the oldest.
+        if self._seq:
+            self._page = (self._page + 1) % PAGES
+        self._seq += 1
+        with open(_page_path(self._page), "wb") as f:
+            f.write(struct.pack(_PAGE_HEADER, _MAGIC, self._seq))
+        self._page_len = _PAGE_HEADER_SIZE
+        self.bytes_written += _PAGE_HEADER_SIZE
+
+    def flush(self):
+        """Appends the buffered events to flash. Returns the number of
+        bytes written."""
+        if not self._opened:
+            self.open()
+        buf = self._buf
+        written = 0
+        start = 0
+        try:
+            while start < self._buf_len:
+                # Whole records that fit in the rest of the page.
+                end = start
+                while end < self._buf_len:
+                    size = _RECORD_SIZE + buf[end + 7]
+                    if self._page_len + end - start + size > PAGE_SIZE:
+                        break
+                    end += size
+                if end > start:
+                    with open(_page_path(self._page), "ab") as f:
+                        f.write(memoryview(buf)[start:end])
+                    self._page_len += end - start
+                    written += end - start
+                    start = end
+                if start < self._buf_len:
+                    self._next_page()
+        except OSError:
+            # Flash full or failing; what wasn't written is dropped, so
+            # the buffer can't fill up for good.
+            self.write_errors += 1
+        self._buf_len = 0
+        self.bytes_written += written
+        return written
+
+    def pages(self):
+        """Returns the page paths, oldest first."""
+        found = []
+        for index in range(PAGES):
+            path = _page_path(index)
+            try:
+                with open(path, "rb") as f:
+                    seq = _page_seq(f)
+            except OSError:
+                continue
+            if seq is not None:
+                found.append((seq, path))
+        found.sort()
+        return [path for seq, path in found]
+
+    def lines(self, path):
+        """Yields the events of the page at path as text lines."""
+        try:
+            f = open(path, "rb")
+        except OSError:
+            return
+        with f:
+            if _page_seq(f) is None:
+                return
+            for record in _records(f):
+                if record is None:
+                    return
+                t, boot, code, args = record
+                yield format_record(t, boot, code, _split_args(args))
+
+    def buffered(self):
+        """Yields the events not yet flushed as text lines, oldest first.
+        Reads a copy of the buffer, since a flush may empty it meanwhile."""
+        buf = bytes(self._buf[: self._buf_len])
+        i = 0
+        while i < len(buf):
+            t, boot, code, length = struct.unpack_from(_RECORD, buf, i)
+            start = i + _RECORD_SIZE
+            i = start + length
+            yield format_record(t, boot, code, _split_args(buf[start:i]))
+
+    async def run(self):
+        """Flushes the buffer every FLUSH_MS, or sooner once it is half
+        full, forever."""
+        self.open()
+        self._flush_now = asyncio.Event()
+        while True:
+            try:
+                await asyncio.wait_for_ms(self._flush_now.wait(), FLUSH_MS)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            if self._buf_len:
+                self.flush()
+
+
+EVENTLOG = EventLog()
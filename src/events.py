@@ -0,0 +1,121 @@
+# Server-Sent Events stream of the clock's state, served at /events.
+#
+# Every change to one of the published STATE keys is formatted once and
+# queued for each subscriber; each subscriber's connection task writes its
+# queue out. A subscriber that falls QUEUE_LEN events behind, or doesn't
+# take a write within WRITE_TIMEOUT, is disconnected, so a stalled client
+# can't hold on to RAM. EventSource clients reconnect by themselves.
+
+import asyncio
+import json
+from dst import iso_minute
+from globals import STATE
+
+MAX_SUBSCRIBERS = 3
+QUEUE_LEN = 8  # events a subscriber may fall behind before it is dropped
+WRITE_TIMEOUT = 5  # seconds
+HEARTBEAT_S = 30  # idle streams get a comment, so dead clients are noticed
+RETRY_MS = 5000  # reconnect delay for EventSource clients
+
+# Published STATE keys and the event each is sent as.
+EVENT_NAMES = {
+    "minute": "time",
+    "alarm": "alarm",
+    "backlight": "backlight",
+    "lcd_message": "message",
+}
+
+_HEAD = (
+    b"HTTP/1.1 200 OK\r\n"
+    b"Content-Type: text/event-stream\r\n"
+    b"Cache-Control: no-cache\r\n"
+    b"Connection: close\r\n\r\n"
+    b"retry: %d\n\n" % RETRY_MS
+)
+_PING = b": ping\n\n"
+
+
+def format_event(key, value):
+    # One event as sent on the stream, e.g. b'event: alarm\ndata: "ringing"\n\n'.
+    if key == "minute":
+        value = None if value is None else iso_minute(value * 60)
+    return b"event: %s\ndata: %s\n\n" % (
+        EVENT_NAMES[key].encode(),
+        json.dumps(value).encode(),
+    )
+
+
+class _Subscriber:
+    def __init__(self):
+        self.queue = []
+        self.ready = asyncio.Event()
+        self.dropped = False
+
+
+class EventHub:
+    """Fans STATE changes out to the /events subscribers."""
+
+    def __init__(self):
+        self._subscribers = []
+        self._started = False
+        self.drops = 0  # subscribers disconnected for being too slow
+
+    def start(self):
+        if not self._started:
+            self._started = True
+            STATE.subscribe(self._on_change, tuple(EVENT_NAMES))
+
+    def full(self):
+        return len(self._subscribers) >= MAX_SUBSCRIBERS
+
+    def _on_change(self, changed):
+        if not self._subscribers:
+            return
+        values = STATE.snapshot(*changed)[1]
+        for key in changed:
+            event = format_event(key, values[key])
+            for subscriber in self._subscribers:
+                if len(subscriber.queue) >= QUEUE_LEN:
+                    self._drop(subscriber)
+                else:
+                    subscriber.queue.append(event)
+                    subscriber.ready.set()
+
+    def _drop(self, subscriber):
+        if not subscriber.dropped:
+            subscriber.dropped = True
+            subscriber.ready.set()
+            self.drops += 1
+
+    async def serve(self, writer):
+        """Streams events to writer until the client goes away or is
+        dropped. The caller checks full() first."""
+        subscriber = _Subscriber()
+        self._subscribers.append(subscriber)
+        try:
+            # Start with the current value of everything, so the client
+            # needs no separate request for the initial state.
+            values = STATE.snapshot(*EVENT_NAMES)[1]
+            chunks = [_HEAD]
+            for key in EVENT_NAMES:
+                chunks.append(format_event(key, values[key]))
+            while not subscriber.dropped:
+                for chunk in chunks:
+                    writer.write(chunk)
+                try:
+                    await asyncio.wait_for(writer.drain(), WRITE_TIMEOUT)
+                except Exception:
+                    self._drop(subscriber)
+                    break
+                try:
+                    await asyncio.wait_for(subscriber.ready.wait(), HEARTBEAT_S)
+                except asyncio.TimeoutError:
+                    subscriber.queue.append(_PING)
+                subscriber.ready.clear()
+                chunks = subscriber.queue
+                subscriber.queue = []
+        finally:
+            self._subscribers.remove(subscriber)
+
+
+EVENTS = EventHub()
@@ -0,0 +1,81 @@
+# Decoding of application/x-www-form-urlencoded request bodies.
+#
+# Bodies are decoded as bytes into a preallocated buffer in a single pass,
+# and each value is turned into a str once, so multi-byte UTF-8 characters
+# (in SSIDs and passwords, for example) come out intact.
+
+from http_parser import MAX_BODY
+
+PLUS = 0x2B
+PERCENT = 0x25
+AMPERSAND = 0x26
+EQUALS = 0x3D
+
+# A decoded value is never longer than its encoded form, which is never
+# longer than a request body.
+_decode_buf = bytearray(MAX_BODY)
+
+
+def _hex_value(c):
+    # Value of an ASCII hex digit, or -1.
+    if 0x30 <= c <= 0x39:
+        return c - 0x30
+    c |= 0x20
+    if 0x61 <= c <= 0x66:
+        return c - 0x61 + 10
+    return -1
+
+
+def url_decode(data, start=0, end=None):
+    """Decodes data[start:end], which is URL-encoded bytes, to a str.
+
+    "+" becomes a space and "%XX" the byte XX; malformed escapes are kept
+    as-is. The bytes are decoded as UTF-8 once at the end.
+    """
+    if end is None:
+        end = len(data)
+    buf = _decode_buf
+    if end - start > len(buf):
+        buf = bytearray(end - start)
+    n = 0
+    i = start
+    while i < end:
+        c = data[i]
+        if c == PLUS:
+            c = 0x20
+        elif c == PERCENT and i + 2 < end:
+            hi = _hex_value(data[i + 1])
+            lo = _hex_value(data[i + 2])
+            if hi >= 0 and lo >= 0:
+                c = (hi << 4) | lo
+                i += 2
+        buf[n] = c
+        n += 1
+        i += 1
+    value = memoryview(buf)[:n]
+    try:
+        return str(value, "utf-8")
+    except UnicodeError:
+        # Not valid UTF-8, map each byte to the code point of the same value.
+        return "".join(chr(b) for b in value)
+
+
+def parse_form(body):
+    """Parses a form body like b"ssid=My%20Net&password=p%40ssword" into a
+    dict. body is usually a memoryview into the request buffer; fields are
+    located in place and only the decoded keys and values are allocated.
+    """
+    params = {}
+    start = 0
+    end = len(body)
+    while start < end:
+        amp = start
+        eq = -1
+        while amp < end and body[amp] != AMPERSAND:
+            if eq < 0 and body[amp] == EQUALS:
+                eq = amp
+            amp += 1
+        if eq >= 0:
+            params[url_decode(body, start, eq)] = url_decode(body, eq + 1, amp)
+        start = amp + 1
+    return params
@@ -1,4 +1,85 @@
-SETTINGS = None
-IP = None
+# State shared between the firmware's tasks.
+#
+# Values are only ever replaced, never changed in place: a writer builds a new
+# settings dict and passes it to STATE.set(), so a reader that fetched the
+# dict keeps a consistent copy. Every change bumps a version number, which
+# consumers compare instead of the values themselves.
 
-LCD_MESSAGE = "Connecting..."
+import _thread
+
+
+class State:
+    """A small key/value store with a lock, versions and change callbacks.
+
+    version grows by one with every change to any key; version_of() gives
+    the version at which the given keys last changed, so a consumer can
+    tell whether anything it shows is stale with a single comparison.
+    """
+
+    def __init__(self, **values):
+        self._lock = _thread.allocate_lock()
+        self._values = values
+        self._versions = {key: 0 for key in values}
+        self._subscribers = []
+        self.version = 0
+
+    def get(self, key):
+        with self._lock:
+            return self._values[key]
+
+    def snapshot(self, *keys):
+        """Reads keys (all keys if none are given) in one go. Returns
+        (version, values), version being that of the latest change to any
+        of the keys."""
+        with self._lock:
+            if not keys:
+                return self.version, dict(self._values)
+            version = max(self._versions[key] for key in keys)
+            return version, {key: self._values[key] for key in keys}
+
+    def version_of(self, *keys):
+        """Returns the version of the latest change to any of keys."""
+        with self._lock:
+            return max(self._versions[key] for key in keys)
+
+    def set(self, **changes):
+        """Replaces values; keys whose value is unchanged are skipped.
+        Returns the changed keys, after notifying the subscribers."""
+        changed = []
+        with self._lock:
+            for key, value in changes.items():
+                if key in self._values and self._values[key] == value:
+                    continue
+                self.version += 1
+                self._values[key] = value
+                self._versions[key] = self.version
+                changed.append(key)
+            subscribers = self._subscribers
+        # Callbacks run outside the lock, so they may read or set state.
+        if changed:
+            for keys, callback in subscribers:
+                if keys is None or any(key in keys for key in changed):
+                    callback(changed)
+        return changed
+
+    def subscribe(self, callback, keys=None):
+        """Calls callback(changed_keys) after every change to one of keys
+        (to any key if keys is None)."""
+        with self._lock:
+            self._subscribers = self._subscribers + [(keys, callback)]
+
+
+STATE = State(
+    settings=None,
+    ip=None,
+    # Published by wifi.WifiManager.
+    wifi_state="disconnected",
+    wifi_rssi=None,
+    lcd_message="Connecting...",
+    # "ringing", "snoozed" or None; published by alarms.Alarms.
+    alarm=None,
+    # Published by clock.clock_task: the local minute (local seconds // 60)
+    # and whether the backlight is on.
+    minute=None,
+    backlight=False,
+)
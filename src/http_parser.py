@@ -0,0 +1,196 @@
+# Incremental HTTP/1.x request parser working in a fixed, preallocated buffer.
+#
+# The request head is parsed line by line as bytes arrive, and the body is
+# read into the same buffer right after the head, so the peak RAM used per
+# request is the size of the buffer no matter what the client sends.
+
+CR = 0x0D
+LF = 0x0A
+COLON = 0x3A
+SPACE = 0x20
+
+MAX_HEAD = 1024  # request line plus headers
+MAX_BODY = 512  # the settings form is well under this
+
+# Headers the server acts on; all others are skipped without being stored.
+WANTED_HEADERS = (
+    "content-length",
+    "content-type",
+    "connection",
+    "if-none-match",
+    "if-match",
+    "accept-encoding",
+)
+
+
+class HttpError(Exception):
+    """Raised for requests that can't be served, with the HTTP status to
+    answer with."""
+
+    def __init__(self, status, reason):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+
+
+def _parse_int(buf, start, end):
+    # Parses a decimal number from buf[start:end] without allocating.
+    value = 0
+    while start < end and buf[start] == SPACE:
+        start += 1
+    while end > start and buf[end - 1] == SPACE:
+        end -= 1
+    if start == end:
+        raise HttpError(400, "Bad Request")
+    for i in range(start, end):
+        digit = buf[i] - 0x30
+        if not 0 <= digit <= 9:
+            raise HttpError(400, "Bad Request")
+        value = value * 10 + digit
+    return value
+
+
+class RequestParser:
+    """Reads one request at a time from an asyncio stream.
+
+    After read() returns True, method, path, headers and body describe the
+    request. body is a memoryview into the parser's buffer and is only
+    valid until the next call to read(). Bytes received after the request
+    (a pipelined next request) are kept for the next read() on the same
+    connection; release() drops them when the connection ends.
+    """
+
+    def __init__(self, max_head=MAX_HEAD, max_body=MAX_BODY):
+        self.max_head = max_head
+        self.max_body = max_body
+        self.buf = bytearray(max_head + max_body)
+        self.mv = memoryview(self.buf)
+        self.method = None
+        self.path = None
+        self.headers = {}
+        self.content_length = 0
+        self.body = self.mv[0:0]
+        self.http10 = False
+        self._end = 0  # end of the last request in buf
+        self._received = 0  # bytes in buf
+
+    def _reset(self):
+        self.method = None
+        self.path = None
+        self.headers = {}
+        self.content_length = 0
+        self.body = self.mv[0:0]
+        self.http10 = False
+
+    def release(self):
+        """Drops what was received after the last request. Must be called
+        before the parser is used for another connection, or that
+        connection would be answered this one's pipelined bytes."""
+        self._end = self._received = 0
+
+    @property
+    def keep_alive(self):
+        """True if the client wants the connection kept open."""
+        connection = self.headers.get("connection", "").lower()
+        if self.http10:
+            return connection == "keep-alive"
+        return connection != "close"
+
+    def _request_line(self, start, end):
+        # METHOD SP PATH SP VERSION
+        buf = self.buf
+        sp1 = start
+        while sp1 < end and buf[sp1] != SPACE:
+            sp1 += 1
+        sp2 = sp1 + 1
+        while sp2 < end and buf[sp2] != SPACE:
+            sp2 += 1
+        if sp1 >= end or sp2 > end or sp2 == sp1 + 1:
+            raise HttpError(400, "Bad Request")
+        self.method = str(self.mv[start:sp1], "ascii").upper()
+        self.path = str(self.mv[sp1 + 1 : sp2], "utf-8")
+        # HTTP/1.0 clients close the connection unless they ask otherwise.
+        self.http10 = end - sp2 == 9 and buf[end - 1] == 0x30
+
+    def _header_line(self, start, end):
+        buf = self.buf
+        colon = start
+        while colon < end and buf[colon] != COLON:
+            colon += 1
+        if colon == end:
+            raise HttpError(400, "Bad Request")
+        name_len = colon - start
+        for name in WANTED_HEADERS:
+            if len(name) != name_len:
+                continue
+            for i in range(name_len):
+                # ASCII lower-casing of the received name.
+                if buf[start + i] | 0x20 != ord(name[i]) | 0x20:
+                    break
+            else:
+                if name == "content-length":
+                    self.content_length = _parse_int(buf, colon + 1, end)
+                    if self.content_length > self.max_body:
+                        raise HttpError(413, "Payload Too Large")
+                else:
+                    self.headers[name] = str(self.mv[colon + 1 : end], "utf-8").strip()
+                return
+
+    async def read(self, reader):
+        """Reads and parses the next request from reader. Returns False if
+        the client closed the connection before sending anything.
+        Raises HttpError for malformed or oversized requests.
+        """
+        self._reset()
+        buf = self.buf
+        mv = self.mv
+        # Start with what was received after the previous request.
+        received = self._received - self._end  # bytes in buf
+        # Move them to the start of buf. Source and destination overlap;
+        # copying forwards is safe since the destination comes first.
+        src = self._end
+        for i in range(received):
+            buf[i] = buf[src + i]
+        self._end = self._received = 0
+        scanned = 0  # bytes already searched for line ends
+        line_start = 0
+        head_end = -1
+
+        # 1. Request line and headers, parsed one line at a time.
+        while True:
+            while scanned < received:
+                if buf[scanned] == LF:
+                    end = scanned
+                    if end > line_start and buf[end - 1] == CR:
+                        end -= 1
+                    if self.method is None:
+                        self._request_line(line_start, end)
+                    elif end == line_start:
+                        head_end = scanned + 1
+                        break
+                    else:
+                        self._header_line(line_start, end)
+                    line_start = scanned + 1
+                scanned += 1
+            if head_end >= 0:
+                break
+            if received == self.max_head:
+                raise HttpError(431, "Request Header Fields Too Large")
+            n = await reader.readinto(mv[received : self.max_head])
+            if not n:
+                if received == 0:
+                    return False
+                raise HttpError(400, "Bad Request")
+            received += n
+
+        # 2. Body, read into the buffer right after the head.
+        body_end = head_end + self.content_length
+        while received < body_end:
+            n = await reader.readinto(mv[received:body_end])
+            if not n:
+                raise HttpError(400, "Bad Request")
+            received += n
+        self.body = mv[head_end:body_end]
+        self._end = body_end
+        self._received = received
+        return True
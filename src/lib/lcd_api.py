@@ -135,6 +135,9 @@ class LcdApi:
     def putchar(self, char):
         """Writes the indicated character to the LCD at the current cursor
         position, and advances the cursor by one position.
+
+        The LCD auto-increments its address after each write, so a new
+        address is only sent when the cursor wraps to another line.
         """
         if char == '\n':
             if self.implied_newline:
@@ -147,9 +150,13 @@ class LcdApi:
             self.hal_write_data(ord(char))
             self.cursor_x += 1
         if self.cursor_x >= self.num_columns:
-            self.cursor_x = 0
-            self.cursor_y += 1
-            self.implied_newline = (char != '\n')
+            self._wrap(char != '\n')
+
+    def _wrap(self, implied):
+        """Moves the cursor to the start of the next line."""
+        self.cursor_x = 0
+        self.cursor_y += 1
+        self.implied_newline = implied
         if self.cursor_y >= self.num_lines:
             self.cursor_y = 0
         self.move_to(self.cursor_x, self.cursor_y)
@@ -157,9 +164,39 @@ class LcdApi:
     def putstr(self, string):
         """Write the indicated string to the LCD at the current cursor
         position and advances the cursor position appropriately.
+
+        Characters up to the end of the line or the next newline are sent
+        as one run, relying on the LCD to auto-increment its address.
         """
-        for char in string:
-            self.putchar(char)
+        if isinstance(string, str):
+            data = string.encode()
+            if len(data) != len(string):
+                # Characters outside ASCII don't map to one byte each.
+                for char in string:
+                    self.putchar(char)
+                return
+        else:
+            data = string
+        start = 0
+        end = len(data)
+        while start < end:
+            if self.cursor_x >= self.num_columns:
+                # The cursor was left past the end of the line, e.g. by a
+                # framebuffer that filled it; go on on the next one.
+                self._wrap(True)
+            stop = min(end, start + self.num_columns - self.cursor_x)
+            i = start
+            while i < stop and data[i] != 0x0a:
+                i += 1
+            if i > start:
+                self.hal_write_data_bytes(data, start, i)
+                self.cursor_x += i - start
+                if self.cursor_x >= self.num_columns:
+                    self._wrap(True)
+            if i < end and data[i] == 0x0a:
+                self.putchar('\n')
+                i += 1
+            start = i
 
     def custom_char(self, location, charmap):
         """Write a character to one of the 8 CGRAM locations, available
@@ -203,6 +240,17 @@ class LcdApi:
         """
         raise NotImplementedError
 
+    def hal_write_data_bytes(self, data, start=0, end=None):
+        """Write data[start:end] to the LCD.
+
+        A derived HAL class may override this to send the bytes in a
+        single transaction. The default sends them one at a time.
+        """
+        if end is None:
+            end = len(data)
+        for i in range(start, end):
+            self.hal_write_data(data[i])
+
     # This is a default implementation of hal_sleep_us which is suitable
     # for most micropython implementations. For platforms which don't
     # support `time.sleep_us()` they should provide their own implementation
@@ -0,0 +1,96 @@
+# Four-line-high digits for HD44780 character LCDs.
+#
+# Each digit is 3 cells wide and 4 lines high and is drawn on a grid of
+# half-cells: every character cell is split into an upper and a lower half,
+# which gives 3 x 8 "pixels" per digit. A cell then shows one of four
+# things: nothing, the upper half, the lower half or both. Both is the ROM's
+# full block (0xFF), so the whole font needs only two custom glyphs, plus
+# one for the colon dots.
+
+FULL = 0xFF
+SPACE = 0x20
+
+UPPER = b"\x1f\x1f\x1f\x1f\x00\x00\x00\x00"
+LOWER = b"\x00\x00\x00\x00\x1f\x1f\x1f\x1f"
+DOT = b"\x00\x00\x0e\x0e\x0e\x00\x00\x00"
+
+DIGIT_WIDTH = 3
+HEIGHT = 4
+
+# Half-rows, top to bottom, 3 bits each (the leftmost column is 0b100).
+_DIGITS = (
+    (0b111, 0b101, 0b101, 0b101, 0b101, 0b101, 0b101, 0b111),  # 0
+    (0b010, 0b110, 0b010, 0b010, 0b010, 0b010, 0b010, 0b111),  # 1
+    (0b111, 0b001, 0b001, 0b111, 0b100, 0b100, 0b100, 0b111),  # 2
+    (0b111, 0b001, 0b001, 0b111, 0b001, 0b001, 0b001, 0b111),  # 3
+    (0b101, 0b101, 0b101, 0b111, 0b001, 0b001, 0b001, 0b001),  # 4
+    (0b111, 0b100, 0b100, 0b111, 0b001, 0b001, 0b001, 0b111),  # 5
+    (0b111, 0b100, 0b100, 0b111, 0b101, 0b101, 0b101, 0b111),  # 6
+    (0b111, 0b001, 0b001, 0b001, 0b001, 0b001, 0b001, 0b001),  # 7
+    (0b111, 0b101, 0b101, 0b111, 0b101, 0b101, 0b101, 0b111),  # 8
+    (0b111, 0b101, 0b101, 0b111, 0b001, 0b001, 0b001, 0b111),  # 9
+)
+
+
+def _cells(digit):
+    # Cell kinds, row by row: 0 empty, 1 upper, 2 lower, 3 full.
+    rows = _DIGITS[digit]
+    cells = bytearray(DIGIT_WIDTH * HEIGHT)
+    for y in range(HEIGHT):
+        top = rows[2 * y]
+        bottom = rows[2 * y + 1]
+        for x in range(DIGIT_WIDTH):
+            bit = 1 << (DIGIT_WIDTH - 1 - x)
+            cells[y * DIGIT_WIDTH + x] = (1 if top & bit else 0) | (
+                2 if bottom & bit else 0
+            )
+    return cells
+
+
+_CELLS = [_cells(digit) for digit in range(10)]
+
+
+class BigDigits:
+    """Draws big digits into an LcdFramebuffer, using a GlyphCache for the
+    custom characters."""
+
+    def __init__(self, fb, glyphs):
+        self.fb = fb
+        self.glyphs = glyphs
+        self._codes = bytearray(4)  # code for each cell kind
+
+    def begin(self):
+        """Looks up the glyphs for the frame being drawn. Call after
+        glyphs.begin_frame() and before drawing digits."""
+        codes = self._codes
+        codes[0] = SPACE
+        codes[1] = self.glyphs.code(UPPER)
+        codes[2] = self.glyphs.code(LOWER)
+        codes[3] = FULL
+
+    def digit(self, x, digit):
+        """Draws digit (0-9) with its top left corner at column x."""
+        cells = _CELLS[digit]
+        codes = self._codes
+        back = self.fb.back
+        for y in range(HEIGHT):
+            row = back[y]
+            for i in range(DIGIT_WIDTH):
+                row[x + i] = codes[cells[y * DIGIT_WIDTH + i]]
+
+    def colon(self, x):
+        """Draws the two dots of a colon in column x."""
+        dot = self.glyphs.code(DOT)
+        back = self.fb.back
+        back[1][x] = dot
+        back[2][x] = dot
+
+    def time(self, x, hours, minutes):
+        """Draws HH:MM starting at column x, 17 columns wide. Returns the
+        first column after it."""
+        self.digit(x, hours // 10)
+        self.digit(x + 4, hours % 10)
+        self.colon(x + 8)
+        self.digit(x + 10, minutes // 10)
+        self.digit(x + 14, minutes % 10)
+        return x + 17
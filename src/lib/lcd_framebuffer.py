@@ -0,0 +1,105 @@
+# Keeps a shadow copy of an HD44780 character LCD in RAM and only sends the
+# cells which differ from what the panel is currently showing.
+
+SPACE = 0x20
+
+
+class LcdFramebuffer:
+    """Implements a shadow framebuffer on top of an LcdApi instance.
+
+    Drawing functions (clear, move_to, putstr) only modify the back buffer.
+    Calling show() compares the back buffer with a shadow of what the panel
+    is showing and sends DDRAM moves and data bytes for the cells that
+    actually changed.
+    """
+
+    def __init__(self, lcd):
+        self.lcd = lcd
+        self.num_lines = lcd.num_lines
+        self.num_columns = lcd.num_columns
+        self.cursor_x = 0
+        self.cursor_y = 0
+        # The LcdApi constructor clears the panel, so both buffers start blank.
+        self.back = [bytearray(b" " * self.num_columns) for _ in range(self.num_lines)]
+        self.shadow = [bytearray(b" " * self.num_columns) for _ in range(self.num_lines)]
+
+    def clear(self):
+        """Blanks the back buffer and moves the cursor to the top left
+        corner. Nothing is sent to the LCD until show() is called.
+        """
+        for row in self.back:
+            for x in range(self.num_columns):
+                row[x] = SPACE
+        self.cursor_x = 0
+        self.cursor_y = 0
+
+    def move_to(self, cursor_x, cursor_y):
+        """Moves the back buffer cursor to the indicated position."""
+        self.cursor_x = cursor_x
+        self.cursor_y = cursor_y
+
+    def putchar(self, char):
+        """Writes a character into the back buffer at the cursor position,
+        following the same wrapping rules as LcdApi.putchar.
+        """
+        if char == "\n":
+            self.cursor_x = self.num_columns
+        else:
+            self.back[self.cursor_y][self.cursor_x] = ord(char)
+            self.cursor_x += 1
+        if self.cursor_x >= self.num_columns:
+            self.cursor_x = 0
+            self.cursor_y += 1
+        if self.cursor_y >= self.num_lines:
+            self.cursor_y = 0
+
+    def putstr(self, string):
+        """Writes a string into the back buffer at the cursor position."""
+        for char in string:
+            self.putchar(char)
+
+    def invalidate(self):
+        """Forgets what the panel shows, so the next show() redraws every
+        cell. Use this after the LCD was written to behind our back.
+        """
+        for y in range(self.num_lines):
+            back = self.back[y]
+            shadow = self.shadow[y]
+            for x in range(self.num_columns):
+                shadow[x] = back[x] ^ 0xFF
+
+    def show(self):
+        """Sends the cells that differ between the back buffer and the panel.
+
+        Dirty cells on a row are grouped into runs. Runs separated by a
+        single clean cell are merged, since rewriting one cell costs the same
+        as a DDRAM move. Returns the number of data bytes sent.
+        """
+        lcd = self.lcd
+        sent = 0
+        for y in range(self.num_lines):
+            back = self.back[y]
+            shadow = self.shadow[y]
+            x = 0
+            while x < self.num_columns:
+                if back[x] == shadow[x]:
+                    x += 1
+                    continue
+                start = x
+                end = x + 1
+                x += 1
+                while x < self.num_columns:
+                    if back[x] != shadow[x]:
+                        end = x + 1
+                    elif x - end >= 1:
+                        break
+                    x += 1
+                if lcd.cursor_x != start or lcd.cursor_y != y:
+                    lcd.move_to(start, y)
+                lcd.hal_write_data_bytes(back, start, end)
+                for i in range(start, end):
+                    shadow[i] = back[i]
+                # The HD44780 auto-increments the DDRAM address after a write.
+                lcd.cursor_x = end
+                sent += end - start
+        return sent
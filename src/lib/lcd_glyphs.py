@@ -0,0 +1,64 @@
+# Keeps track of the glyphs in the 8 CGRAM slots of an HD44780 so custom
+# characters are only uploaded when they aren't on the panel already.
+
+
+class GlyphCache:
+    """Maps glyphs (8-byte bitmaps) to CGRAM character codes 0-7.
+
+    code() returns the code of a glyph, uploading it first if no slot
+    holds it. When all slots are taken, the least recently used slot whose
+    glyph wasn't used in the current frame is replaced; call begin_frame()
+    before drawing each frame, so glyphs still needed on screen are never
+    evicted underneath it.
+    """
+
+    SLOTS = 8
+
+    def __init__(self, lcd):
+        self.lcd = lcd
+        self.glyphs = [None] * self.SLOTS  # glyph in each slot
+        self._used = [0] * self.SLOTS  # use counter value at last use
+        self._clock = 0
+        self._frame_start = 0
+        self.uploads = 0
+        self.misses = 0  # glyphs that didn't fit in a frame
+
+    def begin_frame(self):
+        """Marks the start of a new frame."""
+        self._clock += 1
+        self._frame_start = self._clock
+
+    def code(self, glyph, fallback=0x20):
+        """Returns the character code showing glyph, a bytes object of 8
+        rows (5 bits each). Returns fallback if all 8 slots are needed by
+        other glyphs of the current frame.
+        """
+        self._clock += 1
+        glyphs = self.glyphs
+        for slot in range(self.SLOTS):
+            if glyphs[slot] == glyph:
+                self._used[slot] = self._clock
+                return slot
+        victim = -1
+        for slot in range(self.SLOTS):
+            if glyphs[slot] is None:
+                victim = slot
+                break
+            if self._used[slot] < self._frame_start and (
+                victim < 0 or self._used[slot] < self._used[victim]
+            ):
+                victim = slot
+        if victim < 0:
+            self.misses += 1
+            return fallback
+        self.lcd.custom_char(victim, glyph)
+        glyphs[victim] = glyph
+        self._used[victim] = self._clock
+        self.uploads += 1
+        return victim
+
+    def invalidate(self):
+        """Forgets the CGRAM contents, e.g. after the LCD was reset."""
+        for slot in range(self.SLOTS):
+            self.glyphs[slot] = None
+            self._used[slot] = 0
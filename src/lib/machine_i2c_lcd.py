@@ -3,7 +3,7 @@
 # https://github.com/dhylands/python_lcd/blob/master/lcd/machine_i2c_lcd.py
 
 from lcd_api import LcdApi
-from time import sleep_ms
+from time import sleep_ms, ticks_diff, ticks_us
 
 # The PCF8574 has a jumper selectable address: 0x20 - 0x27
 DEFAULT_I2C_ADDR = 0x27
@@ -15,6 +15,7 @@ MASK_RW = 0x02
 MASK_E = 0x04
 SHIFT_BACKLIGHT = 3
 SHIFT_DATA = 4
+MASK_BACKLIGHT = 1 << SHIFT_BACKLIGHT
 
 
 class I2cLcd(LcdApi):
@@ -23,7 +24,22 @@ class I2cLcd(LcdApi):
     def __init__(self, i2c, i2c_addr, num_lines, num_columns):
         self.i2c = i2c
         self.i2c_addr = i2c_addr
-        self.i2c.writeto(self.i2c_addr, bytearray([0]))
+        # Bus statistics, for the metrics endpoint.
+        self.writes = 0
+        self.bytes_sent = 0
+        self.write_us = 0
+        # Preallocated transmit buffers, so writes don't allocate. The batch
+        # buffer holds one line worth of characters, and a memoryview of each
+        # possible length is created up front since slicing allocates.
+        self._cmd_buf = bytearray(4)
+        self._byte_buf = bytearray(1)
+        # The last byte sent, i.e. the state of the PCF8574's outputs.
+        self._last_byte = 0
+        self._batch_len = max(num_columns, 1)
+        self._batch_buf = bytearray(self._batch_len << 2)
+        batch_mv = memoryview(self._batch_buf)
+        self._batch_views = [batch_mv[:i << 2] for i in range(self._batch_len + 1)]
+        self._write_byte(0)
         sleep_ms(20)   # Allow LCD time to powerup
         # Send reset 3 times
         self.hal_write_init_nibble(self.LCD_FUNCTION_RESET)
@@ -47,37 +63,97 @@ class I2cLcd(LcdApi):
         This particular function is only used during initialization.
         """
         byte = ((nibble >> 4) & 0x0f) << SHIFT_DATA
-        self.i2c.writeto(self.i2c_addr, bytearray([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytearray([byte]))
+        self._write_byte(byte | MASK_E)
+        self._write_byte(byte)
 
     def hal_backlight_on(self):
-        """Allows the hal layer to turn the backlight on."""
-        self.i2c.writeto(self.i2c_addr, bytearray([1 << SHIFT_BACKLIGHT]))
+        """Allows the hal layer to turn the backlight on.
+
+        Only the backlight bit changes; the other PCF8574 outputs keep the
+        level they were last written with, with E low.
+        """
+        byte = self._last_byte & ~(MASK_E | MASK_BACKLIGHT)
+        self._write_byte(byte | MASK_BACKLIGHT)
 
     def hal_backlight_off(self):
         """Allows the hal layer to turn the backlight off."""
-        self.i2c.writeto(self.i2c_addr, bytearray([0]))
+        self._write_byte(self._last_byte & ~(MASK_E | MASK_BACKLIGHT))
 
     def hal_write_command(self, cmd):
         """Writes a command to the LCD.
 
         Data is latched on the falling edge of E.
         """
-        byte = ((self.backlight << SHIFT_BACKLIGHT) | (((cmd >> 4) & 0x0f) << SHIFT_DATA))
-        self.i2c.writeto(self.i2c_addr, bytearray([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytearray([byte]))
-        byte = ((self.backlight << SHIFT_BACKLIGHT) | ((cmd & 0x0f) << SHIFT_DATA))
-        self.i2c.writeto(self.i2c_addr, bytearray([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytearray([byte]))
+        self._pack(self._cmd_buf, 0, cmd, self.backlight << SHIFT_BACKLIGHT)
+        self._write(self._cmd_buf)
         if cmd <= 3:
             # The home and clear commands require a worst case delay of 4.1 msec
             sleep_ms(5)
 
     def hal_write_data(self, data):
         """Write data to the LCD."""
-        byte = (MASK_RS | (self.backlight << SHIFT_BACKLIGHT) | (((data >> 4) & 0x0f) << SHIFT_DATA))
-        self.i2c.writeto(self.i2c_addr, bytearray([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytearray([byte]))
-        byte = (MASK_RS | (self.backlight << SHIFT_BACKLIGHT) | ((data & 0x0f) << SHIFT_DATA))
-        self.i2c.writeto(self.i2c_addr, bytearray([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytearray([byte]))
+        self._pack(self._cmd_buf, 0, data, MASK_RS | (self.backlight << SHIFT_BACKLIGHT))
+        self._write(self._cmd_buf)
+
+    def hal_write_data_bytes(self, data, start=0, end=None):
+        """Writes data[start:end] to the LCD using as few I2C transactions
+        as possible.
+
+        The E-high/E-low frames for up to one line of characters are packed
+        into a preallocated buffer and sent with a single writeto. At 400 kHz
+        each character takes four bus bytes (~90 usec), which is longer than
+        the 37 usec the HD44780 needs to execute a data write.
+        """
+        if end is None:
+            end = len(data)
+        flags = MASK_RS | (self.backlight << SHIFT_BACKLIGHT)
+        buf = self._batch_buf
+        while start < end:
+            count = min(end - start, self._batch_len)
+            for i in range(count):
+                self._pack(buf, i << 2, data[start + i], flags)
+            self._write(self._batch_views[count])
+            start += count
+
+    def custom_char(self, location, charmap):
+        """Write a character to one of the 8 CGRAM locations, available
+        as chr(0) through chr(7).
+
+        The CGRAM address command and the 8 rows are sent in one I2C
+        transaction. No delays are needed between them: each byte takes
+        four bus bytes, which is longer than the HD44780 needs to execute it.
+        """
+        if self._batch_len < 9:
+            LcdApi.custom_char(self, location, charmap)
+            return
+        buf = self._batch_buf
+        flags = self.backlight << SHIFT_BACKLIGHT
+        self._pack(buf, 0, self.LCD_CGRAM | ((location & 0x7) << 3), flags)
+        for i in range(8):
+            self._pack(buf, (i + 1) << 2, charmap[i], MASK_RS | flags)
+        self._write(self._batch_views[9])
+        self.move_to(self.cursor_x, self.cursor_y)
+
+    def _write(self, buf):
+        """Sends buf to the PCF8574 and updates the bus statistics."""
+        start = ticks_us()
+        self.i2c.writeto(self.i2c_addr, buf)
+        self._last_byte = buf[len(buf) - 1]
+        self.write_us += ticks_diff(ticks_us(), start)
+        self.writes += 1
+        self.bytes_sent += len(buf)
+
+    def _write_byte(self, byte):
+        """Sends a single byte to the PCF8574."""
+        self._byte_buf[0] = byte
+        self._write(self._byte_buf)
+
+    @staticmethod
+    def _pack(buf, offset, value, flags):
+        """Packs the four PCF8574 frames for one byte into buf at offset."""
+        byte = flags | (((value >> 4) & 0x0f) << SHIFT_DATA)
+        buf[offset] = byte | MASK_E
+        buf[offset + 1] = byte
+        byte = flags | ((value & 0x0f) << SHIFT_DATA)
+        buf[offset + 2] = byte | MASK_E
+        buf[offset + 3] = byte
@@ -1,51 +1,24 @@
 # MicroPython HTTP Web Server for ESP32
 #
-# Connects to Wi-Fi and starts a simple socket server on port 80.
-# Serves a basic HTML page showing the device's IP address.
-
-from clock import clock_task
-import network  # type: ignore
-import time
-from settings import load_settings, save_settings
+# Connects to Wi-Fi in the background and starts a simple web server on
+# port 80. Serves a basic HTML page showing the device's settings.
+
+import asyncio
+from alarm_signal import SIGNAL
+from alarms import ALARMS
+from clock import clock_task, local_time
+import eventlog
+from eventlog import EVENTLOG
+from settings import STORE
 from webserver import start_web_server
-import _thread
-import globals
+from globals import STATE
+import metrics
+import scheduler
+import wifi
+from timesync import SYNC
 
 # --- 1. WiFi Connection Setup ---
-
-
-def connect_to_wifi(ssid, password):
-    # Initializes and connects the ESP32 to the specified Wi-Fi network.
-    sta_if = network.WLAN(network.STA_IF)
-
-    if not sta_if.isconnected():
-        print("Connecting to network...")
-        sta_if.active(True)
-        sta_if.connect(ssid, password)
-
-        # Wait up to 10 seconds for connection
-        max_wait = 10
-        while max_wait > 0:
-            if sta_if.isconnected():
-                break
-            max_wait -= 1
-            print(".", end="")
-            time.sleep(1)
-
-        if sta_if.isconnected():
-            ip_info = sta_if.ifconfig()
-            print("\nConnection successful!")
-            print("IP Address:", ip_info[0])
-            return ip_info[0]  # Return the assigned IP address
-        else:
-            print("\nConnection failed! Check credentials.")
-            return None
-
-    else:
-        # Already connected
-        ip_info = sta_if.ifconfig()
-        print("Already connected. IP:", ip_info[0])
-        return ip_info[0]
+# Handled in the background by wifi.WifiManager, started from run().
 
 
 # --- 2. HTML Content Generator ---
@@ -53,41 +26,70 @@ def connect_to_wifi(ssid, password):
 
 # --- 3. Main Server Loop ---
 
+# Hardware watchdog timeout, fed by metrics.watchdog(): the board resets if
+# the event loop hangs for this long. None leaves the watchdog off, which
+# keeps the REPL usable after stopping the program.
+WDT_TIMEOUT_MS = None
+
 
 def main():
-    globals.SETTINGS = load_settings("settings.json")
-    if (globals.SETTINGS["ssid"] is None) or (globals.SETTINGS["password"] is None):
-        globals.LCD_MESSAGE = "No WiFi settings!\nFlash manually."
-        print("No WiFi settings found. Please flash manually.")
+    # The log is opened first, so the boot is logged before anything else.
+    EVENTLOG.open()
+    # Missing settings get their defaults in memory; nothing is written
+    # until something changes.
+    settings = STORE.load()
+    STATE.set(settings=settings)
+    if (settings["ssid"] is None) or (settings["password"] is None):
+        STATE.set(lcd_message="No WiFi settings!\nFlash manually.")
+        EVENTLOG.log(eventlog.NO_WIFI_SETTINGS)
+        EVENTLOG.flush()
         return
 
-    if not globals.SETTINGS:
-        globals.LCD_MESSAGE = "No WiFi settings!\nFlash manually."
-        print("No WiFi settings found. Please flash manually.")
-        return
+    asyncio.run(run())
 
-    print("Loaded settings:", globals.SETTINGS)
 
-    if ("summer" not in globals.SETTINGS) or ("winter" not in globals.SETTINGS):
-        globals.SETTINGS["summer"] = 2
-        globals.SETTINGS["winter"] = 1
-        save_settings("settings.json", globals.SETTINGS)
+def _on_wifi_change(state):
+    # Resync as soon as the network is back.
+    if state == wifi.CONNECTED:
+        SYNC.request_sync()
 
-    if "alarm_hour" not in globals.SETTINGS:
-        globals.SETTINGS["alarm_hour"] = [7, 0]  # Default alarm time 07:00
-        save_settings("settings.json", globals.SETTINGS)
 
-    globals.IP = connect_to_wifi(globals.SETTINGS["ssid"], globals.SETTINGS["password"])
-    if not globals.IP:
-        globals.LCD_MESSAGE = "WiFi Conn. failed!\nFlash manually."
-        print("WiFi Connection failed. Please flash manually.")
-        return
+def _on_button():
+    # The BOOT button stops a ringing or snoozed alarm.
+    ALARMS.stop(local_time())
+
+
+def _on_display_change(changed):
+    # Wakes the clock to redraw when something it shows changes.
+    scheduler.wake()
+
 
-    _thread.start_new_thread(clock_task, ())
+async def run():
+    # Wi-Fi, the clock, time sync and the web server run as cooperative
+    # tasks in one loop; none of them waits for the network. The clock
+    # redraws as soon as the first sync completes.
+    settings = STATE.get("settings")
+    manager = wifi.WifiManager(settings["ssid"], settings["password"])
+    manager.on_change(_on_wifi_change)
+    STATE.subscribe(
+        _on_display_change, ("settings", "lcd_message", "wifi_state", "alarm")
+    )
+    SYNC.on_sync(scheduler.wake)
+    SIGNAL.attach_buzzer()
+    SIGNAL.attach_button()
+    SIGNAL.on_button(_on_button)
+    SIGNAL.watch()
+    asyncio.create_task(manager.run())
+    asyncio.create_task(STORE.run())
+    asyncio.create_task(EVENTLOG.run())
+    asyncio.create_task(SYNC.run())
+    asyncio.create_task(clock_task())
+    asyncio.create_task(SIGNAL.run())
+    asyncio.create_task(metrics.watchdog(WDT_TIMEOUT_MS))
 
-    globals.LCD_MESSAGE = None
+    STATE.set(lcd_message=None)
 
-    start_web_server()
+    await start_web_server()
 
 
 # --- 4. Initialization ---
@@ -0,0 +1,183 @@
+# Counters, gauges and fixed-bucket histograms, served at /metrics in the
+# Prometheus text format.
+#
+# Metrics are created at import time by the modules that update them and
+# cost a few integer operations per update; nothing is allocated until the
+# endpoint is scraped. Values that other objects already count (the LCD's
+# bus statistics, settings writes) are read through a function at scrape
+# time instead of being copied on every change.
+
+import asyncio
+import gc
+import time
+import eventlog
+from eventlog import EVENTLOG
+
+_registry = []
+
+# Uptime is kept as the ms up to _uptime_mark plus the ticks since then.
+# ticks_ms wraps (at 2^30 ms on the ESP32) and ticks_diff only holds for
+# half of that, so watchdog() moves the mark forward on every tick.
+_uptime_ms = 0
+_uptime_mark = time.ticks_ms()
+
+
+class Counter:
+    """A value that only goes up. With fn, the value is fn() at scrape
+    time."""
+
+    kind = "counter"
+
+    def __init__(self, name, help, fn=None):
+        self.name = name
+        self.help = help
+        self.value = 0
+        self.fn = fn
+        _registry.append(self)
+
+    def inc(self, n=1):
+        self.value += n
+
+    def samples(self, out):
+        value = self.value if self.fn is None else self.fn()
+        out.append("%s %s\n" % (self.name, value))
+
+
+class Gauge(Counter):
+    """A value that goes up and down."""
+
+    kind = "gauge"
+
+    def set(self, value):
+        self.value = value
+
+
+class Histogram:
+    """Counts observations in fixed buckets, per label value.
+
+    buckets are the upper bounds, in increasing order. label is the name
+    of the one label the series are split by (None for a single series);
+    the caller keeps its values to a small fixed set.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets, label=None):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.label = label
+        self._series = {}  # label value: [count per bucket..., over the last, sum]
+        _registry.append(self)
+
+    def observe(self, value, label_value=""):
+        series = self._series.get(label_value)
+        if series is None:
+            series = self._series[label_value] = [0] * (len(self.buckets) + 2)
+        i = 0
+        for bound in self.buckets:
+            if value <= bound:
+                break
+            i += 1
+        series[i] += 1
+        series[-1] += value
+
+    def samples(self, out):
+        for label_value, series in self._series.items():
+            labels = ""
+            if self.label is not None:
+                labels = '%s="%s",' % (self.label, label_value)
+            total = 0
+            for i, bound in enumerate(self.buckets):
+                total += series[i]
+                out.append(
+                    '%s_bucket{%sle="%s"} %d\n' % (self.name, labels, bound, total)
+                )
+            total += series[-2]
+            out.append('%s_bucket{%sle="+Inf"} %d\n' % (self.name, labels, total))
+            labels = "{%s}" % labels[:-1] if labels else ""
+            out.append("%s_sum%s %s\n" % (self.name, labels, series[-1]))
+            out.append("%s_count%s %d\n" % (self.name, labels, total))
+
+
+def render():
+    """Returns all metrics in the Prometheus text format, as a list of
+    bytes chunks (one per metric)."""
+    chunks = []
+    for metric in _registry:
+        out = [
+            "# HELP %s %s\n" % (metric.name, metric.help),
+            "# TYPE %s %s\n" % (metric.name, metric.kind),
+        ]
+        metric.samples(out)
+        chunks.append("".join(out).encode())
+    return chunks
+
+
+def elapsed_ms(start_ms):
+    return time.ticks_diff(time.ticks_ms(), start_ms)
+
+
+# --- Heap ---
+
+HEAP_FREE = Gauge("heap_free_bytes", "Free heap at scrape time.", fn=gc.mem_free)
+HEAP_FREE_LOW = Gauge("heap_free_low_bytes", "Lowest free heap seen since boot.")
+HEAP_FREE_LOW.value = gc.mem_free()
+
+
+def sample_heap():
+    # Updates the free heap low-water mark.
+    free = gc.mem_free()
+    if free < HEAP_FREE_LOW.value:
+        HEAP_FREE_LOW.value = free
+
+
+# --- Event loop ---
+
+UPTIME = Gauge(
+    "uptime_seconds",
+    "Seconds since boot.",
+    fn=lambda: (_uptime_ms + elapsed_ms(_uptime_mark)) // 1000,
+)
+LOOP_LATENESS = Histogram(
+    "loop_lateness_ms",
+    "How late the watchdog's periodic wakeups run; high means a blocked loop.",
+    (2, 5, 10, 20, 50, 100, 200, 500, 1000),
+)
+LOOP_STALLS = Counter("loop_stalls_total", "Wakeups late by more than STALL_MS.")
+LOOP_STALL_MAX = Gauge("loop_stall_max_ms", "Longest event loop stall since boot.")
+
+WATCHDOG_INTERVAL_MS = 1000
+STALL_MS = 500
+
+
+async def watchdog(wdt_timeout_ms=None):
+    """Measures event loop stalls and samples the heap, forever.
+
+    With wdt_timeout_ms, the hardware watchdog is also fed from here, so a
+    loop that stops running for that long resets the board.
+    """
+    global _uptime_ms, _uptime_mark
+    wdt = None
+    if wdt_timeout_ms is not None:
+        from machine import WDT  # type: ignore
+
+        wdt = WDT(timeout=wdt_timeout_ms)
+    while True:
+        start = time.ticks_ms()
+        await asyncio.sleep_ms(WATCHDOG_INTERVAL_MS)
+        now = time.ticks_ms()
+        _uptime_ms += time.ticks_diff(now, _uptime_mark)
+        _uptime_mark = now
+        late = time.ticks_diff(now, start) - WATCHDOG_INTERVAL_MS
+        if late < 0:
+            late = 0
+        LOOP_LATENESS.observe(late)
+        if late > STALL_MS:
+            LOOP_STALLS.inc()
+            EVENTLOG.log(eventlog.LOOP_STALL, late)
+        if late > LOOP_STALL_MAX.value:
+            LOOP_STALL_MAX.value = late
+        sample_heap()
+        if wdt is not None:
+            wdt.feed()
@@ -0,0 +1,59 @@
+# Works out how long the clock loop can sleep before it has something to do,
+# and sleeps until then.
+
+import asyncio
+import time
+import metrics
+from timesync import SYNC
+
+_wake = asyncio.Event()
+
+LATENESS = metrics.Histogram(
+    "clock_wakeup_lateness_ms",
+    "How late the clock loop wakes up after a timed sleep.",
+    (1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+
+
+def wake():
+    # Ends the clock loop's current sleep, e.g. after the settings or the
+    # LCD message changed.
+    _wake.set()
+
+
+def ms_until_next_minute():
+    # Milliseconds until the (drift corrected) wall clock reaches the next
+    # whole minute.
+    return 60000 - SYNC.now_ms() % 60000
+
+
+class ClockScheduler:
+    """Sleeps the clock loop until its next deadline.
+
+    The caller passes the deadlines it knows about (alarm blink, backlight
+    timeout); the next minute boundary is always included, since that is
+    when the displayed time changes. Sleeping ends early when wake() is
+    called.
+    """
+
+    def timeout_ms(self, *deadlines_ms):
+        """Returns the time until the earliest of the next minute boundary
+        and the given deadlines (in ms from now, None to ignore).
+        """
+        timeout = ms_until_next_minute()
+        for deadline in deadlines_ms:
+            if deadline is not None and deadline < timeout:
+                timeout = deadline
+        return max(timeout, 0)
+
+    async def sleep(self, timeout_ms):
+        """Sleeps for timeout_ms. Returns True if woken early by wake()."""
+        start = time.ticks_ms()
+        try:
+            await asyncio.wait_for(_wake.wait(), timeout_ms / 1000)
+            woken = True
+        except asyncio.TimeoutError:
+            woken = False
+            LATENESS.observe(max(metrics.elapsed_ms(start) - timeout_ms, 0))
+        _wake.clear()
+        return woken
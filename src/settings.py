@@ -1,21 +1,142 @@
+import asyncio
 import json
+import os
+import eventlog
+from eventlog import EVENTLOG
 
+# Every setting with its default. Missing keys are filled in on load.
+DEFAULTS = {
+    "ssid": None,
+    "password": None,
+    "summer": 2,
+    "winter": 1,
+    # One alarm at 07:00 every day; see alarms.py for the format.
+    "alarms": [{"time": [7, 0], "days": 0b1111111, "enabled": True}],
+    "dst_rule": "eu",
+    "display_mode": "text",  # or "big": four-line digits on a 20x4 panel
+    "alarm_signal": "blink",  # a pattern from alarm_signal.PATTERNS
+}
 
-def save_settings(file, settings_dict):
-    try:
-        with open(file, "w") as f:
-            json.dump(settings_dict, f)
-        print("Settings saved successfully.")
-    except Exception as e:
-        print(f"Error saving settings: {e}")
+FLUSH_DELAY_MS = 2000  # changes are written once no new one came in for this long
 
 
-def load_settings(file):
+def _write_atomic(file, text):
+    # Writes to a temporary file and renames it over the original, so a
+    # power loss leaves either the old or the new file, never half of one.
+    tmp = file + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
     try:
-        with open(file, "r") as f:
-            settings_dict = json.load(f)
-        print("Settings loaded successfully.")
-        return settings_dict
-    except Exception as e:
-        print(f"Error loading settings: {e}")
-        return None
+        os.rename(tmp, file)
+    except OSError:
+        # FAT can't rename over an existing file.
+        os.remove(file)
+        os.rename(tmp, file)
+
+
+def _copy(value):
+    # Defaults are copied so loaded settings never share lists with them.
+    if isinstance(value, (list, dict)):
+        return json.loads(json.dumps(value))
+    return value
+
+
+def _read(file):
+    with open(file, "r") as f:
+        return f.read()
+
+
+class SettingsStore:
+    """Caches the settings in RAM and writes them back to flash lazily.
+
+    Changes are coalesced: run() writes FLUSH_DELAY_MS after the last
+    change, and only if the serialized settings differ from what is on
+    flash. Writes are atomic (temp file + rename).
+    """
+
+    def __init__(self, file, defaults=DEFAULTS):
+        self.file = file
+        self.defaults = defaults
+        self.data = None
+        self.writes = 0
+        self._saved = None  # copy of the settings currently on flash
+        self._changed = asyncio.Event()
+
+    def load(self):
+        """Reads the settings and applies the defaults in one pass.
+
+        Falls back to a leftover temporary file if the settings file is
+        missing or unreadable, and to the defaults if both are.
+        """
+        data = None
+        for file in (self.file, self.file + ".tmp"):
+            try:
+                text = _read(file)
+                data = json.loads(text)
+                if isinstance(data, dict):
+                    if file == self.file:
+                        self._saved = json.loads(text)
+                    break
+                data = None
+            except Exception as e:
+                EVENTLOG.log(eventlog.SETTINGS_LOAD_FAILED, file, e)
+        if data is None:
+            data = {}
+
+        # Settings from before multiple alarms had a single "alarm_hour".
+        if "alarm_hour" in data:
+            alarm_hour = data.pop("alarm_hour")
+            if "alarms" not in data:
+                data["alarms"] = [
+                    {"time": alarm_hour, "days": 0b1111111, "enabled": True}
+                ]
+
+        for key, value in self.defaults.items():
+            if key not in data:
+                data[key] = _copy(value)
+        self.data = data
+        EVENTLOG.log(eventlog.SETTINGS_LOADED)
+        return data
+
+    def set(self, settings_dict):
+        """Replaces the settings; they are written out later by run()."""
+        self.data = settings_dict
+        self._changed.set()
+
+    def update(self, **changes):
+        """Changes some settings, keeping the others."""
+        data = dict(self.data)
+        data.update(changes)
+        self.set(data)
+
+    def flush(self):
+        """Writes the settings now if they differ from what is on flash.
+        Returns True if the file was written."""
+        self._changed.clear()
+        if self.data == self._saved:
+            return False
+        text = json.dumps(self.data)
+        try:
+            _write_atomic(self.file, text)
+        except Exception as e:
+            EVENTLOG.log(eventlog.SETTINGS_SAVE_FAILED, e)
+            return False
+        self._saved = json.loads(text)
+        self.writes += 1
+        EVENTLOG.log(eventlog.SETTINGS_SAVED)
+        return True
+
+    async def run(self):
+        """Writes changes back to flash, FLUSH_DELAY_MS after the last one."""
+        while True:
+            await self._changed.wait()
+            while True:
+                self._changed.clear()
+                try:
+                    await asyncio.wait_for(self._changed.wait(), FLUSH_DELAY_MS / 1000)
+                except asyncio.TimeoutError:
+                    break
+            self.flush()
+
+
+STORE = SettingsStore("settings.json")
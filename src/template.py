@@ -0,0 +1,71 @@
+# Minimal page templates with {NAME} placeholders.
+#
+# A template is parsed once into static chunks and placeholder slots, so
+# rendering only has to encode the placeholder values. The static chunks
+# are shared between renders and can be written to a socket as they are.
+
+import eventlog
+from eventlog import EVENTLOG
+
+
+def _is_name(text):
+    if not text:
+        return False
+    for ch in text:
+        if not ("A" <= ch <= "Z" or "0" <= ch <= "9" or ch == "_"):
+            return False
+    return True
+
+
+class Template:
+    """A page split into static chunks and {NAME} slots.
+
+    Braces that don't enclose an upper-case name (CSS rules, for example)
+    are kept as static text.
+    """
+
+    def __init__(self, text):
+        # Even indexes hold static bytes, odd indexes hold slot names.
+        self.parts = []
+        static_start = 0
+        i = 0
+        while True:
+            i = text.find("{", i)
+            if i < 0:
+                break
+            end = text.find("}", i + 1)
+            if end < 0:
+                break
+            name = text[i + 1 : end]
+            if _is_name(name):
+                self.parts.append(text[static_start:i].encode())
+                self.parts.append(name)
+                static_start = end + 1
+                i = end + 1
+            else:
+                i += 1
+        self.parts.append(text[static_start:].encode())
+
+    @classmethod
+    def load(cls, file, fallback="HTML Missing"):
+        """Parses the template in file, or fallback if it can't be read."""
+        try:
+            with open(file, "r") as f:
+                return cls(f.read())
+        except Exception as e:
+            EVENTLOG.log(eventlog.TEMPLATE_LOAD_FAILED, file, e)
+            return cls(fallback)
+
+    def render(self, values):
+        """Returns the page as a list of bytes chunks, looking up each slot
+        in the values dict. Unknown slots and None render as empty.
+        """
+        chunks = []
+        for i, part in enumerate(self.parts):
+            if i & 1:
+                value = values.get(part)
+                if value is not None and value != "":
+                    chunks.append(str(value).encode())
+            elif part:
+                chunks.append(part)
+        return chunks
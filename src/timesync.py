@@ -0,0 +1,243 @@
+# Background time synchronisation over NTP.
+#
+# Several servers are queried over non-blocking UDP and the answer with the
+# lowest round-trip time is used to set the RTC. The RTC's drift is
+# estimated from the offsets measured at successive syncs and corrected for
+# in now_ms() between syncs. The clock loop never waits on the network.
+
+import asyncio
+import socket
+import struct
+import time
+from machine import RTC  # type: ignore
+import eventlog
+from eventlog import EVENTLOG
+import metrics
+
+NTP_SERVERS = ("0.pool.ntp.org", "1.pool.ntp.org", "time.google.com")
+NTP_PORT = 123
+
+# Seconds between 1900-01-01 (NTP epoch) and the epoch of this port.
+NTP_DELTA = 3155673600 if time.gmtime(0)[0] == 2000 else 2208988800
+
+SYNC_RTT = metrics.Histogram(
+    "ntp_rtt_ms",
+    "Round-trip time of the NTP answer each sync used.",
+    (10, 20, 50, 100, 200, 500, 1000),
+)
+SYNC_DURATION = metrics.Histogram(
+    "ntp_sync_ms",
+    "Time a sync took, all queries included.",
+    (50, 100, 200, 500, 1000, 2000),
+)
+SYNCS = metrics.Counter("ntp_syncs_total", "Successful time syncs.")
+SYNC_FAILURES = metrics.Counter("ntp_sync_failures_total", "Syncs no server answered.")
+
+SYNC_INTERVAL = 3600  # seconds between successful syncs
+MIN_BACKOFF = 15  # seconds before the first retry after a failed sync
+MAX_BACKOFF = 3600
+QUERY_TIMEOUT_MS = 1000
+POLL_MS = 10  # how often a pending query checks its socket
+RESOLVE_ROUNDS = 24  # syncs an address is used for before it's looked up again
+MAX_RESOLVE_BACKOFF = 16  # most syncs between lookups of a name that failed
+
+# Drift estimates are averaged, each new measurement weighing 1/DRIFT_WEIGHT.
+DRIFT_WEIGHT = 4
+
+
+def _rtc_ms():
+    return time.time_ns() // 1000000
+
+
+class TimeSync:
+    """Keeps the RTC in sync with NTP.
+
+    All times are integer milliseconds since the epoch; floats on the ESP32
+    are single precision and can't hold them.
+    """
+
+    def __init__(self, servers=NTP_SERVERS):
+        self.servers = servers
+        self._addresses = {}
+        self._resolve_at = {}  # server -> round of its next DNS lookup
+        self._resolve_backoff = {}  # server -> rounds to wait after a failure
+        self.rounds = 0  # syncs attempted
+        self.synced = False
+        self.last_rtt_ms = None
+        self.last_server = None
+        self.last_offset_ms = None
+        self.drift_ppb = 0  # how much faster than real time the RTC runs
+        self.drift_samples = 0
+        self.failures = 0
+        self._sync_rtc_ms = None  # RTC time right after the last sync
+        self._on_sync = []
+        self._kick = asyncio.Event()
+
+    def on_sync(self, callback):
+        """Calls callback() after every successful sync."""
+        self._on_sync.append(callback)
+
+    def now_ms(self):
+        """The current time, with the RTC's estimated drift since the last
+        sync taken out."""
+        rtc = _rtc_ms()
+        if self._sync_rtc_ms is None or not self.drift_ppb:
+            return rtc
+        return rtc - (rtc - self._sync_rtc_ms) * self.drift_ppb // 1000000000
+
+    def time(self):
+        """Like time.time(), corrected for drift."""
+        return self.now_ms() // 1000
+
+    def _resolve_one(self):
+        # DNS lookups block the loop, for the whole DNS timeout while the
+        # uplink is down, so a sync looks up at most one server: the first
+        # without an address, else the first whose address is due for a
+        # refresh. Addresses are kept when queries time out; a name that
+        # doesn't resolve is tried again after a growing number of syncs.
+        due = None
+        for server in self.servers:
+            if self._resolve_at.get(server, 0) <= self.rounds:
+                if server not in self._addresses:
+                    due = server
+                    break
+                if due is None:
+                    due = server
+        if due is None:
+            return
+        if isinstance(due, tuple):
+            host, port = due
+        else:
+            host, port = due, NTP_PORT
+        try:
+            addr = socket.getaddrinfo(host, port, 0, socket.SOCK_DGRAM)[0][-1]
+        except Exception as e:
+            EVENTLOG.log(eventlog.NTP_RESOLVE_FAILED, due, e)
+            backoff = self._resolve_backoff.get(due, 1)
+            self._resolve_backoff[due] = min(backoff * 2, MAX_RESOLVE_BACKOFF)
+            self._resolve_at[due] = self.rounds + backoff
+            return
+        self._addresses[due] = addr
+        self._resolve_backoff.pop(due, None)
+        self._resolve_at[due] = self.rounds + RESOLVE_ROUNDS
+
+    async def _query(self, server):
+        # Returns (server time in ms at reception, RTC ms at reception, rtt ms)
+        # or None if the server didn't answer in time or has no address yet.
+        addr = self._addresses.get(server)
+        if addr is None:
+            return None
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            s.setblocking(False)
+            request = bytearray(48)
+            request[0] = 0x1B  # LI 0, version 3, mode 3 (client)
+            sent = time.ticks_ms()
+            s.sendto(request, addr)
+            while True:
+                try:
+                    msg = s.recvfrom(48)[0]
+                    break
+                except OSError:
+                    if time.ticks_diff(time.ticks_ms(), sent) > QUERY_TIMEOUT_MS:
+                        return None
+                    await asyncio.sleep_ms(POLL_MS)
+            rtt = time.ticks_diff(time.ticks_ms(), sent)
+            received = _rtc_ms()
+            if len(msg) < 48 or msg[1] == 0:
+                # Short packet, or stratum 0 (kiss-of-death).
+                return None
+            seconds, fraction = struct.unpack("!II", msg[40:48])
+            server_ms = (seconds - NTP_DELTA) * 1000 + ((fraction * 1000) >> 32)
+            # The answer left the server half a round trip ago.
+            return server_ms + rtt // 2, received, rtt
+        except OSError as e:
+            EVENTLOG.log(eventlog.NTP_QUERY_FAILED, server, e)
+            return None
+        finally:
+            s.close()
+
+    async def sync(self):
+        """Queries all servers at once and sets the RTC from the answer with
+        the lowest round-trip time. Returns True on success."""
+        self._resolve_one()
+        self.rounds += 1
+        start = time.ticks_ms()
+        answers = await asyncio.gather(*[self._query(server) for server in self.servers])
+        SYNC_DURATION.observe(metrics.elapsed_ms(start))
+        best = None
+        best_server = None
+        for server, answer in zip(self.servers, answers):
+            if answer is not None and (best is None or answer[2] < best[2]):
+                best = answer
+                best_server = server
+        if best is None:
+            self.failures += 1
+            SYNC_FAILURES.inc()
+            return False
+
+        server_ms, received, rtt = best
+        offset = server_ms - received
+        if self._sync_rtc_ms is not None:
+            # The RTC was exact at the last sync, so the offset built up
+            # since then is its drift.
+            elapsed = received - self._sync_rtc_ms
+            if elapsed > 60000:
+                measured = -offset * 1000000000 // elapsed
+                if self.drift_samples == 0:
+                    self.drift_ppb = measured
+                else:
+                    self.drift_ppb += (measured - self.drift_ppb) // DRIFT_WEIGHT
+                self.drift_samples += 1
+
+        self._set_rtc(server_ms + _rtc_ms() - received)
+        self._sync_rtc_ms = _rtc_ms()
+        self.synced = True
+        self.failures = 0
+        self.last_rtt_ms = rtt
+        self.last_server = best_server
+        self.last_offset_ms = offset
+        SYNCS.inc()
+        SYNC_RTT.observe(rtt)
+        EVENTLOG.log(eventlog.NTP_SYNCED, best_server, offset, rtt)
+        for callback in self._on_sync:
+            callback()
+        return True
+
+    def _set_rtc(self, ms):
+        t = time.gmtime(ms // 1000)
+        # RTC.datetime takes (year, month, day, weekday, hours, minutes,
+        # seconds, subseconds); the ESP32 port uses microseconds.
+        RTC().datetime((t[0], t[1], t[2], t[6], t[3], t[4], t[5], (ms % 1000) * 1000))
+
+    def request_sync(self):
+        """Ends the current wait and syncs now, e.g. when the network came
+        back up."""
+        self._kick.set()
+
+    async def _wait(self, seconds):
+        try:
+            await asyncio.wait_for(self._kick.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+        self._kick.clear()
+
+    async def run(self):
+        """Syncs forever: every SYNC_INTERVAL seconds, and with exponential
+        backoff while no server answers."""
+        backoff = MIN_BACKOFF
+        while True:
+            if await self.sync():
+                backoff = MIN_BACKOFF
+                await self._wait(SYNC_INTERVAL)
+            else:
+                EVENTLOG.log(eventlog.NTP_RETRY, backoff)
+                await self._wait(backoff)
+                backoff = min(backoff * 2, MAX_BACKOFF)
+
+
+SYNC = TimeSync()
+
+metrics.Gauge(
+    "rtc_drift_ppb", "Estimated RTC drift, corrected for.", fn=lambda: SYNC.drift_ppb
+)
@@ -1,187 +1,654 @@
-import socket
+import asyncio
+import binascii
+import json
+import random
 import time
+import zlib
 from machine import Pin  # type: ignore
-import globals
+from globals import STATE
+import metrics
 
-from settings import save_settings
+from alarm_signal import DEFAULT_PATTERN, PATTERNS
+from alarms import ALARMS, ALL_DAYS, MAX_ALARMS, normalize_alarm, parse_time
+from clock import local_time
+from dst import RULES, iso_minute
+import eventlog
+from eventlog import EVENTLOG
+from events import EVENTS
+from timesync import SYNC
+from settings import STORE
+from template import Template
+from http_parser import HttpError, RequestParser
+from form import parse_form
 
+DISPLAY_MODES = ("text", "big")
 
-def _url_decode(s):
-    # simple URL-decode: replace + with space and %XX hex sequences
-    s = s.replace("+", " ")
-    res = ""
-    i = 0
-    while i < len(s):
-        ch = s[i]
-        if ch == "%" and i + 2 < len(s):
-            try:
-                hexv = s[i + 1 : i + 3]
-                res += chr(int(hexv, 16))
-                i += 3
-                continue
-            except Exception:
-                # if malformed, keep as-is
-                pass
-        res += ch
-        i += 1
-    return res
-
-
-def _parse_form(body):
-    # body like: "ssid=My%20Net&password=p%40ssword"
-    params = {}
-    for pair in body.split("&"):
-        if "=" in pair:
-            k, v = pair.split("=", 1)
-            params[_url_decode(k)] = _url_decode(v)
-    return params
-
-
-def start_web_server():
-    led = Pin(2, Pin.OUT)  # On-board LED for ESP32
-    # AF_INET = IPv4, SOCK_STREAM = TCP
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    s.bind(("", 80))  # Bind to all interfaces on port 80 (standard HTTP)
-    s.listen(5)  # Listen for up to 5 pending connections
+MAX_CONNECTIONS = 4  # clients served at once, further ones get a 503
+IO_TIMEOUT = 5  # seconds a client may take to send its request or read ours
+LOG_CHUNK = 512  # bytes of /log text sent at a time
 
-    if globals.SETTINGS is None:
-        globals.SETTINGS = {"ssid": ""}
+REQUEST_MS = metrics.Histogram(
+    "http_request_ms",
+    "Time to handle a request and send the response, by route.",
+    (2, 5, 10, 20, 50, 100, 200, 500, 1000),
+    label="route",
+)
+ERRORS = metrics.Counter("http_errors_total", "Requests answered with an error status.")
+BUSY = metrics.Counter("http_busy_total", "Connections refused, all slots taken.")
+metrics.Counter(
+    "settings_writes_total", "Settings written to flash.", fn=lambda: STORE.writes
+)
+metrics.Counter(
+    "sse_drops_total", "Event stream clients dropped as slow.", fn=lambda: EVENTS.drops
+)
+metrics.Counter(
+    "eventlog_records_total", "Events logged.", fn=lambda: EVENTLOG.records
+)
+metrics.Counter(
+    "eventlog_dropped_total",
+    "Events dropped, the buffer being full.",
+    fn=lambda: EVENTLOG.dropped,
+)
+metrics.Counter(
+    "eventlog_bytes_written_total",
+    "Bytes of events written to flash.",
+    fn=lambda: EVENTLOG.bytes_written,
+)
 
-    print("Web Server started. Listening on http://" + globals.IP)
-    led.on()
-    while True:
-        conn = None
+# One request parser (and its buffer) per connection slot, allocated once.
+_parsers = [RequestParser() for _ in range(MAX_CONNECTIONS)]
+
+# Part of every ETag, so ETags from before a reboot (when the state
+# versions started over) never match.
+_BOOT_ID = "%08x" % random.getrandbits(32)
+
+# Static files by path: (file, content type). They are small, and kept in
+# RAM once read.
+STATIC_FILES = {
+    "/style.css": ("style.css", b"text/css"),
+}
+STATIC_MAX_AGE = 86400  # seconds browsers may use them without asking
+_static = {}
+
+_page = None  # parsed website.html
+_page_chunks = None
+_page_version = None  # settings version _page_chunks was rendered from
+
+
+def _save_settings(changes):
+    # Replaces the settings with a copy that has changes applied.
+    # Subscribers (the clock) are notified right away; the store writes
+    # the settings to flash once the changes settle.
+    settings = dict(STATE.get("settings"))
+    settings.update(changes)
+    STATE.set(settings=settings)
+    STORE.set(settings)
+
+
+def _handle_save(body):
+    # Handle save route for form POST
+    form = parse_form(body)
+    ssid = form.get("ssid", "")
+    # The page never contains the password; left blank, it is kept.
+    password = form.get("password", "") or STATE.get("settings").get("password", "")
+    summer = int(form.get("summer", 2))
+    winter = int(form.get("winter", 1))
+    dst_rule = form.get("dst_rule", "eu")
+    if dst_rule not in ("eu", "us", "none"):
+        dst_rule = "eu"
+    display_mode = form.get("display_mode", "text")
+    if display_mode not in DISPLAY_MODES:
+        display_mode = "text"
+
+    _save_settings(
+        {
+            "ssid": ssid,
+            "password": password,
+            "summer": summer,
+            "winter": winter,
+            "dst_rule": dst_rule,
+            "display_mode": display_mode,
+        }
+    )
+    EVENTLOG.log(eventlog.WEB_SETTINGS_SAVED, ssid, summer, winter, dst_rule)
+
+
+def _handle_alarms(body):
+    # Handle the alarms form. Row i has the fields t<i> (time), e<i>
+    # (enabled) and d<i><n> (weekday n); rows without a time are dropped.
+    form = parse_form(body)
+    alarms = []
+    for i in range(MAX_ALARMS):
+        alarm_time = parse_time(form.get("t%d" % i, ""))
+        if alarm_time is None:
+            continue
+        days = 0
+        for day in range(7):
+            if "d%d%d" % (i, day) in form:
+                days |= 1 << day
+        alarms.append({"time": alarm_time, "days": days, "enabled": "e%d" % i in form})
+    signal = form.get("signal", DEFAULT_PATTERN)
+    if signal not in PATTERNS:
+        signal = DEFAULT_PATTERN
+
+    _save_settings({"alarms": alarms, "alarm_signal": signal})
+    EVENTLOG.log(eventlog.WEB_ALARMS_SAVED, len(alarms))
+
+
+def _handle_alarm_action(body):
+    # Snooze or stop button for the ringing alarm.
+    action = parse_form(body).get("action")
+    if action == "snooze":
+        ALARMS.snooze(local_time())
+    elif action == "stop":
+        ALARMS.stop(local_time())
+
+
+def _settings_page():
+    # Returns the settings page as a list of chunks. The rendered page is
+    # cached until the settings change.
+    global _page_chunks, _page_version
+    version, state = STATE.snapshot("settings")
+    if _page_chunks is None or _page_version != version:
+        _page_version = version
+        _page_chunks = _page.render(page_values(state["settings"]))
+    return _page_chunks
+
+
+async def _send(writer, *chunks):
+    # Writes the chunks and waits for them to be sent, giving up on clients
+    # that stop reading.
+    for chunk in chunks:
+        writer.write(chunk)
+    await asyncio.wait_for(writer.drain(), IO_TIMEOUT)
+
+
+def _etag_matches(header, etag):
+    # True if an If-None-Match / If-Match header value lists etag.
+    return header is not None and (header.strip() == "*" or etag in header)
+
+
+def _json(status, etag, value):
+    # A JSON response. Clients revalidate with If-None-Match on every poll.
+    return (
+        status,
+        b"Content-Type: application/json\r\nCache-Control: no-cache\r\nETag: %s\r\n"
+        % etag.encode(),
+        [json.dumps(value).encode()],
+    )
+
+
+def _not_modified(etag):
+    return b"304 Not Modified", b"ETag: %s\r\n" % etag.encode(), []
+
+
+def status_values():
+    # The clock's current state, for /api/status. Returns (etag, values);
+    # the ETag is made from the same data, so it changes with the values.
+    now = local_time()
+    version, state = STATE.snapshot("ip", "wifi_state", "wifi_rssi", "alarm")
+    upcoming = ALARMS.next()
+    next_alarm = None if upcoming is None else upcoming[0]
+    etag = '"%s-%x-%x-%x-%d"' % (
+        _BOOT_ID,
+        version,
+        now // 60,
+        next_alarm or 0,
+        SYNC.synced,
+    )
+    return etag, {
+        "time": iso_minute(now),
+        "synced": SYNC.synced,
+        "wifi": state["wifi_state"],
+        "ip": state["ip"],
+        "rssi": state["wifi_rssi"],
+        "alarm": state["alarm"],
+        "next_alarm": None if next_alarm is None else iso_minute(next_alarm),
+    }
+
+
+def _settings_etag():
+    return '"%s-%x"' % (_BOOT_ID, STATE.version_of("settings"))
+
+
+def _public_settings(settings):
+    # The settings as served by the API: everything but the password.
+    settings = dict(settings)
+    settings.pop("password", None)
+    return settings
+
+
+def _settings_changes(data):
+    # Checks a PATCH body and returns the changes it makes to the settings.
+    if not isinstance(data, dict):
+        raise HttpError(400, "Bad Request")
+    changes = {}
+    try:
+        for key, value in data.items():
+            if key in ("ssid", "password"):
+                if not isinstance(value, str):
+                    raise ValueError(key)
+            elif key in ("summer", "winter"):
+                if not isinstance(value, int) or isinstance(value, bool):
+                    raise ValueError(key)
+                if not -12 <= value <= 14:
+                    raise ValueError(key)
+            elif key == "dst_rule":
+                if value not in RULES:
+                    raise ValueError(key)
+            elif key == "display_mode":
+                if value not in DISPLAY_MODES:
+                    raise ValueError(key)
+            elif key == "alarm_signal":
+                if value not in PATTERNS:
+                    raise ValueError(key)
+            elif key == "alarms":
+                if not isinstance(value, list) or len(value) > MAX_ALARMS:
+                    raise ValueError(key)
+                value = [normalize_alarm(alarm) for alarm in value]
+            else:
+                raise ValueError(key)
+            changes[key] = value
+    except (ValueError, TypeError, KeyError):
+        raise HttpError(422, "Unprocessable Entity")
+    return changes
+
+
+def _api_status(parser):
+    if parser.method != "GET":
+        raise HttpError(405, "Method Not Allowed")
+    etag, values = status_values()
+    if _etag_matches(parser.headers.get("if-none-match"), etag):
+        return _not_modified(etag)
+    return _json(b"200 OK", etag, values)
+
+
+def _api_settings(parser):
+    etag = _settings_etag()
+    if parser.method == "GET":
+        if _etag_matches(parser.headers.get("if-none-match"), etag):
+            return _not_modified(etag)
+    elif parser.method == "PATCH":
+        # If-Match makes the update fail if someone else changed the
+        # settings since the client read them.
+        if_match = parser.headers.get("if-match")
+        if if_match is not None and not _etag_matches(if_match, etag):
+            raise HttpError(412, "Precondition Failed")
         try:
-            # Wait for a client connection
-            conn, addr = s.accept()
-            print("Got a connection from %s" % str(addr))
-
-            # Read the incoming request (read up to 2048 bytes initially)
-            request_bytes = conn.recv(2048)
-            if not request_bytes:
-                conn.close()
-                continue
-            request = request_bytes.decode("utf-8", "ignore")
-            request_line = request.split("\r\n")[0]
-            print("Request:", request_line)
-
-            # parse request line
-            parts = request_line.split()
-            method = parts[0] if len(parts) > 0 else "GET"
-            path = parts[1] if len(parts) > 1 else "/"
-
-            # If POST, try to read full body based on Content-Length
-            body = ""
-            if method.upper() == "POST":
-                headers, _, maybe_body = request.partition("\r\n\r\n")
-                body = maybe_body
-                # check Content-Length
-                cl = 0
-                for h in headers.split("\r\n")[1:]:
-                    if ":" in h:
-                        name, val = h.split(":", 1)
-                        if name.lower().strip() == "content-length":
-                            try:
-                                cl = int(val.strip())
-                            except Exception:
-                                cl = 0
-                            break
-                # if body shorter than content-length, read the rest
-                body_bytes = body.encode("utf-8")
-                to_read = cl - len(body_bytes)
-                while to_read > 0:
-                    more = conn.recv(1024)
-                    if not more:
-                        break
-                    body_bytes += more
-                    to_read = cl - len(body_bytes)
-                body = body_bytes.decode("utf-8", "ignore")
-
-            # Handle save route for form POST
-            if method.upper() == "POST" and path.startswith("/save"):
-                form = _parse_form(body)
-                ssid = form.get("ssid", "")
-                password = form.get("password", "")
-                summer = int(form.get("summer", 2))
-                winter = int(form.get("winter", 1))
-                alarm_hour = form.get("alarm", "7:00")
-
-                if ":" in alarm_hour:
-                    ah, am = alarm_hour.split(":", 1)
-                    try:
-                        ah = int(ah)
-                        am = int(am)
-                        if 0 <= ah < 24 and 0 <= am < 60:
-                            alarm_hour = [ah, am]
-                        else:
-                            alarm_hour = [7, 0]  # default
-                    except Exception:
-                        alarm_hour = [7, 0]  # default
-
-                globals.SETTINGS = {
-                    "ssid": ssid,
-                    "password": password,
-                    "summer": summer,
-                    "winter": winter,
-                    "alarm_hour": alarm_hour,
-                }
-
-                save_settings("settings.json", globals.SETTINGS)
-                print(
-                    f"Saved settings: SSID={ssid}, PASSWORD={password}, SUMMER={summer}, WINTER={winter}, ALARM={alarm_hour}"
-                )
-
-                # Respond with a simple redirect back to root (or a confirmation)
-                response_header = (
-                    "HTTP/1.1 303 See Other\r\nLocation: /\r\nConnection: close\r\n\r\n"
-                )
-                conn.send(response_header.encode())
-                conn.close()
-                continue
-
-            # Generate the HTML content (use current settings if available)
-
-            ssid_value = globals.SETTINGS.get("ssid", "")
-            pw_value = globals.SETTINGS.get("password", "")
-            summer_value = globals.SETTINGS.get("summer", 1)
-            winter_value = globals.SETTINGS.get("winter", 0)
-            alarm_hour_value = globals.SETTINGS.get("alarm_hour", [7, 0])
-
-            response_html = web_page(
-                ssid_value, pw_value, summer_value, winter_value, alarm_hour_value
-            )
+            data = json.loads(str(parser.body, "utf-8"))
+        except (ValueError, UnicodeError):
+            raise HttpError(400, "Bad Request")
+        _save_settings(_settings_changes(data))
+        etag = _settings_etag()
+    else:
+        raise HttpError(405, "Method Not Allowed")
+    return _json(b"200 OK", etag, _public_settings(STATE.get("settings")))
+
+
+def _page_response(parser):
+    if parser.method != "GET":
+        raise HttpError(405, "Method Not Allowed")
+    etag = _settings_etag()
+    if _etag_matches(parser.headers.get("if-none-match"), etag):
+        return _not_modified(etag)
+    return (
+        b"200 OK",
+        b"Content-Type: text/html\r\nCache-Control: no-cache\r\nETag: %s\r\n"
+        % etag.encode(),
+        _settings_page(),
+    )
+
+
+def _load_static(path):
+    # Reads a static file into RAM: the gzipped copy tools/build_assets.py
+    # uploads in its place, or else the plain file (as in src/). Returns
+    # (etag, plain, gzipped) with one of the two None, or None if neither
+    # file exists.
+    name, content_type = STATIC_FILES[path]
+    plain = gzipped = None
+    try:
+        with open(name + ".gz", "rb") as f:
+            gzipped = f.read()
+    except OSError:
+        try:
+            with open(name, "rb") as f:
+                plain = f.read()
+        except OSError:
+            return None
+    entry = ("%08x" % binascii.crc32(gzipped or plain), plain, gzipped)
+    _static[path] = entry
+    return entry
+
+
+def _accepts_gzip(header):
+    # True if an Accept-Encoding value allows gzip: gzip, or else *, listed
+    # without q=0.
+    if not header:
+        return False
+    star = False
+    for item in header.split(","):
+        params = item.split(";")
+        coding = params[0].strip().lower()
+        if coding != "gzip" and coding != "*":
+            continue
+        allowed = True
+        for param in params[1:]:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    allowed = float(value) > 0
+                except ValueError:
+                    allowed = False
+        if coding == "gzip":
+            return allowed
+        star = allowed
+    return star
+
+
+def _static_response(parser, path):
+    if parser.method != "GET":
+        raise HttpError(405, "Method Not Allowed")
+    entry = _static.get(path) or _load_static(path)
+    if entry is None:
+        raise HttpError(404, "Not Found")
+    crc, plain, gzipped = entry
+    use_gzip = gzipped is not None and _accepts_gzip(
+        parser.headers.get("accept-encoding")
+    )
+    # The two encodings are different representations, with different ETags.
+    etag = ('"%s-gz"' if use_gzip else '"%s"') % crc
+    if _etag_matches(parser.headers.get("if-none-match"), etag):
+        return _not_modified(etag)
+    headers = (
+        b"Content-Type: %s\r\nCache-Control: public, max-age=%d\r\n"
+        b"Vary: Accept-Encoding\r\nETag: %s\r\n"
+        % (STATIC_FILES[path][1], STATIC_MAX_AGE, etag.encode())
+    )
+    if use_gzip:
+        return b"200 OK", headers + b"Content-Encoding: gzip\r\n", [gzipped]
+    if plain is None:
+        # The rare client without gzip: unpacked for each request instead
+        # of keeping a plain copy on flash or in RAM. wbits 31 reads the
+        # gzip header.
+        return b"200 OK", headers, [zlib.decompress(gzipped, 31)]
+    return b"200 OK", headers, [plain]
+
 
-            # Construct the HTTP Response Header
-            response_header = "HTTP/1.1 200 OK\r\nContent-Type: text/html\r\nConnection: close\r\n\r\n"
+def _route_path(path):
+    # The path routes are looked up by: without the query string, and
+    # without a trailing slash except for "/".
+    query = path.find("?")
+    if query >= 0:
+        path = path[:query]
+    if len(path) > 1 and path[-1] == "/":
+        path = path[:-1]
+    return path
 
-            # Send the header and the HTML content
-            conn.send(response_header.encode())
-            conn.send(response_html.encode())
 
-            # Close the connection
-            conn.close()
+def _route(parser):
+    # Handles the request and returns (status, headers, body chunks).
+    path = _route_path(parser.path)
+    if parser.method == "POST" and path in _FORMS:
+        _FORMS[path](parser.body)
+        # Respond with a simple redirect back to root (or a confirmation)
+        return b"303 See Other", b"Location: /\r\n", []
+    if path in _API:
+        return _API[path](parser)
+    if path in STATIC_FILES:
+        return _static_response(parser, path)
+    if path == "/metrics":
+        return (
+            b"200 OK",
+            b"Content-Type: text/plain; version=0.0.4\r\n",
+            metrics.render(),
+        )
+    return _page_response(parser)
 
-        except OSError as e:
-            print("Socket error:", e)
+
+def _route_label(path):
+    # The route a request counts under in the metrics; a small fixed set.
+    path = _route_path(path)
+    if path in _FORMS or path in _API or path in STATIC_FILES:
+        return path
+    if path == "/" or path == "/metrics":
+        return path
+    return "other"
+
+
+async def _respond(writer, status, headers, chunks, keep_alive):
+    # Sends a response; the body is streamed as the given chunks.
+    length = 0
+    for chunk in chunks:
+        length += len(chunk)
+    await _send(
+        writer,
+        b"HTTP/1.1 %s\r\n%s%sConnection: %s\r\n\r\n"
+        % (
+            status,
+            headers,
+            # A 304 has no body; its length would be that of the 200.
+            b"" if status.startswith(b"304") else b"Content-Length: %d\r\n" % length,
+            b"keep-alive" if keep_alive else b"close",
+        ),
+        *chunks,
+    )
+
+
+async def _handle_client(reader, writer):
+    EVENTLOG.log(eventlog.WEB_CONNECTION, writer.get_extra_info("peername"))
+    if not _parsers:
+        BUSY.inc()
+        try:
+            await _send(
+                writer,
+                b"HTTP/1.1 503 Service Unavailable\r\nRetry-After: 1\r\nConnection: close\r\n\r\n",
+            )
+        except Exception:
+            pass
+        await _close(writer)
+        return
+
+    # Each connection borrows one of the preallocated request buffers, and
+    # keeps it while the client keeps the connection open.
+    parser = _parsers.pop()
+    served = 0
+    try:
+        while True:
             try:
-                if conn:
-                    conn.close()
-            except Exception:
-                pass
-            time.sleep(
-                1
-            )  # Small delay to avoid hammering the connection if errors persist
+                if not await asyncio.wait_for(parser.read(reader), IO_TIMEOUT):
+                    break
+            except asyncio.TimeoutError:
+                if served:
+                    break  # an idle kept-alive connection
+                raise
+            served += 1
+            EVENTLOG.log(eventlog.WEB_REQUEST, parser.method, parser.path)
+            stream = _STREAMS.get(_route_path(parser.path))
+            if stream is not None and parser.method == "GET":
+                # A stream needs no request buffer; give it back now,
+                # without anything the client sent after this request.
+                parser.release()
+                _parsers.append(parser)
+                parser = None
+                await stream(writer)
+                break
+            # The last free buffer is kept for new clients, so connections
+            # that stay open can't lock everyone else out.
+            keep_alive = parser.keep_alive and len(_parsers) > 0
+            start = time.ticks_ms()
+            await _respond(writer, *_route(parser), keep_alive)
+            REQUEST_MS.observe(metrics.elapsed_ms(start), _route_label(parser.path))
+            metrics.sample_heap()
+            if not keep_alive:
+                break
+    except HttpError as e:
+        EVENTLOG.log(eventlog.WEB_BAD_REQUEST, e.status, e.reason)
+        ERRORS.inc()
+        try:
+            await _send(
+                writer,
+                b"HTTP/1.1 %d %s\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
+                % (e.status, e.reason.encode()),
+            )
+        except Exception:
+            pass
+    except asyncio.TimeoutError:
+        EVENTLOG.log(eventlog.WEB_TIMEOUT)
+    except Exception as e:
+        EVENTLOG.log(eventlog.WEB_SOCKET_ERROR, e)
+    finally:
+        if parser is not None:
+            parser.release()
+            _parsers.append(parser)
+        await _close(writer)
+
+
+async def _stream_events(writer):
+    if EVENTS.full():
+        await _send(
+            writer,
+            b"HTTP/1.1 503 Service Unavailable\r\nRetry-After: 10\r\nContent-Length: 0\r\nConnection: close\r\n\r\n",
+        )
+        return
+    await EVENTS.serve(writer)
+
+
+_LOG_HEAD = (
+    b"HTTP/1.1 200 OK\r\n"
+    b"Content-Type: text/plain; charset=utf-8\r\n"
+    b"Cache-Control: no-cache\r\n"
+    b"Connection: close\r\n\r\n"
+)
+
+
+async def _stream_log(writer):
+    # Streams the event log as text, oldest event first, in chunks of
+    # about LOG_CHUNK bytes. The body ends when the connection closes, so
+    # the log doesn't have to be read twice to find its length. The events
+    # still in RAM come last, from the buffer: flushing it here would let
+    # any client force flash writes, and block the loop while they run.
+    await _send(writer, _LOG_HEAD)
+    for path in EVENTLOG.pages():
+        await _send_lines(writer, EVENTLOG.lines(path))
+    await _send_lines(writer, EVENTLOG.buffered())
 
 
-def web_page(ssid, password, summer, winter, alarm_hour):
+async def _send_lines(writer, lines):
+    # Sends text lines in chunks of about LOG_CHUNK bytes.
+    chunk = []
+    size = 0
+    for line in lines:
+        chunk.append(line)
+        size += len(line)
+        if size >= LOG_CHUNK:
+            await _send(writer, "".join(chunk).encode())
+            chunk = []
+            size = 0
+    if chunk:
+        await _send(writer, "".join(chunk).encode())
+
+
+# Form handlers by path; each answers with a redirect to the settings page.
+_FORMS = {
+    "/save": _handle_save,
+    "/alarms": _handle_alarms,
+    "/alarm": _handle_alarm_action,
+}
+
+# Streaming responses by path; each keeps the connection until it is done.
+_STREAMS = {
+    "/events": _stream_events,
+    "/log": _stream_log,
+}
+
+# JSON API handlers by path.
+_API = {
+    "/api/status": _api_status,
+    "/api/settings": _api_settings,
+}
+
+
+async def _close(writer):
     try:
-        html = open("website.html", "r").read()
+        writer.close()
+        await writer.wait_closed()
     except Exception:
-        # Fallback minimal page if website.html is missing or can't be read
-        html = """HTML Missing"""
-    html = html.replace("{SSID}", ssid)
-    html = html.replace("{PASSWORD}", password)
-    html = html.replace("{SUMMER}", str(summer))
-    html = html.replace("{WINTER}", str(winter))
-    html = html.replace("{ALARM_HOUR}", f"{alarm_hour[0]:02}:{alarm_hour[1]:02}")
-    return html
+        pass
+
+
+async def start_web_server(port=80):
+    led = Pin(2, Pin.OUT)  # On-board LED for ESP32
+
+    global _page
+    if STATE.get("settings") is None:
+        STATE.set(settings={"ssid": ""})
+
+    EVENTS.start()
+
+    # Read and parse the page once; requests only render the placeholders.
+    _page = Template.load("website.html")
+
+    # Bind to all interfaces on port 80 (standard HTTP), with up to 5
+    # pending connections. Each client is served by its own task.
+    server = await asyncio.start_server(_handle_client, "0.0.0.0", port, backlog=5)
+
+    # The server starts before Wi-Fi is up, so the address isn't known yet;
+    # the Wi-Fi "connected" event logs it.
+    EVENTLOG.log(eventlog.WEB_STARTED, port)
+    led.on()
+    await server.wait_closed()
+
+
+def page_values(settings):
+    # Values for the placeholders in website.html (use current settings if
+    # available)
+    dst_rule = settings.get("dst_rule", "eu")
+    values = {
+        "SSID": settings.get("ssid", ""),
+        "SUMMER": settings.get("summer", 1),
+        "WINTER": settings.get("winter", 0),
+        "ALARMS": alarm_rows(settings.get("alarms", [])),
+    }
+    for rule in ("eu", "us", "none"):
+        values["DST_" + rule.upper()] = "selected" if rule == dst_rule else ""
+    display_mode = settings.get("display_mode", "text")
+    for mode in DISPLAY_MODES:
+        values["MODE_" + mode.upper()] = "selected" if mode == display_mode else ""
+    signal = settings.get("alarm_signal", DEFAULT_PATTERN)
+    for pattern in PATTERNS:
+        values["SIGNAL_" + pattern.upper()] = "selected" if pattern == signal else ""
+    return values
+
+
+DAY_NAMES = ("ma", "di", "wo", "do", "vr", "za", "zo")
+
+
+def alarm_rows(alarms):
+    # Form rows for the alarms, plus an empty one to add an alarm with
+    # while there is room.
+    rows = []
+    for i in range(min(len(alarms) + 1, MAX_ALARMS)):
+        if i < len(alarms):
+            alarm = alarms[i]
+            value = "{:02}:{:02}".format(*alarm["time"])
+            enabled = alarm.get("enabled", True)
+            days = alarm.get("days", ALL_DAYS)
+        else:
+            value = ""
+            enabled = True
+            days = ALL_DAYS
+        row = [
+            '<div class="input-form">',
+            '<input type="checkbox" name="e%d" value="1"%s>'
+            % (i, " checked" if enabled else ""),
+            '<input type="time" name="t%d" value="%s" style="margin: 0 10px;">'
+            % (i, value),
+        ]
+        for day, name in enumerate(DAY_NAMES):
+            row.append(
+                '<label><input type="checkbox" name="d%d%d" value="1"%s>%s</label>'
+                % (i, day, " checked" if days >> day & 1 else "", name)
+            )
+        row.append("</div>")
+        rows.append("".join(row))
+    return "\n".join(rows)
@@ -0,0 +1,101 @@
+# Wi-Fi station connection manager.
+#
+# Runs as a background task: connects, watches the link, and reconnects with
+# exponential backoff when it drops. The link state, IP address and RSSI are
+# published in globals.STATE so the rest of the firmware never waits on Wi-Fi.
+
+import asyncio
+import network  # type: ignore
+import eventlog
+from eventlog import EVENTLOG
+from globals import STATE
+
+DISCONNECTED = "disconnected"
+CONNECTING = "connecting"
+CONNECTED = "connected"
+
+CONNECT_TIMEOUT_MS = 10000  # per attempt
+POLL_MS = 250  # how often a connection attempt checks for success
+CHECK_INTERVAL = 5  # seconds between link checks while connected
+MIN_BACKOFF = 1  # seconds before retrying a failed attempt
+MAX_BACKOFF = 300
+
+
+class WifiManager:
+    """Keeps the station interface connected to the configured network."""
+
+    def __init__(self, ssid, password):
+        self.ssid = ssid
+        self.password = password
+        self.sta = network.WLAN(network.STA_IF)
+        self.state = DISCONNECTED
+        self.attempts = 0
+        self._on_change = []
+
+    def on_change(self, callback):
+        """Calls callback(state) whenever the link state changes."""
+        self._on_change.append(callback)
+
+    def _publish(self, state):
+        # The address, RSSI and state change together, in one update.
+        ip = None
+        if state == CONNECTED:
+            ip = self.sta.ifconfig()[0]
+            STATE.set(ip=ip, wifi_rssi=self._rssi(), wifi_state=state)
+        elif state == DISCONNECTED:
+            STATE.set(ip=None, wifi_rssi=None, wifi_state=state)
+        else:
+            STATE.set(wifi_state=state)
+        if state != self.state:
+            self.state = state
+            EVENTLOG.log(eventlog.WIFI_STATE, state, ip or "")
+            for callback in self._on_change:
+                callback(state)
+
+    def _rssi(self):
+        try:
+            return self.sta.status("rssi")
+        except Exception:
+            return None
+
+    async def _connect(self):
+        # One connection attempt; returns True once an address is assigned.
+        self._publish(CONNECTING)
+        self.attempts += 1
+        self.sta.active(True)
+        if self.sta.isconnected():
+            return True
+        try:
+            self.sta.connect(self.ssid, self.password)
+        except OSError as e:
+            EVENTLOG.log(eventlog.WIFI_CONNECT_FAILED, e)
+            return False
+        waited = 0
+        while waited < CONNECT_TIMEOUT_MS:
+            if self.sta.isconnected():
+                return True
+            await asyncio.sleep_ms(POLL_MS)
+            waited += POLL_MS
+        return False
+
+    async def run(self):
+        """Connects and stays connected, forever."""
+        backoff = MIN_BACKOFF
+        while True:
+            if await self._connect():
+                self._publish(CONNECTED)
+                backoff = MIN_BACKOFF
+                while self.sta.isconnected():
+                    await asyncio.sleep(CHECK_INTERVAL)
+                    STATE.set(wifi_rssi=self._rssi())
+                EVENTLOG.log(eventlog.WIFI_LINK_LOST)
+                self._publish(DISCONNECTED)
+            else:
+                EVENTLOG.log(eventlog.WIFI_RETRY, backoff)
+                try:
+                    self.sta.disconnect()
+                except OSError:
+                    pass
+                self._publish(DISCONNECTED)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, MAX_BACKOFF)
@@ -0,0 +1,77 @@
+# Web server tests on the simulator.
+#
+# Run from the repository root: python3 -m unittest discover tests
+
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sim  # noqa: E402
+
+sim.install()
+
+import eventlog  # noqa: E402
+from globals import STATE  # noqa: E402
+import webserver  # noqa: E402
+
+PORT = 8190
+SETTINGS = {"ssid": "home", "password": "secret", "summer": 2, "winter": 1}
+
+
+async def _exchange(data, read=True):
+    reader, writer = await asyncio.open_connection("127.0.0.1", PORT)
+    writer.write(data)
+    await writer.drain()
+    response = await reader.readline() if read else b""
+    writer.close()
+    return response
+
+
+class PipelinedRequestTest(unittest.TestCase):
+    def setUp(self):
+        eventlog.ECHO = False
+        self._cwd = os.getcwd()
+        self._dir = tempfile.mkdtemp()
+        os.chdir(self._dir)
+        shutil.copy(os.path.join(sim.SRC, "website.html"), "website.html")
+        STATE.set(settings=dict(SETTINGS))
+
+    def tearDown(self):
+        os.chdir(self._cwd)
+        shutil.rmtree(self._dir)
+
+    def test_leftover_is_not_served_to_the_next_connection(self):
+        # A client asks for the event log with a form post pipelined behind
+        # it and goes away. The post must not be run for the next client,
+        # which gets the request buffer the log stream gave back.
+        smuggled = b"ssid=evil&password=x&summer=9&winter=9"
+        attack = (
+            b"GET /log HTTP/1.1\r\n\r\n"
+            b"POST /save HTTP/1.1\r\nContent-Length: %d\r\n\r\n%s"
+            % (len(smuggled), smuggled)
+        )
+
+        async def run():
+            server = asyncio.create_task(webserver.start_web_server(PORT))
+            await asyncio.sleep(0.1)
+            await _exchange(attack)
+            await asyncio.sleep(0.1)
+            status = await _exchange(
+                b"GET /api/status HTTP/1.1\r\nConnection: close\r\n\r\n"
+            )
+            await asyncio.sleep(0.1)
+            server.cancel()
+            return status
+
+        status = asyncio.run(run())
+        self.assertEqual(status, b"HTTP/1.1 200 OK\r\n")
+        self.assertEqual(STATE.get("settings"), SETTINGS)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+# Builds the files that are uploaded to the board.
+#
+# Run from the repository root: python3 tools/build_assets.py [out_dir]
+#
+# Copies src/ to out_dir (build/ by default). Python files are copied as
+# they are. The page template (website.html) is minified but stays plain
+# text, since the server fills in its {NAME} slots on the board. Static
+# assets (.css, .js) are minified and written gzipped only, as style.css.gz
+# for style.css: almost every browser accepts gzip, and the web server
+# unpacks the file for those that don't, so a plain copy would only take up
+# flash. Files that haven't changed since the last build keep their
+# modification time, so rshell rsync doesn't upload them again.
+#
+# The files a build writes are listed in out_dir/.build_manifest, and only
+# files listed there are ever deleted, when their source is gone. A
+# directory that has files but no manifest wasn't made by this script, and
+# is refused.
+
+import gzip
+import os
+import re
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "src")
+BUILD = os.path.join(ROOT, "build")
+
+STATIC = (".css", ".js")
+MANIFEST = ".build_manifest"
+
+
+def minify_html(text):
+    # Whitespace between inline elements is visible, so runs of it are
+    # collapsed to one space rather than removed.
+    text = re.sub(r"<!--.*?-->", "", text, flags=re.S)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def minify_css(text):
+    text = re.sub(r"/\*.*?\*/", "", text, flags=re.S)
+    text = re.sub(r"\s+", " ", text)
+    text = re.sub(r"\s*([{};,])\s*", r"\1", text)
+    text = re.sub(r":\s+", ":", text)
+    return text.replace(";}", "}").strip()
+
+
+def minify_js(text):
+    # Only comment lines and indentation; anything cleverer needs a real
+    # JavaScript parser.
+    lines = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line and not line.startswith("//"):
+            lines.append(line)
+    return "\n".join(lines)
+
+
+MINIFIERS = {".html": minify_html, ".css": minify_css, ".js": minify_js}
+
+
+def _write(path, data):
+    # Writes data unless the file already holds it.
+    try:
+        with open(path, "rb") as f:
+            if f.read() == data:
+                return False
+    except OSError:
+        pass
+    with open(path, "wb") as f:
+        f.write(data)
+    return True
+
+
+def _read_manifest(out):
+    # The paths (relative to out) the last build wrote, or None if out
+    # has no manifest.
+    try:
+        with open(os.path.join(out, MANIFEST)) as f:
+            return set(line.strip() for line in f if line.strip())
+    except OSError:
+        return None
+
+
+def build(src=SRC, out=BUILD):
+    """Builds src into out. Returns (files written, bytes in src, bytes in
+    out). Raises ValueError if out is a directory with files in it that
+    wasn't made by build()."""
+    built = _read_manifest(out)
+    if built is None and os.path.isdir(out) and os.listdir(out):
+        raise ValueError("%s isn't empty and has no %s" % (out, MANIFEST))
+    written = 0
+    src_bytes = 0
+    out_bytes = 0
+    wanted = set()
+    for directory, dirs, files in os.walk(src):
+        dirs[:] = [d for d in dirs if d != "__pycache__"]
+        target_dir = os.path.join(out, os.path.relpath(directory, src))
+        target_dir = os.path.normpath(target_dir)
+        os.makedirs(target_dir, exist_ok=True)
+        for name in sorted(files):
+            if name.endswith((".pyc", ".gz")):
+                continue
+            with open(os.path.join(directory, name), "rb") as f:
+                data = f.read()
+            src_bytes += len(data)
+            ext = os.path.splitext(name)[1]
+            if ext in MINIFIERS:
+                data = MINIFIERS[ext](data.decode("utf-8")).encode("utf-8")
+            if ext in STATIC:
+                # mtime=0 keeps the output the same for the same input.
+                outputs = {name + ".gz": gzip.compress(data, 9, mtime=0)}
+            else:
+                outputs = {name: data}
+            for out_name, out_data in outputs.items():
+                path = os.path.join(target_dir, out_name)
+                wanted.add(os.path.relpath(path, out))
+                written += _write(path, out_data)
+                out_bytes += len(out_data)
+
+    # Drop files of earlier builds whose source is gone.
+    for path in (built or set()) - wanted:
+        if os.path.isabs(path) or path.split(os.sep)[0] == "..":
+            continue
+        try:
+            os.remove(os.path.join(out, path))
+        except OSError:
+            pass
+    with open(os.path.join(out, MANIFEST), "w") as f:
+        f.write("".join(path + "\n" for path in sorted(wanted)))
+    return written, src_bytes, out_bytes
+
+
+def main():
+    out = sys.argv[1] if len(sys.argv) > 1 else BUILD
+    if os.path.abspath(out) == os.path.abspath(SRC):
+        sys.exit("refusing to build into src/")
+    try:
+        written, src_bytes, out_bytes = build(SRC, out)
+    except ValueError as e:
+        sys.exit("refusing to build: %s" % e)
+    print(
+        "Built %s: %d files updated, %d bytes from %d in src/"
+        % (out, written, out_bytes, src_bytes)
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,520 @@
+# Provisions and monitors many clocks over their web interface.
+#
+#     python3 tools/fleet.py provision -f clocks.txt --summer 2 --winter 1 \
+#         --alarm 07:00/mo,tu,we,th,fr --alarm 09:30/sa,su
+#     python3 tools/fleet.py status 10.0.0.21 10.0.0.22:8080 --every 30
+#
+# provision does for each clock what a person does on its settings page:
+# it reads the page (GET /), posts the settings form to /save and, if
+# alarms or the alarm signal change, the alarms form to /alarms, then
+# reads the page again to check that the clock took the new values. A form
+# replaces all of its fields, so the fields that don't change are posted
+# with the values the page showed. status reads /api/status, with the ETag
+# of the last answer, so an unchanged clock answers with a bare 304.
+#
+# The clocks are handled concurrently, at most --concurrency at a time.
+# Each clock is talked to over one kept-alive connection (a clock serves 4
+# connections at once and keeps one open while it has a free slot), which
+# status --every keeps in a pool from one round to the next. Every request
+# is timed; the report has the latency per clock and over the fleet.
+#
+# Only the standard library is needed. python3 -m sim.standin runs
+# stand-in clocks on this machine to try it on.
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from html.parser import HTMLParser
+from urllib.parse import urlencode
+
+PORT = 80
+CONCURRENCY = 32
+TIMEOUT = 10  # seconds for one request, connecting included
+
+# Weekdays as the alarm days are numbered on the clock, Monday first.
+DAYS = ("mo", "tu", "we", "th", "fr", "sa", "su")
+MAX_ALARMS = 6  # alarms.MAX_ALARMS on the clock
+
+
+class FleetError(Exception):
+    pass
+
+
+def parse_host(text):
+    """ "host" or "host:port" to (host, port)."""
+    host, _, port = text.strip().rpartition(":")
+    if not host or not port.isdigit():
+        return text.strip(), PORT
+    return host, int(port)
+
+
+def read_hosts(file):
+    # One host per line; blank lines and # comments are skipped.
+    hosts = []
+    with open(file) as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                hosts.append(line)
+    return hosts
+
+
+def parse_alarm(text):
+    """ "HH:MM[/days][/off]" to (time, enabled, days), days being a comma
+    separated list of DAYS, "daily", or "once" for a one-shot alarm."""
+    parts = text.split("/")
+    hour, sep, minute = parts[0].partition(":")
+    if not (sep and hour.isdigit() and minute.isdigit()):
+        raise ValueError("bad alarm time: %r" % text)
+    if not (int(hour) < 24 and int(minute) < 60):
+        raise ValueError("bad alarm time: %r" % text)
+    days = (1 << len(DAYS)) - 1
+    enabled = True
+    for part in parts[1:]:
+        if part == "off":
+            enabled = False
+        elif part == "daily":
+            days = (1 << len(DAYS)) - 1
+        elif part == "once":
+            days = 0
+        else:
+            days = 0
+            for day in part.split(","):
+                if day not in DAYS:
+                    raise ValueError("bad alarm day: %r" % day)
+                days |= 1 << DAYS.index(day)
+    return "%02d:%02d" % (int(hour), int(minute)), enabled, days
+
+
+class _FormReader(HTMLParser):
+    # Collects the fields each form on a page submits, by form action, as
+    # a browser would: text-like inputs with their value, checkboxes only
+    # when checked, selects with their selected (or first) option.
+
+    def __init__(self):
+        HTMLParser.__init__(self)
+        self.forms = {}
+        self._fields = None
+        self._select = None  # [name, selected value, first value]
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "form":
+            self._fields = self.forms.setdefault(attrs.get("action", ""), {})
+        elif self._fields is None:
+            return
+        elif tag == "input" and attrs.get("name"):
+            kind = attrs.get("type", "text")
+            if kind in ("checkbox", "radio"):
+                if "checked" in attrs:
+                    self._fields[attrs["name"]] = attrs.get("value", "on")
+            elif kind not in ("submit", "button", "reset"):
+                self._fields[attrs["name"]] = attrs.get("value") or ""
+        elif tag == "select":
+            self._select = [attrs.get("name"), None, None]
+        elif tag == "option" and self._select is not None:
+            value = attrs.get("value", "")
+            if self._select[2] is None:
+                self._select[2] = value
+            if "selected" in attrs:
+                self._select[1] = value
+
+    def handle_endtag(self, tag):
+        if tag == "form":
+            self._fields = None
+        elif tag == "select" and self._select is not None:
+            name, selected, first = self._select
+            if name and self._fields is not None:
+                self._fields[name] = selected if selected is not None else first
+            self._select = None
+
+
+def read_forms(html):
+    """Returns the fields of the forms on a page, by form action."""
+    reader = _FormReader()
+    reader.feed(html)
+    reader.close()
+    return reader.forms
+
+
+def alarms_in_form(fields):
+    """The alarms an alarms form submits, as (time, enabled, days)."""
+    alarms = []
+    for i in range(MAX_ALARMS):
+        alarm_time = fields.get("t%d" % i, "")
+        if not alarm_time:
+            continue
+        days = 0
+        for day in range(len(DAYS)):
+            if "d%d%d" % (i, day) in fields:
+                days |= 1 << day
+        alarms.append((alarm_time, "e%d" % i in fields, days))
+    return alarms
+
+
+def alarm_fields(alarms):
+    # The alarms form fields for a list of (time, enabled, days).
+    fields = {}
+    for i, (alarm_time, enabled, days) in enumerate(alarms):
+        fields["t%d" % i] = alarm_time
+        if enabled:
+            fields["e%d" % i] = "1"
+        for day in range(len(DAYS)):
+            if days >> day & 1:
+                fields["d%d%d" % (i, day)] = "1"
+    return fields
+
+
+class Connection:
+    """A kept-alive HTTP/1.1 connection to one clock, opened when needed
+    and opened again when the clock closed it."""
+
+    def __init__(self, host, port=PORT, timeout=TIMEOUT):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._reader = None
+        self._writer = None
+        self.etags = {}  # path: ETag of the last 200 answer
+        self.latencies = []  # ms per request
+
+    async def request(self, method, path, fields=None, headers=()):
+        """Sends a request and returns (status, headers, body). fields are
+        sent as a form. A request on a kept-alive connection that the
+        clock closed meanwhile is sent again on a new one."""
+        body = b""
+        head = ["%s %s HTTP/1.1" % (method, path), "Host: %s" % self.host]
+        if fields is not None:
+            body = urlencode(fields).encode()
+            head.append("Content-Type: application/x-www-form-urlencoded")
+            head.append("Content-Length: %d" % len(body))
+        head.extend(headers)
+        data = ("\r\n".join(head) + "\r\n\r\n").encode() + body
+        start = time.perf_counter()
+        reused = self._writer is not None
+        try:
+            response = await asyncio.wait_for(self._exchange(data), self.timeout)
+        except (OSError, asyncio.IncompleteReadError) as e:
+            self.close()
+            if not reused:
+                raise FleetError("%s %s: %s" % (method, path, e or type(e).__name__))
+            start = time.perf_counter()
+            try:
+                response = await asyncio.wait_for(self._exchange(data), self.timeout)
+            except (OSError, asyncio.IncompleteReadError) as e:
+                self.close()
+                raise FleetError("%s %s: %s" % (method, path, e or type(e).__name__))
+        except asyncio.TimeoutError:
+            self.close()
+            raise FleetError("%s %s: timed out" % (method, path))
+        self.latencies.append((time.perf_counter() - start) * 1000)
+        return response
+
+    async def _exchange(self, data):
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(
+                self.host, self.port
+            )
+        self._writer.write(data)
+        await self._writer.drain()
+        reader = self._reader
+        status_line = await reader.readuntil(b"\r\n")
+        status = int(status_line.split(None, 2)[1])
+        headers = {}
+        while True:
+            line = await reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        if status == 304:
+            body = b""
+        elif "content-length" in headers:
+            body = await reader.readexactly(int(headers["content-length"]))
+        else:
+            body = await reader.read()
+            headers["connection"] = "close"
+        if headers.get("connection", "").lower() == "close":
+            self.close()
+        return status, headers, body
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+
+async def _read_page(conn):
+    status, headers, body = await conn.request("GET", "/")
+    if status != 200:
+        raise FleetError("GET /: status %d" % status)
+    return read_forms(body.decode("utf-8", "replace"))
+
+
+async def _post(conn, path, fields):
+    status, headers, body = await conn.request("POST", path, fields)
+    if status != 303:
+        raise FleetError("POST %s: status %d" % (path, status))
+
+
+async def provision(conn, settings, alarms=None, signal=None):
+    """Pushes settings (changes to the /save form fields), and alarms
+    (a list of (time, enabled, days)) and signal if not None, to one
+    clock, then checks that its page shows them. Returns a list of
+    problems, empty if the clock took everything."""
+    forms = await _read_page(conn)
+    if "/save" not in forms or "/alarms" not in forms:
+        raise FleetError("not a clock settings page")
+    if settings:
+        fields = dict(forms["/save"])
+        fields.update(settings)
+        await _post(conn, "/save", fields)
+    if alarms is not None or signal is not None:
+        fields = dict(forms["/alarms"])
+        if alarms is not None:
+            for name in list(fields):
+                if name[0] in "ted" and name[1:].isdigit():
+                    del fields[name]
+            fields.update(alarm_fields(alarms))
+        if signal is not None:
+            fields["signal"] = signal
+        await _post(conn, "/alarms", fields)
+
+    forms = await _read_page(conn)
+    problems = []
+    shown = forms.get("/save", {})
+    for name, value in settings.items():
+        # The page never shows the password.
+        if name != "password" and shown.get(name) != str(value):
+            problems.append("%s is %r" % (name, shown.get(name)))
+    shown = forms.get("/alarms", {})
+    if alarms is not None and alarms_in_form(shown) != list(alarms):
+        problems.append("alarms are %r" % alarms_in_form(shown))
+    if signal is not None and shown.get("signal") != signal:
+        problems.append("signal is %r" % shown.get("signal"))
+    return problems
+
+
+async def status(conn):
+    """Returns the clock's /api/status, or None if it didn't change since
+    the last call on this connection."""
+    path = "/api/status"
+    headers = ()
+    if path in conn.etags:
+        headers = ("If-None-Match: %s" % conn.etags[path],)
+    code, response_headers, body = await conn.request("GET", path, headers=headers)
+    if code == 304:
+        return None
+    if code != 200:
+        raise FleetError("GET %s: status %d" % (path, code))
+    if "etag" in response_headers:
+        conn.etags[path] = response_headers["etag"]
+    return json.loads(body)
+
+
+class Result:
+    """What happened on one clock in one run."""
+
+    def __init__(self, conn):
+        self.host = "%s:%d" % (conn.host, conn.port)
+        self.ok = False
+        self.detail = ""
+        self.requests = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+
+class Fleet:
+    """Runs a job on many clocks at once, at most concurrency at a time.
+    The connections are kept between runs."""
+
+    def __init__(self, hosts, concurrency=CONCURRENCY, timeout=TIMEOUT):
+        self.connections = [
+            Connection(*parse_host(host), timeout=timeout) for host in hosts
+        ]
+        self._slots = asyncio.Semaphore(concurrency)
+
+    async def run(self, job):
+        """Runs job(conn) on every clock. job returns a short description
+        of the outcome, or raises FleetError. Returns a Result per clock."""
+        return await asyncio.gather(
+            *(self._run_one(conn, job) for conn in self.connections)
+        )
+
+    async def _run_one(self, conn, job):
+        result = Result(conn)
+        conn.latencies = []
+        async with self._slots:
+            try:
+                result.detail = await job(conn)
+                result.ok = True
+            except FleetError as e:
+                result.detail = str(e)
+        result.requests = len(conn.latencies)
+        result.total_ms = sum(conn.latencies)
+        result.max_ms = max(conn.latencies, default=0.0)
+        return result
+
+    def close(self):
+        for conn in self.connections:
+            conn.close()
+
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def report(results, elapsed, out=sys.stdout):
+    """Prints a line per clock and the totals. Returns the number of
+    clocks that failed."""
+    for result in results:
+        out.write(
+            "%-21s %-6s %2d req %8.1f ms total %8.1f ms max  %s\n"
+            % (
+                result.host,
+                "ok" if result.ok else "FAILED",
+                result.requests,
+                result.total_ms,
+                result.max_ms,
+                result.detail,
+            )
+        )
+    failed = sum(1 for result in results if not result.ok)
+    totals = [result.total_ms for result in results if result.ok]
+    out.write(
+        "%d clocks, %d failed, in %.2f s; per clock p50 %.1f ms, p90 %.1f ms,"
+        " max %.1f ms\n"
+        % (
+            len(results),
+            failed,
+            elapsed,
+            _percentile(totals, 0.5),
+            _percentile(totals, 0.9),
+            max(totals, default=0.0),
+        )
+    )
+    return failed
+
+
+def _settings_from_args(args):
+    # The /save form fields the command line changes.
+    settings = {}
+    for name in ("ssid", "password", "summer", "winter", "dst_rule", "display_mode"):
+        value = getattr(args, name)
+        if value is not None:
+            settings[name] = str(value)
+    return settings
+
+
+async def _provision_all(args, hosts):
+    settings = _settings_from_args(args)
+    alarms = None
+    if args.no_alarms:
+        alarms = []
+    elif args.alarm:
+        alarms = args.alarm
+    if not settings and alarms is None and args.signal is None:
+        raise SystemExit("nothing to provision")
+
+    async def job(conn):
+        problems = await provision(conn, settings, alarms, args.signal)
+        if problems:
+            raise FleetError("not taken: " + "; ".join(problems))
+        return "verified"
+
+    fleet = Fleet(hosts, args.concurrency, args.timeout)
+    start = time.perf_counter()
+    results = await fleet.run(job)
+    fleet.close()
+    return report(results, time.perf_counter() - start)
+
+
+async def _status_all(args, hosts):
+    last = {}
+
+    async def job(conn):
+        values = await status(conn)
+        if values is not None:
+            last[conn] = values
+        values = last[conn]
+        return "%s wifi=%s synced=%s alarm=%s next=%s" % (
+            values["time"],
+            values["wifi"],
+            values["synced"],
+            values["alarm"],
+            values["next_alarm"],
+        )
+
+    fleet = Fleet(hosts, args.concurrency, args.timeout)
+    try:
+        while True:
+            start = time.perf_counter()
+            failed = report(await fleet.run(job), time.perf_counter() - start)
+            if not args.every:
+                return failed
+            sys.stdout.write("\n")
+            await asyncio.sleep(args.every)
+    finally:
+        fleet.close()
+
+
+def _alarm_arg(text):
+    try:
+        return parse_alarm(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Provisions and monitors clocks over their web interface."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    provision_cmd = commands.add_parser("provision", help="push settings and verify")
+    status_cmd = commands.add_parser("status", help="show each clock's status")
+    for cmd in (provision_cmd, status_cmd):
+        cmd.add_argument("hosts", nargs="*", help="host or host:port")
+        cmd.add_argument("-f", "--file", help="file with one host per line")
+        cmd.add_argument("-c", "--concurrency", type=int, default=CONCURRENCY)
+        cmd.add_argument("--timeout", type=float, default=TIMEOUT)
+    provision_cmd.add_argument("--ssid")
+    provision_cmd.add_argument("--password")
+    provision_cmd.add_argument("--summer", type=int, help="UTC offset in summer")
+    provision_cmd.add_argument("--winter", type=int, help="UTC offset in winter")
+    provision_cmd.add_argument("--dst-rule", choices=("eu", "us", "none"))
+    provision_cmd.add_argument("--display-mode", choices=("text", "big"))
+    provision_cmd.add_argument(
+        "--alarm",
+        action="append",
+        type=_alarm_arg,
+        help="HH:MM[/mo,tu,...|daily|once][/off]; replaces all alarms",
+    )
+    provision_cmd.add_argument("--no-alarms", action="store_true")
+    provision_cmd.add_argument("--signal", choices=("blink", "fast", "gentle"))
+    status_cmd.add_argument(
+        "--every", type=float, help="repeat every this many seconds"
+    )
+    args = parser.parse_args(argv)
+
+    hosts = list(args.hosts)
+    if args.file:
+        hosts.extend(read_hosts(args.file))
+    if not hosts:
+        parser.error("no hosts given")
+    if args.command == "provision":
+        failed = asyncio.run(_provision_all(args, hosts))
+    else:
+        try:
+            failed = asyncio.run(_status_all(args, hosts))
+        except KeyboardInterrupt:
+            failed = 0
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
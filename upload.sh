@@ -9,9 +9,17 @@ fi
 
 # Configuration
 PORT="$1"
-LOCAL_DIR="./src"    # Local directory with your MicroPython code
+LOCAL_DIR="./build"  # Built from ./src by tools/build_assets.py
 REMOTE_DIR="/pyboard" # Target directory on the MicroPython board
 
+# 0. Build: minify the page and the static assets, and gzip the latter
+echo "--- build output ---"
+python3 tools/build_assets.py $LOCAL_DIR
+if [ $? -ne 0 ]; then
+    echo "--- build failed! Aborting upload. ---"
+    exit 1
+fi
+
 echo "Connecting to $PORT for file synchronization..."
 echo "--- rshell rsync output ---"
 